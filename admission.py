@@ -0,0 +1,285 @@
+"""Admission control for game sessions.
+
+Limits how many sessions each gunicorn worker serves at once, so that existing sessions
+stay responsive when the app gets popular. New sessions past the limit wait in a bounded
+queue, and see a "server busy" board with their place in line and an estimated wait.
+When the queue is full, sessions are rejected right away instead of timing out.
+
+A session is active from the time it is admitted until it has not sent an event for
+`JEOPARDY_SESSION_IDLE_TIMEOUT` seconds, since Mesop does not tell us when a browser tab
+is closed. Active sessions also track whether their game is running, so that games in
+closed tabs stop counting as running games when their session expires.
+
+- `JEOPARDY_MAX_SESSIONS`: Active sessions per worker. Defaults to 80. 0 disables the
+  limit. In websocket mode, each open tab holds a gunicorn thread, so keep this and the
+  queue size below `JEOPARDY_THREADS`.
+- `JEOPARDY_MAX_SESSIONS_PER_KEY`: Active sessions per Google API key. Defaults to 0,
+  which disables the limit. Useful when a shared `GOOGLE_API_KEY` has a small quota.
+- `JEOPARDY_ADMISSION_QUEUE_SIZE`: Sessions that can wait for a slot. Defaults to 20.
+- `JEOPARDY_ADMISSION_MAX_WAIT`: Seconds a session waits before giving up. Defaults
+  to 120.
+- `JEOPARDY_SESSION_IDLE_TIMEOUT`: Defaults to 600 seconds.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Literal, NamedTuple
+
+import metrics
+
+
+_MAX_SESSIONS = int(os.getenv("JEOPARDY_MAX_SESSIONS", "80"))
+_MAX_SESSIONS_PER_KEY = int(os.getenv("JEOPARDY_MAX_SESSIONS_PER_KEY", "0"))
+_QUEUE_SIZE = int(os.getenv("JEOPARDY_ADMISSION_QUEUE_SIZE", "20"))
+_IDLE_TIMEOUT_SECONDS = float(os.getenv("JEOPARDY_SESSION_IDLE_TIMEOUT", "600"))
+MAX_WAIT_SECONDS = float(os.getenv("JEOPARDY_ADMISSION_MAX_WAIT", "120"))
+# How often queued sessions check whether they can be admitted.
+POLL_INTERVAL_SECONDS = 1.0
+# Weight of the latest session in the average session duration.
+_SESSION_DURATION_SMOOTHING = 0.1
+
+AdmissionStatus = Literal["admitted", "queued", "rejected"]
+# Why a session was not admitted. "server" means the worker is at its session limit.
+AdmissionReason = Literal["", "server", "api_key", "timeout"]
+
+
+class Admission(NamedTuple):
+  status: AdmissionStatus
+  reason: AdmissionReason = ""
+  # 1-based place in line of queued sessions.
+  position: int = 0
+  estimated_wait_seconds: float = 0
+
+
+class _Session(NamedTuple):
+  key_hash: str
+  admitted_time: float
+
+
+class AdmissionController:
+  """Tracks active and queued sessions. Safe to use from multiple threads."""
+
+  def __init__(
+    self,
+    max_sessions: int,
+    max_sessions_per_key: int,
+    queue_size: int,
+    idle_timeout_seconds: float,
+    clock: Callable[[], float] = time.monotonic,
+  ):
+    self.max_sessions = max_sessions
+    self.max_sessions_per_key = max_sessions_per_key
+    self.queue_size = queue_size
+    self.idle_timeout_seconds = idle_timeout_seconds
+    self._clock = clock
+    self._lock = threading.Lock()
+    # Session ID -> session, ordered from least to most recently seen.
+    self._active: OrderedDict[str, _Session] = OrderedDict()
+    self._last_seen: dict[str, float] = {}
+    # Active sessions with a running game.
+    self._games: set[str] = set()
+    self._sessions_per_key: dict[str, int] = {}
+    # Session ID -> API key hash, in arrival order.
+    self._queue: OrderedDict[str, str] = OrderedDict()
+    # Sessions last at least the idle timeout, which is a reasonable first estimate.
+    self._mean_session_seconds = idle_timeout_seconds
+
+  def admit(self, session_id: str, api_key: str) -> Admission:
+    """Admits the session if there is room, otherwise queues or rejects it.
+
+    Queued sessions should call this again to check whether they can be admitted, or
+    call `leave_queue` when they give up. Admitted sessions can call this again when
+    the player commits a new API key. The session keeps its place, and does not count as
+    ended, as long as the new key is under its limit.
+    """
+    key_hash = _hash_api_key(api_key)
+    with self._lock:
+      now = self._clock()
+      self._expire(now)
+
+      session = self._active.get(session_id)
+      if session is not None:
+        if session.key_hash == key_hash:
+          self._touch(session_id, now)
+          return Admission("admitted")
+        # The API key changed, so the session needs to fit under the new key's limit.
+        if not self._has_key_room(key_hash):
+          self._remove_active(session_id, now, ended=False)
+          metrics.ADMISSION_REJECTED.inc(reason="api_key")
+          return Admission("rejected", "api_key")
+        self._count_key(session.key_hash, -1)
+        self._count_key(key_hash, 1)
+        self._active[session_id] = session._replace(key_hash=key_hash)
+        self._touch(session_id, now)
+        return Admission("admitted")
+
+      if session_id in self._queue:
+        self._queue[session_id] = key_hash
+      elif self._can_admit_now(key_hash):
+        self._add_active(session_id, _Session(key_hash, now), now)
+        return Admission("admitted")
+      elif len(self._queue) >= self.queue_size:
+        reason = self._blocked_reason(key_hash)
+        metrics.ADMISSION_REJECTED.inc(reason=reason)
+        return Admission("rejected", reason)
+      else:
+        self._queue[session_id] = key_hash
+        metrics.ADMISSION_QUEUED.inc()
+        metrics.ADMISSION_QUEUE_LENGTH.inc()
+
+      # Admit the first queued session that fits. Sessions blocked by their API key limit
+      # do not hold up the others.
+      first_session_id = next(
+        (queued_id for queued_id, queued_key in self._queue.items() if self._has_room(queued_key)),
+        None,
+      )
+      if first_session_id == session_id:
+        self._remove_from_queue(session_id)
+        self._add_active(session_id, _Session(key_hash, now), now)
+        return Admission("admitted")
+
+      position = list(self._queue).index(session_id) + 1
+      reason = self._blocked_reason(key_hash)
+      limit = self.max_sessions_per_key if reason == "api_key" else self.max_sessions
+      return Admission(
+        "queued", reason, position, round(position * self._mean_session_seconds / limit)
+      )
+
+  def touch(self, session_id: str, api_key: str) -> Admission:
+    """Marks an admitted session as still active.
+
+    Sessions that expired while idle are resumed only if they could be admitted right
+    away. Otherwise they are rejected, and have to wait in the queue like new sessions.
+    """
+    with self._lock:
+      now = self._clock()
+      self._expire(now)
+      if session_id in self._active:
+        self._touch(session_id, now)
+        return Admission("admitted")
+      key_hash = _hash_api_key(api_key)
+      if session_id not in self._queue and self._can_admit_now(key_hash):
+        self._add_active(session_id, _Session(key_hash, now), now)
+        return Admission("admitted")
+      reason = self._blocked_reason(key_hash)
+      metrics.ADMISSION_REJECTED.inc(reason=reason)
+      return Admission("rejected", reason)
+
+  def set_game_running(self, session_id: str, running: bool):
+    """Marks whether the game of an active session is running.
+
+    The game stops counting as running when the session ends, even if the player never
+    stopped it.
+    """
+    with self._lock:
+      if running and session_id in self._active and session_id not in self._games:
+        self._games.add(session_id)
+        metrics.ACTIVE_GAMES.inc()
+      elif not running and session_id in self._games:
+        self._games.remove(session_id)
+        metrics.ACTIVE_GAMES.dec()
+
+  def leave_queue(self, session_id: str, reason: str = "timeout"):
+    """Removes a queued session that gave up waiting."""
+    with self._lock:
+      if session_id in self._queue:
+        self._remove_from_queue(session_id)
+        metrics.ADMISSION_REJECTED.inc(reason=reason)
+
+  def _blocked_reason(self, key_hash: str) -> AdmissionReason:
+    if self._has_server_room() and not self._has_key_room(key_hash):
+      return "api_key"
+    return "server"
+
+  def _can_admit_now(self, key_hash: str) -> bool:
+    """Whether a new session fits without going ahead of a queued session that fits."""
+    return self._has_room(key_hash) and not any(map(self._has_room, self._queue.values()))
+
+  def _has_room(self, key_hash: str) -> bool:
+    return self._has_server_room() and self._has_key_room(key_hash)
+
+  def _has_server_room(self) -> bool:
+    return not self.max_sessions or len(self._active) < self.max_sessions
+
+  def _has_key_room(self, key_hash: str) -> bool:
+    return (
+      not self.max_sessions_per_key
+      or not key_hash
+      or self._sessions_per_key.get(key_hash, 0) < self.max_sessions_per_key
+    )
+
+  def _touch(self, session_id: str, now: float):
+    self._last_seen[session_id] = now
+    self._active.move_to_end(session_id)
+
+  def _add_active(self, session_id: str, session: _Session, now: float):
+    self._active[session_id] = session
+    self._last_seen[session_id] = now
+    self._count_key(session.key_hash, 1)
+    metrics.ACTIVE_SESSIONS.inc()
+
+  def _remove_active(self, session_id: str, now: float, ended: bool = True):
+    """Removes an active session. Only sessions that `ended` count toward the mean duration."""
+    session = self._active.pop(session_id)
+    del self._last_seen[session_id]
+    if session_id in self._games:
+      self._games.remove(session_id)
+      metrics.ACTIVE_GAMES.dec()
+    self._count_key(session.key_hash, -1)
+    if ended:
+      self._mean_session_seconds += _SESSION_DURATION_SMOOTHING * (
+        now - session.admitted_time - self._mean_session_seconds
+      )
+    metrics.ACTIVE_SESSIONS.dec()
+
+  def _count_key(self, key_hash: str, delta: int):
+    if not key_hash:
+      return
+    count = self._sessions_per_key.get(key_hash, 0) + delta
+    if count:
+      self._sessions_per_key[key_hash] = count
+    else:
+      del self._sessions_per_key[key_hash]
+
+  def _remove_from_queue(self, session_id: str):
+    del self._queue[session_id]
+    metrics.ADMISSION_QUEUE_LENGTH.dec()
+
+  def _expire(self, now: float):
+    """Ends sessions that have been idle for longer than the idle timeout."""
+    while self._active:
+      session_id = next(iter(self._active))
+      if now - self._last_seen[session_id] < self.idle_timeout_seconds:
+        break
+      self._remove_active(session_id, now)
+
+
+def _hash_api_key(api_key: str) -> str:
+  """Hashes the API key, so keys are not kept in memory longer than needed."""
+  if not api_key:
+    return ""
+  return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+_controller = AdmissionController(
+  _MAX_SESSIONS, _MAX_SESSIONS_PER_KEY, _QUEUE_SIZE, _IDLE_TIMEOUT_SECONDS
+)
+
+
+def admit(session_id: str, api_key: str) -> Admission:
+  return _controller.admit(session_id, api_key)
+
+
+def touch(session_id: str, api_key: str) -> Admission:
+  return _controller.touch(session_id, api_key)
+
+
+def leave_queue(session_id: str, reason: str = "timeout"):
+  _controller.leave_queue(session_id, reason)
+
+
+def set_game_running(session_id: str, running: bool):
+  _controller.set_game_running(session_id, running)
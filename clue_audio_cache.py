@@ -0,0 +1,157 @@
+"""Disk cache of the host's audio for reading clues.
+
+The first time a clue is read in a session that connects through `gemini_live_relay`,
+the relay captures the 24kHz PCM audio of the host's turn after the clue was selected,
+straight from the Gemini Live API. The next time the clue is selected with the same voice
+and model, the cached audio is played right away, and the host is told that the clue was
+already read. Audio is never uploaded by browsers, so players cannot change what other
+players hear.
+
+Only plain readings of a clue are cached. The host is told to read only the clue in
+turns that are captured, turns with tool calls or interruptions are dropped, and audio
+longer than reading the clue's words can take is rejected.
+
+Cache entries are keyed by a hash of the clue text, voice name and model. The PCM audio is
+stored zlib-compressed, and served as is with `Content-Encoding: deflate`, so it is not
+decompressed on the server. When the cache grows past its maximum size, the least
+recently played entries are deleted. Each gunicorn worker tracks the cache size on its
+own, so the size limit is approximate with several workers.
+
+- `JEOPARDY_CLUE_AUDIO_CACHE_DIR`: Enables the cache in this directory.
+- `JEOPARDY_CLUE_AUDIO_CACHE_MAX_MB`: Defaults to 500.
+"""
+
+import hashlib
+import os
+import re
+import secrets
+import threading
+import zlib
+
+import metrics
+
+
+_CACHE_DIR = os.getenv("JEOPARDY_CLUE_AUDIO_CACHE_DIR", "")
+_MAX_BYTES = int(float(os.getenv("JEOPARDY_CLUE_AUDIO_CACHE_MAX_MB", "500")) * 1024 * 1024)
+_ENTRY_SUFFIX = ".pcm.z"
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+_PCM_BYTES_PER_SECOND = 24000 * 2
+# 30 seconds of 24kHz 16-bit mono PCM.
+_MAX_AUDIO_BYTES = _PCM_BYTES_PER_SECOND * 30
+# Generous limits on the time to read a clue, since speech is about 0.4 seconds per word.
+_READING_SECONDS_PER_WORD = 0.6
+_READING_EXTRA_SECONDS = 3
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+class ClueAudioCache:
+  def __init__(self, cache_dir: str, max_bytes: int):
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    self._lock = threading.Lock()
+    os.makedirs(cache_dir, exist_ok=True)
+    self.total_bytes = sum(os.path.getsize(path) for path in self._entry_paths())
+
+  def contains(self, key: str) -> bool:
+    return os.path.exists(self._path(key))
+
+  def read(self, key: str) -> bytes | None:
+    """Returns the zlib-compressed PCM audio, or None if it is not cached."""
+    path = self._path(key)
+    try:
+      with open(path, "rb") as f:
+        data = f.read()
+    except FileNotFoundError:
+      return None
+    # The modification time is used to find the least recently played entries.
+    os.utime(path)
+    return data
+
+  def put(self, key: str, pcm: bytes):
+    """Stores PCM audio. The first audio stored for a key is kept."""
+    path = self._path(key)
+    if os.path.exists(path):
+      return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{secrets.token_hex(4)}.tmp"
+    with open(temp_path, "wb") as f:
+      f.write(zlib.compress(pcm))
+    os.replace(temp_path, path)
+    with self._lock:
+      self.total_bytes += os.path.getsize(path)
+      if self.total_bytes > self.max_bytes:
+        self._evict()
+
+  def _evict(self):
+    """Deletes the least recently played entries until the cache is 90% full."""
+    entries = sorted(
+      (os.path.getmtime(path), os.path.getsize(path), path) for path in self._entry_paths()
+    )
+    for _, size, path in entries:
+      if self.total_bytes <= self.max_bytes * 0.9:
+        break
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        # Evicted by another worker.
+        pass
+      self.total_bytes -= size
+
+  def _path(self, key: str) -> str:
+    return os.path.join(self.cache_dir, key[:2], key + _ENTRY_SUFFIX)
+
+  def _entry_paths(self) -> list[str]:
+    return [
+      os.path.join(directory, file_name)
+      for directory, _, file_names in os.walk(self.cache_dir)
+      for file_name in file_names
+      if file_name.endswith(_ENTRY_SUFFIX)
+    ]
+
+
+def make_key(clue_text: str, voice_name: str, model: str) -> str:
+  data = "\0".join([clue_text, voice_name, model])
+  return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def is_valid_key(key: str) -> bool:
+  return bool(_KEY_PATTERN.match(key))
+
+
+_cache = ClueAudioCache(_CACHE_DIR, _MAX_BYTES) if _CACHE_DIR else None
+
+
+def is_enabled() -> bool:
+  return _cache is not None
+
+
+def lookup(key: str) -> bool:
+  """Returns whether audio for the key is cached, and counts the lookup."""
+  hit = _cache.contains(key)
+  metrics.CLUE_AUDIO_CACHE_LOOKUPS.inc(result="hit" if hit else "miss")
+  return hit
+
+
+def read(key: str) -> bytes | None:
+  return _cache.read(key)
+
+
+def max_reading_bytes(clue_text: str) -> int:
+  """Size of the longest PCM audio accepted as a reading of the clue."""
+  num_words = len(_WORD_PATTERN.findall(clue_text))
+  seconds = _READING_EXTRA_SECONDS + num_words * _READING_SECONDS_PER_WORD
+  return min(int(seconds * _PCM_BYTES_PER_SECOND) // 2 * 2, _MAX_AUDIO_BYTES)
+
+
+def store(key: str, clue_text: str, pcm: bytes) -> bool:
+  """Stores captured audio of the host reading the clue.
+
+  Returns:
+    False if the audio is longer than reading the clue can take, so it is not stored.
+  """
+  if not pcm or len(pcm) % 2 or len(pcm) > max_reading_bytes(clue_text):
+    metrics.CLUE_AUDIO_CAPTURES.inc(result="rejected")
+    return False
+  _cache.put(key, pcm)
+  metrics.CLUE_AUDIO_CAPTURES.inc(result="stored")
+  return True
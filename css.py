@@ -1,5 +1,6 @@
 import mesop as me
 
+import gemini_live_relay
 from state import State
 
 COLOR_BLUE = "blue"
@@ -43,7 +44,7 @@ def sidebar_header() -> me.Style:
 
 def game_button() -> me.Style:
   state = me.state(State)
-  if not state.api_key:
+  if not gemini_live_relay.session_api_key(state.api_key):
     return me.Style()
   if state.gemini_live_api_enabled:
     return me.Style(background=me.theme_var("error"), color=me.theme_var("on-error"))
@@ -89,20 +90,18 @@ def current_clue_box() -> me.Style:
   )
 
 
-def board_col_grid() -> me.Style:
-  state = me.state(State)
+def _board_col_grid(enabled: bool) -> me.Style:
   return me.Style(
-    background="#000" if state.gemini_live_api_enabled else "#ddd",
+    background="#000" if enabled else "#ddd",
     display="grid",
     gap="5px",
     grid_template_columns="repeat(6, 1fr)",
   )
 
 
-def category_box() -> me.Style:
-  state = me.state(State)
+def _category_box(enabled: bool) -> me.Style:
   return me.Style(
-    background=COLOR_BLUE if state.gemini_live_api_enabled else COLOR_DISABLED,
+    background=COLOR_BLUE if enabled else COLOR_DISABLED,
     color="white",
     font_weight="bold",
     font_size="1em",
@@ -111,15 +110,9 @@ def category_box() -> me.Style:
   )
 
 
-def clue_box(is_selectable: bool) -> me.Style:
-  """Style for clue box
-
-  Args:
-    is_selectable: Visual signify if the clue is selectable.
-  """
-  state = me.state(State)
+def _clue_box(enabled: bool, is_selectable: bool) -> me.Style:
   return me.Style(
-    background=COLOR_BLUE if state.gemini_live_api_enabled else COLOR_DISABLED,
+    background=COLOR_BLUE if enabled else COLOR_DISABLED,
     color=COLOR_YELLOW,
     cursor="pointer" if is_selectable else "default",
     font_size="1em",
@@ -129,6 +122,54 @@ def clue_box(is_selectable: bool) -> me.Style:
   )
 
 
+# The board styles only depend on a few flags, so they are created once instead of for
+# every cell on every render. Mesop only reads the styles, so they can be shared.
+_BOARD_COL_GRIDS = {enabled: _board_col_grid(enabled) for enabled in (True, False)}
+_CATEGORY_BOXES = {enabled: _category_box(enabled) for enabled in (True, False)}
+_CLUE_BOXES = {
+  (enabled, is_selectable): _clue_box(enabled, is_selectable)
+  for enabled in (True, False)
+  for is_selectable in (True, False)
+}
+
+CLUE_TEXT = me.Style(text_align="left")
+CLUE_VALUE_TEXT = me.Style(font_size="2.2vw")
+
+BUSY_BOARD = me.Style(
+  align_items="center",
+  background=COLOR_BLUE,
+  color="white",
+  display="flex",
+  flex_direction="column",
+  gap="20px",
+  justify_content="center",
+  padding=me.Padding.all(40),
+  text_align="center",
+)
+BUSY_BOARD_HEADER = me.Style(color=COLOR_YELLOW, font_weight="bold")
+BUSY_BOARD_BUTTON = me.Style(background=COLOR_YELLOW, color="#000")
+
+ROOM_PLAYER_ROW = me.Style(display="flex", justify_content="space-between")
+
+
+def board_col_grid(enabled: bool) -> me.Style:
+  return _BOARD_COL_GRIDS[enabled]
+
+
+def category_box(enabled: bool) -> me.Style:
+  return _CATEGORY_BOXES[enabled]
+
+
+def clue_box(enabled: bool, is_selectable: bool) -> me.Style:
+  """Style for clue box
+
+  Args:
+    enabled: Whether the game is running.
+    is_selectable: Visual signify if the clue is selectable.
+  """
+  return _CLUE_BOXES[(enabled, is_selectable)]
+
+
 def response_button(disabled: bool) -> me.Style:
   """Styles for response submit button.
 
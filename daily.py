@@ -0,0 +1,83 @@
+"""Board of the day.
+
+Everyone who plays the daily board on a given day gets the same six question sets, which
+are picked by a random generator seeded with the date (UTC). The board and the Gemini
+Live API setup messages for it are made once per day in each worker and shared by all
+sessions, so loading the daily board does not sample the question bank or format the
+clues again.
+
+Until the full question bank has loaded, the daily board is picked from the fallback
+bank and is not cached. The daily board only changes with the question bank when the
+date changes or the worker restarts, so reloading the dataset during the day does not
+change it.
+"""
+
+import datetime
+import random
+import threading
+from typing import Callable, NamedTuple
+
+import question_bank_loader
+from models import Board
+
+
+_NUM_CATEGORIES = 6
+
+_lock = threading.Lock()
+_daily_board: "DailyBoard | None" = None
+
+
+class DailyBoard(NamedTuple):
+  date: str
+  board: Board
+  # Setup messages for the host, by whether the host responds with text only.
+  gemini_live_api_configs: dict[bool, str]
+
+
+def today() -> str:
+  return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+
+def get(make_config: Callable[..., str]) -> DailyBoard:
+  """Gets today's board, making it first if needed.
+
+  Args:
+    make_config: Makes the setup message for a board. Called as
+      `make_config(board, text_only=...)`, with whether the host responds with text only.
+  """
+  global _daily_board
+  date = today()
+  daily_board = _daily_board
+  if daily_board is not None and daily_board.date == date:
+    return daily_board
+
+  with _lock:
+    # Another session may have made it while this one waited.
+    if _daily_board is not None and _daily_board.date == date:
+      return _daily_board
+    is_ready = question_bank_loader.is_ready()
+    board = make_board(question_bank_loader.current(), date)
+    daily_board = DailyBoard(
+      date=date,
+      board=board,
+      gemini_live_api_configs={
+        text_only: make_config(board, text_only=text_only) for text_only in (False, True)
+      },
+    )
+    if is_ready:
+      _daily_board = daily_board
+    return daily_board
+
+
+def find_config(board: Board, text_only: bool) -> str | None:
+  """Gets the setup message made for the board if it is today's board."""
+  daily_board = _daily_board
+  if daily_board is None or daily_board.board is not board:
+    return None
+  return daily_board.gemini_live_api_configs[text_only]
+
+
+def make_board(bank, date: str) -> Board:
+  """Picks the question sets for the date."""
+  set_ids = random.Random(f"daily-board-{date}").sample(range(len(bank)), _NUM_CATEGORIES)
+  return Board(clues=[bank.get(set_id) for set_id in set_ids], set_ids=set_ids)
@@ -0,0 +1,228 @@
+"""Snapshots of single player games in progress, so they can be resumed.
+
+Snapshots are enabled by setting `JEOPARDY_SNAPSHOT_DB_PATH`. When a game starts, it gets
+a resume token, which is added to the page URL (`?resume=<token>`). If the worker
+restarts or the connection drops, reloading the page resumes the game from its latest
+snapshot, on any worker that shares the database.
+
+A snapshot is a few dozen bytes: the question set IDs of the board, a bitmask of the
+answered clues, the score and the round. The board is rebuilt from the question bank
+when the game is resumed, and resuming fails if the question bank changed since.
+
+Saving a snapshot never waits for the database. The latest snapshot of each game is kept
+in memory and written by a background thread in batches, like `score_store`. Snapshots
+that were not updated for `_MAX_AGE_SECONDS` are deleted.
+
+- `JEOPARDY_SNAPSHOT_DB_PATH`: Enables snapshots with the SQLite database at this path.
+- `JEOPARDY_SNAPSHOT_FLUSH_INTERVAL`: Seconds between batches (default 1).
+"""
+
+import atexit
+import logging
+import os
+import re
+import secrets
+import sqlite3
+import struct
+import threading
+import time
+from typing import NamedTuple
+
+
+logger = logging.getLogger(__name__)
+
+_DB_PATH = os.getenv("JEOPARDY_SNAPSHOT_DB_PATH", "")
+_FLUSH_INTERVAL_SECONDS = float(os.getenv("JEOPARDY_SNAPSHOT_FLUSH_INTERVAL", "1"))
+_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+_CLEANUP_INTERVAL_SECONDS = 60 * 60
+_TOKEN_PATTERN = re.compile(r"^[A-Za-z0-9_-]{22}$")
+
+_FORMAT_VERSION = 1
+# Version, round index, score, answered clues bitmask, number of question sets, game ID and
+# board ID.
+_HEADER = struct.Struct("<BBiQB16s8s")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+  token TEXT PRIMARY KEY,
+  data BLOB NOT NULL,
+  updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_by_updated_at ON snapshots (updated_at);
+"""
+
+
+class GameSnapshot(NamedTuple):
+  game_id: str
+  board_id: str
+  set_ids: list[int]
+  round_index: int
+  # Bit `category_index * clues_per_category + dollar_index` is set for answered clues.
+  answered: int
+  score: int
+  daily_date: str = ""
+  player_name: str = ""
+
+
+def encode(snapshot: GameSnapshot) -> bytes:
+  header = _HEADER.pack(
+    _FORMAT_VERSION,
+    snapshot.round_index,
+    snapshot.score,
+    snapshot.answered,
+    len(snapshot.set_ids),
+    bytes.fromhex(snapshot.game_id),
+    bytes.fromhex(snapshot.board_id),
+  )
+  set_ids = struct.pack(f"<{len(snapshot.set_ids)}I", *snapshot.set_ids)
+  return header + set_ids + _encode_str(snapshot.daily_date) + _encode_str(snapshot.player_name)
+
+
+def decode(data: bytes) -> GameSnapshot:
+  version, round_index, score, answered, num_sets, game_id, board_id = _HEADER.unpack_from(data)
+  if version != _FORMAT_VERSION:
+    raise ValueError(f"Unsupported snapshot version: {version}")
+  offset = _HEADER.size
+  set_ids = list(struct.unpack_from(f"<{num_sets}I", data, offset))
+  offset += num_sets * 4
+  daily_date, offset = _decode_str(data, offset)
+  player_name, offset = _decode_str(data, offset)
+  return GameSnapshot(
+    game_id=game_id.hex(),
+    board_id=board_id.hex(),
+    set_ids=set_ids,
+    round_index=round_index,
+    answered=answered,
+    score=score,
+    daily_date=daily_date,
+    player_name=player_name,
+  )
+
+
+def _encode_str(value: str) -> bytes:
+  data = value.encode("utf-8")[:255]
+  return struct.pack("<B", len(data)) + data
+
+
+def _decode_str(data: bytes, offset: int) -> tuple[str, int]:
+  (length,) = struct.unpack_from("<B", data, offset)
+  offset += 1
+  return data[offset : offset + length].decode("utf-8"), offset + length
+
+
+class SnapshotStore:
+  def __init__(self, db_path: str, flush_interval_seconds: float = _FLUSH_INTERVAL_SECONDS):
+    self.db_path = db_path
+    self.flush_interval_seconds = flush_interval_seconds
+    self._lock = threading.Lock()
+    # Token -> encoded snapshot not written yet, and the batch being written.
+    self._pending: dict[str, bytes] = {}
+    self._writing: dict[str, bytes] = {}
+    self._db_lock = threading.Lock()
+    self._stopped = threading.Event()
+    self._last_cleanup = 0.0
+
+    directory = os.path.dirname(db_path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self._connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+    self._connection.execute("PRAGMA journal_mode=WAL")
+    self._connection.execute("PRAGMA synchronous=NORMAL")
+    self._connection.execute("PRAGMA busy_timeout=5000")
+    self._connection.executescript(_SCHEMA)
+    self._writer = threading.Thread(target=self._write_loop, name="game-snapshots", daemon=True)
+    self._writer.start()
+
+  def save(self, token: str, snapshot: GameSnapshot):
+    """Saves the latest snapshot of a game. Never waits for the database."""
+    data = encode(snapshot)
+    with self._lock:
+      self._pending[token] = data
+
+  def load(self, token: str) -> GameSnapshot | None:
+    with self._lock:
+      data = self._pending.get(token) or self._writing.get(token)
+    if data is None:
+      with self._db_lock:
+        row = self._connection.execute(
+          "SELECT data FROM snapshots WHERE token = ?", (token,)
+        ).fetchone()
+      data = row[0] if row is not None else None
+    if data is None:
+      return None
+    try:
+      return decode(data)
+    except (ValueError, struct.error):
+      logger.exception("Failed to decode snapshot")
+      return None
+
+  def close(self):
+    """Writes the pending snapshots and stops the writer thread."""
+    self._stopped.set()
+    self._writer.join()
+
+  def _write_loop(self):
+    while not self._stopped.is_set():
+      self._stopped.wait(self.flush_interval_seconds)
+      self._flush()
+
+  def _flush(self):
+    with self._lock:
+      self._writing, self._pending = self._pending, {}
+      pending = self._writing
+    now = time.time()
+    if not pending and now - self._last_cleanup < _CLEANUP_INTERVAL_SECONDS:
+      return
+    try:
+      with self._db_lock, self._connection:
+        self._connection.execute("BEGIN")
+        self._connection.executemany(
+          "INSERT OR REPLACE INTO snapshots (token, data, updated_at) VALUES (?, ?, ?)",
+          [(token, data, now) for token, data in pending.items()],
+        )
+        if now - self._last_cleanup > _CLEANUP_INTERVAL_SECONDS:
+          self._connection.execute(
+            "DELETE FROM snapshots WHERE updated_at < ?", (now - _MAX_AGE_SECONDS,)
+          )
+          self._last_cleanup = now
+    except sqlite3.Error:
+      logger.exception("Failed to write %d snapshots", len(pending))
+    finally:
+      with self._lock:
+        self._writing = {}
+
+
+def make_token() -> str:
+  return secrets.token_urlsafe(16)
+
+
+def is_valid_token(token: str) -> bool:
+  return bool(_TOKEN_PATTERN.match(token))
+
+
+_store: SnapshotStore | None = None
+_store_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+  return bool(_DB_PATH)
+
+
+def get() -> SnapshotStore:
+  """Gets the snapshot store, opening it on first use."""
+  global _store
+  with _store_lock:
+    if _store is None:
+      _store = SnapshotStore(_DB_PATH)
+      atexit.register(_store.close)
+    return _store
+
+
+def save(token: str, snapshot: GameSnapshot):
+  get().save(token, snapshot)
+
+
+def load(token: str) -> GameSnapshot | None:
+  if not is_valid_token(token):
+    return None
+  return get().load(token)
@@ -0,0 +1,554 @@
+"""Relays Gemini Live API sessions through the app server.
+
+By default the browser connects straight to the Gemini Live API with the API key in the
+websocket URL, and pays for the TLS, websocket and setup handshakes after Start is
+clicked. With the relay enabled, the browser connects to the relay with a ticket instead,
+and the relay bridges it to an upstream connection that was opened ahead of time:
+
+- Each API key in use has a small pool of upstream connections that are already
+  connected.
+- When a session is prepared, the relay takes a pooled connection and sends the
+  session's setup message right away. When the browser then sends the same setup
+  message, the relay answers with the stored setup response, so the session is ready as
+  soon as the browser connects.
+
+Frames are forwarded as they are, without decoding or re-encoding them. The only
+exception is the host's turn after a tool response when its audio is captured (see
+`capture_turn_audio`), whose upstream frames are also decoded to collect the audio.
+
+The relay is an asyncio server on a background thread of the worker. Only one worker can
+listen on the relay port, so browsers served by other workers connect to the Gemini Live
+API directly.
+
+The relay is started when the worker starts (see `start`). In the worker that runs it,
+the server's `GOOGLE_API_KEY` is never sent to browsers, and sessions that do not enter
+their own key use it through the relay. Other workers serve pages as without the relay.
+
+- `JEOPARDY_RELAY_PORT`: Enables the relay on this port.
+- `JEOPARDY_RELAY_URL`: URL browsers use to reach the relay. Defaults to
+  `ws://localhost:<port>`.
+- `JEOPARDY_RELAY_POOL_SIZE`: Connected upstream connections to keep per API key.
+  Defaults to 2.
+- `JEOPARDY_RELAY_PREPARE_SETUP`: Whether to set up sessions before Start is clicked.
+  Defaults to true. Each prepared session holds a Gemini Live API session open until it
+  is used or expires.
+- `JEOPARDY_RELAY_MAX_IDLE`: Seconds before unused pooled connections and prepared
+  sessions are closed. Defaults to 60.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, NamedTuple
+
+from websockets.asyncio.client import ClientConnection, connect
+from websockets.asyncio.server import ServerConnection, serve
+from websockets.exceptions import WebSocketException
+from websockets.protocol import State as ConnectionState
+
+import metrics
+from web_components.gemini_live_connection import gemini_live_endpoint
+
+
+logger = logging.getLogger(__name__)
+
+_HOST = "0.0.0.0"
+_PORT = int(os.getenv("JEOPARDY_RELAY_PORT", "0"))
+_URL = os.getenv("JEOPARDY_RELAY_URL", f"ws://localhost:{_PORT}")
+_POOL_SIZE = int(os.getenv("JEOPARDY_RELAY_POOL_SIZE", "2"))
+_PREPARE_SETUP = os.getenv("JEOPARDY_RELAY_PREPARE_SETUP", "true").lower() == "true"
+_MAX_IDLE_SECONDS = float(os.getenv("JEOPARDY_RELAY_MAX_IDLE", "60"))
+# Used by sessions that do not enter their own API key.
+_SERVER_API_KEY = os.getenv("GOOGLE_API_KEY", "")
+# Sessions are prepared after their API key and setup message stop changing for this
+# long, so a key that is still being typed does not open upstream connections.
+_PREPARE_DELAY_SECONDS = 1.0
+_CONNECT_TIMEOUT_SECONDS = 10
+_SETUP_TIMEOUT_SECONDS = 10
+_MAINTENANCE_INTERVAL_SECONDS = 5
+_MAX_TICKETS = 10000
+_START_TIMEOUT_SECONDS = 5
+
+_CONNECT_ERRORS = (OSError, TimeoutError, WebSocketException)
+
+
+class _PooledConnection(NamedTuple):
+  connection: ClientConnection
+  connected_time: float
+
+
+class UpstreamPool:
+  """Upstream connections for one API key that are connected but not set up yet."""
+
+  def __init__(self, endpoint: str, size: int, max_idle_seconds: float):
+    self.endpoint = endpoint
+    self.size = size
+    self.max_idle_seconds = max_idle_seconds
+    self.last_used_time = time.monotonic()
+    self._idle: list[_PooledConnection] = []
+    self._num_connecting = 0
+    self._closed = False
+
+  async def get(self) -> tuple[ClientConnection, bool]:
+    """Returns an open connection, and whether it came from the pool."""
+    self.last_used_time = time.monotonic()
+    try:
+      while self._idle:
+        pooled = self._idle.pop()
+        metrics.RELAY_POOLED_CONNECTIONS.dec()
+        if pooled.connection.state is ConnectionState.OPEN:
+          return pooled.connection, True
+        _spawn(pooled.connection.close())
+    finally:
+      self.fill()
+    return await _connect(self.endpoint), False
+
+  def fill(self):
+    """Opens connections in the background until the pool is full."""
+    for _ in range(self.size - len(self._idle) - self._num_connecting):
+      self._num_connecting += 1
+      _spawn(self._add())
+
+  def expire(self, now: float):
+    """Closes connections that were idle for too long or were closed upstream."""
+    idle = []
+    for pooled in self._idle:
+      if (
+        pooled.connection.state is ConnectionState.OPEN
+        and now - pooled.connected_time < self.max_idle_seconds
+      ):
+        idle.append(pooled)
+      else:
+        metrics.RELAY_POOLED_CONNECTIONS.dec()
+        _spawn(pooled.connection.close())
+    self._idle = idle
+
+  def close(self):
+    self._closed = True
+    self.expire(float("inf"))
+
+  async def _add(self):
+    try:
+      connection = await _connect(self.endpoint)
+    except _CONNECT_ERRORS as e:
+      logger.warning("Failed to open pooled Gemini Live API connection: %s", e)
+      return
+    finally:
+      self._num_connecting -= 1
+    if self._closed:
+      await connection.close()
+      return
+    self._idle.append(_PooledConnection(connection, time.monotonic()))
+    metrics.RELAY_POOLED_CONNECTIONS.inc()
+
+
+@dataclass
+class _Ticket:
+  api_key: str
+  setup: bytes
+  # Resolves to a connection that was set up with `setup`, and the setup response.
+  prepared: asyncio.Task | None = None
+  prepared_time: float = 0
+  # Whether the prepared session got past the prepare delay.
+  setup_started: bool = False
+  # Called with the audio of the host's turn after the next tool response.
+  on_turn_audio: Callable[[bytes], None] | None = None
+
+  def discard_prepared(self):
+    prepared, self.prepared = self.prepared, None
+    if prepared is None:
+      return
+    if not prepared.done():
+      prepared.cancel()
+    elif not prepared.cancelled() and prepared.exception() is None:
+      _spawn(prepared.result()[0].close())
+
+
+class GeminiLiveRelay:
+  """Bridges browser websockets to upstream Gemini Live API connections.
+
+  Runs on one event loop. `prepare` is the only method that is safe to call from other
+  threads.
+  """
+
+  def __init__(
+    self,
+    make_endpoint: Callable[[str], str] = gemini_live_endpoint,
+    pool_size: int = _POOL_SIZE,
+    prepare_setup: bool = _PREPARE_SETUP,
+    max_idle_seconds: float = _MAX_IDLE_SECONDS,
+    default_api_key: str = "",
+  ):
+    self.make_endpoint = make_endpoint
+    self.pool_size = pool_size
+    self.prepare_setup = prepare_setup
+    self.max_idle_seconds = max_idle_seconds
+    self.default_api_key = default_api_key
+    self.loop: asyncio.AbstractEventLoop | None = None
+    self._server = None
+    self._maintenance: asyncio.Task | None = None
+    # API key hash -> pool.
+    self._pools: dict[str, UpstreamPool] = {}
+    # Ticket -> ticket, from least to most recently used.
+    self._tickets: OrderedDict[str, _Ticket] = OrderedDict()
+
+  async def start(self, host: str, port: int):
+    """Starts listening for browsers. Returns the websockets server."""
+    self.loop = asyncio.get_running_loop()
+    self._server = await serve(self._handle, host, port, compression=None, max_size=None)
+    self._maintenance = _spawn(self._maintain())
+    if self.default_api_key:
+      self._pool(self.default_api_key).fill()
+    return self._server
+
+  async def close(self):
+    """Stops listening and closes idle connections and prepared sessions."""
+    self._maintenance.cancel()
+    for pool in self._pools.values():
+      pool.close()
+    for ticket in self._tickets.values():
+      ticket.discard_prepared()
+    self._server.close()
+    await self._server.wait_closed()
+
+  def prepare(self, api_key: str, api_config: str, ticket: str = "") -> str:
+    """Registers a session's API key and setup message.
+
+    If setup preparation is enabled, a session is set up upstream in the background.
+
+    Args:
+      api_key: Google API key of the session.
+      api_config: Setup message the browser will send.
+      ticket: Ticket from an earlier call for the same browser session, if any.
+
+    Returns:
+      The ticket the browser connects with.
+    """
+    ticket = ticket or secrets.token_urlsafe(24)
+    self.loop.call_soon_threadsafe(self._prepare, ticket, api_key, api_config.encode())
+    return ticket
+
+  def capture_turn_audio(self, ticket: str, on_audio: Callable[[bytes], None]):
+    """Captures the audio of the host's turn after the browser's next tool response.
+
+    `on_audio` is called on another thread with the 24kHz PCM audio if the turn completes
+    without being interrupted and without tool calls.
+    """
+    self.loop.call_soon_threadsafe(self._capture_turn_audio, ticket, on_audio)
+
+  def _capture_turn_audio(self, ticket_id: str, on_audio: Callable[[bytes], None]):
+    ticket = self._tickets.get(ticket_id)
+    if ticket is not None:
+      ticket.on_turn_audio = on_audio
+
+  def _prepare(self, ticket_id: str, api_key: str, setup: bytes):
+    ticket = self._tickets.pop(ticket_id, None)
+    if ticket is None or ticket.api_key != api_key or ticket.setup != setup:
+      if ticket is not None:
+        ticket.discard_prepared()
+      ticket = _Ticket(api_key, setup)
+      if self.prepare_setup and api_key:
+        ticket.prepared = _spawn(self._set_up(ticket))
+        ticket.prepared_time = time.monotonic()
+    self._tickets[ticket_id] = ticket
+    while len(self._tickets) > _MAX_TICKETS:
+      self._tickets.popitem(last=False)[1].discard_prepared()
+
+  async def _set_up(self, ticket: _Ticket) -> tuple[ClientConnection, bytes]:
+    await asyncio.sleep(_PREPARE_DELAY_SECONDS)
+    ticket.setup_started = True
+    connection, _ = await self._pool(ticket.api_key).get()
+    try:
+      await connection.send(ticket.setup, text=True)
+      response = await asyncio.wait_for(connection.recv(decode=False), _SETUP_TIMEOUT_SECONDS)
+    except BaseException:
+      _spawn(connection.close())
+      raise
+    return connection, response
+
+  async def _handle(self, client: ServerConnection):
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(client.request.path).query)
+    ticket_id = query.get("ticket", [""])[0]
+    ticket = self._tickets.get(ticket_id)
+    if ticket is None:
+      await client.close(1008, "Unknown ticket")
+      return
+    self._tickets.move_to_end(ticket_id)
+
+    setup = await client.recv(decode=False)
+    try:
+      upstream, setup_response, source = await self._get_upstream(ticket, setup)
+    except _CONNECT_ERRORS as e:
+      logger.warning("Failed to connect to the Gemini Live API: %s", e)
+      await client.close(1011, "Failed to connect to the Gemini Live API")
+      return
+
+    metrics.RELAY_SESSIONS.inc(upstream=source)
+    metrics.RELAY_ACTIVE_SESSIONS.inc()
+    try:
+      if setup_response is not None:
+        await client.send(setup_response)
+      await _bridge(client, upstream, ticket)
+    finally:
+      metrics.RELAY_ACTIVE_SESSIONS.dec()
+      await upstream.close()
+
+  async def _get_upstream(
+    self, ticket: _Ticket, setup: bytes
+  ) -> tuple[ClientConnection, bytes | None, str]:
+    """Returns an upstream connection, its setup response if it was prepared, and
+    whether it was "prepared", "pooled" or "new"."""
+    prepared = ticket.prepared
+    if prepared is not None and setup == ticket.setup and (prepared.done() or ticket.setup_started):
+      ticket.prepared = None
+      try:
+        connection, setup_response = await prepared
+        if connection.state is ConnectionState.OPEN:
+          return connection, setup_response, "prepared"
+        _spawn(connection.close())
+      except _CONNECT_ERRORS as e:
+        logger.warning("Failed to prepare Gemini Live API session: %s", e)
+    ticket.discard_prepared()
+
+    connection, pooled = await self._pool(ticket.api_key).get()
+    await connection.send(setup, text=True)
+    return connection, None, "pooled" if pooled else "new"
+
+  def _pool(self, api_key: str) -> UpstreamPool:
+    key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    pool = self._pools.get(key_hash)
+    if pool is None:
+      pool = self._pools[key_hash] = UpstreamPool(
+        self.make_endpoint(api_key), self.pool_size, self.max_idle_seconds
+      )
+    return pool
+
+  async def _maintain(self):
+    """Expires idle connections and prepared sessions, and refills the pools."""
+    default_key_hash = hashlib.sha256(self.default_api_key.encode("utf-8")).hexdigest()
+    while True:
+      await asyncio.sleep(_MAINTENANCE_INTERVAL_SECONDS)
+      now = time.monotonic()
+      for key_hash, pool in list(self._pools.items()):
+        pool.expire(now)
+        if key_hash == default_key_hash or now - pool.last_used_time < pool.max_idle_seconds:
+          pool.fill()
+        else:
+          pool.close()
+          del self._pools[key_hash]
+      for ticket in self._tickets.values():
+        if ticket.prepared is not None and now - ticket.prepared_time > self.max_idle_seconds:
+          ticket.discard_prepared()
+
+
+async def _bridge(client: ServerConnection, upstream: ClientConnection, ticket: _Ticket):
+  """Forwards frames both ways until either side closes.
+
+  Frames are passed through as bytes. Browser messages are JSON, so they are sent
+  upstream as text frames, while upstream messages are sent to the browser as binary
+  frames, which the web component reads as blobs.
+  """
+  capture: _TurnAudioCapture | None = None
+
+  async def forward_client():
+    nonlocal capture
+    async for message in _iter_bytes(client):
+      if ticket.on_turn_audio is not None and b'"tool_response"' in message:
+        capture = _TurnAudioCapture(ticket.on_turn_audio)
+        ticket.on_turn_audio = None
+      await upstream.send(message, text=True)
+
+  async def forward_upstream():
+    nonlocal capture
+    async for message in _iter_bytes(upstream):
+      await client.send(message, text=False)
+      if capture is not None and not capture.add(message):
+        capture = None
+
+  tasks = [
+    asyncio.create_task(forward_client()),
+    asyncio.create_task(forward_upstream()),
+  ]
+  try:
+    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+  finally:
+    for task in tasks:
+      task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await client.close()
+
+
+class _TurnAudioCapture:
+  """Collects the audio of a host turn from upstream messages."""
+
+  def __init__(self, on_audio: Callable[[bytes], None]):
+    self.on_audio = on_audio
+    self.chunks: list[bytes] = []
+
+  def add(self, message: bytes) -> bool:
+    """Adds an upstream message. Returns whether the turn is still going."""
+    try:
+      response = json.loads(message)
+    except ValueError:
+      return False
+    if "toolCall" in response:
+      # The host did more than read the clue in this turn.
+      return False
+    content = response.get("serverContent")
+    if content is None:
+      return True
+    if content.get("interrupted"):
+      return False
+    for part in (content.get("modelTurn") or {}).get("parts", []):
+      data = (part.get("inlineData") or {}).get("data")
+      if data:
+        self.chunks.append(base64.b64decode(data))
+    if content.get("turnComplete"):
+      if self.chunks:
+        _spawn(asyncio.to_thread(self._finish, b"".join(self.chunks)))
+      return False
+    return True
+
+  def _finish(self, pcm: bytes):
+    try:
+      self.on_audio(pcm)
+    except Exception:
+      logger.exception("Failed to handle the captured audio of a turn")
+
+
+async def _iter_bytes(connection):
+  """Yields messages as bytes until the connection closes."""
+  while True:
+    try:
+      yield await connection.recv(decode=False)
+    except WebSocketException:
+      return
+
+
+async def _connect(endpoint: str) -> ClientConnection:
+  return await connect(endpoint, open_timeout=_CONNECT_TIMEOUT_SECONDS, max_size=None)
+
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _spawn(coroutine) -> asyncio.Task:
+  """Runs a coroutine in the background, keeping a reference until it is done."""
+  task = asyncio.get_running_loop().create_task(coroutine)
+  _background_tasks.add(task)
+  task.add_done_callback(_background_tasks.discard)
+  return task
+
+
+_relay: GeminiLiveRelay | None = None
+_relay_lock = threading.Lock()
+_start_attempted = False
+
+
+def start() -> bool:
+  """Starts the relay in this worker if it is configured and the port is free.
+
+  Called when the worker starts, since only one worker can listen on the relay port and
+  pages need to know whether their worker runs it. Does nothing after the first call.
+
+  Returns:
+    Whether the relay is running in this worker.
+  """
+  global _relay, _start_attempted
+  with _relay_lock:
+    if _start_attempted or not _PORT:
+      return _relay is not None
+    _start_attempted = True
+    relay = GeminiLiveRelay(default_api_key=_SERVER_API_KEY)
+    started = threading.Event()
+    errors = []
+
+    async def run():
+      try:
+        await relay.start(_HOST, _PORT)
+      except OSError as e:
+        errors.append(e)
+        return
+      finally:
+        started.set()
+      await asyncio.get_running_loop().create_future()
+
+    threading.Thread(target=asyncio.run, args=(run(),), daemon=True).start()
+    if not started.wait(_START_TIMEOUT_SECONDS) or errors:
+      # Another worker is probably listening on the port already.
+      logger.warning("Gemini Live API relay is not running in this worker: %s", errors)
+      return False
+    _relay = relay
+    return True
+
+
+def is_enabled() -> bool:
+  """Whether the relay is running in this worker. See `start`."""
+  return _relay is not None
+
+
+def default_api_key() -> str:
+  """API key pages start with.
+
+  Browsers need the key to connect to the Gemini Live API directly, so this is the
+  server's `GOOGLE_API_KEY` unless the relay runs in this worker and keeps it on the
+  server.
+  """
+  return "" if is_enabled() else _SERVER_API_KEY
+
+
+def session_api_key(api_key: str) -> str:
+  """API key a session connects with.
+
+  Args:
+    api_key: Key entered in the page. If empty, the server's key is used when the relay
+      is running in this worker.
+  """
+  return api_key or (_SERVER_API_KEY if is_enabled() else "")
+
+
+def connect_srcs() -> list[str]:
+  """Origins of the relay for the page security policy."""
+  if not _PORT:
+    return []
+  url = urllib.parse.urlsplit(_URL)
+  return [f"{url.scheme}://{url.netloc}"]
+
+
+def endpoint(ticket: str) -> str:
+  """URL the browser connects to the relay with. Empty if there is no ticket."""
+  if not ticket:
+    return ""
+  return f"{_URL}?{urllib.parse.urlencode({'ticket': ticket})}"
+
+
+def capture_turn_audio(ticket: str, on_audio: Callable[[bytes], None]) -> bool:
+  """Captures the host's audio in a session. See `GeminiLiveRelay.capture_turn_audio`.
+
+  Returns:
+    Whether the turn will be captured, which needs the relay to run in this worker.
+  """
+  relay = _relay
+  if relay is None or not ticket:
+    return False
+  relay.capture_turn_audio(ticket, on_audio)
+  return True
+
+
+def prepare(api_key: str, api_config: str, ticket: str = "") -> str:
+  """Prepares a session on this worker's relay. See `GeminiLiveRelay.prepare`.
+
+  Returns:
+    The ticket, or an empty string if the relay is not running in this worker.
+  """
+  relay = _relay
+  return relay.prepare(api_key, api_config, ticket) if relay else ""
@@ -0,0 +1,48 @@
+"""Gunicorn configuration.
+
+Gunicorn loads this file automatically when it is in the working directory.
+
+Workers use the threaded worker class, since each websocket session (with
+`MESOP_WEBSOCKETS_ENABLED=true`) or event stream holds a thread for as long as it is
+open. Each worker can hold up to `JEOPARDY_THREADS` sessions, so a node can hold
+`JEOPARDY_WORKERS * JEOPARDY_THREADS` concurrent sessions.
+
+- `PORT`: Port to listen on. Defaults to 7860, which Hugging Face Spaces expects.
+- `JEOPARDY_WORKERS`: Number of worker processes. Defaults to 1.
+- `JEOPARDY_THREADS`: Threads per worker. Defaults to 100.
+- `JEOPARDY_GRACEFUL_TIMEOUT`: Seconds to let open sessions finish on shutdown.
+  Defaults to 30.
+
+On shutdown, workers stop accepting connections and `/readyz` fails, so load balancers
+stop routing new sessions to them, while open sessions get the graceful timeout to
+finish.
+
+Each worker loads the question bank in the background (see `question_bank_loader`). Set
+`JEOPARDY_SHARED_BANK=true` to have the workers share one memory-mapped question bank
+instead of each worker holding a private copy.
+"""
+
+import os
+import signal
+
+bind = f"0.0.0.0:{os.getenv('PORT', '7860')}"
+worker_class = "gthread"
+workers = int(os.getenv("JEOPARDY_WORKERS", "1"))
+threads = int(os.getenv("JEOPARDY_THREADS", "100"))
+# With threaded workers, the timeout only applies to unresponsive workers, not to long
+# running sessions.
+timeout = 60
+graceful_timeout = int(os.getenv("JEOPARDY_GRACEFUL_TIMEOUT", "30"))
+
+
+def post_worker_init(worker):
+  # Imported here since the app is only loaded in the workers.
+  import server
+
+  handle_exit = signal.getsignal(signal.SIGTERM)
+
+  def handle_term(signum, frame):
+    server.start_draining()
+    handle_exit(signum, frame)
+
+  signal.signal(signal.SIGTERM, handle_term)
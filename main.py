@@ -1,23 +1,213 @@
+import functools
 import json
+import os
+import secrets
+import threading
 import time
+import uuid
+from collections import OrderedDict
+from typing import NamedTuple
 
+import admission
+import clue_audio_cache
 import css
+import daily
+import game_snapshots
+import gemini_live_relay
+import metrics
+import profiling
+import question_bank_loader
+import rooms
+import rounds
+import score_store
+import session_recorder
 import trebek_bot
-from models import Clue
+from models import Board, Clue
 import mesop as me
 import mesop.labs as mel
-from web_components.gemini_live_connection import gemini_live_connection
+from web_components.gemini_live_connection import (
+  gemini_live_connect_src,
+  gemini_live_connection,
+)
 from web_components.audio_recorder import audio_recorder
 from web_components.audio_player import audio_player
-from state import State
-
+from web_components.host_transcript import host_transcript
+from state import RoomPlayer, State, make_default_board
 
+_TOOL_CALL_ERROR = "There was an error. "
+# Client telemetry is reported to `server.py`, so it is only enabled when running with it.
+_CLIENT_TELEMETRY_ENDPOINT = (
+  "/telemetry" if os.getenv("JEOPARDY_CLIENT_TELEMETRY_ENABLED", "false") == "true" else ""
+)
+_BOARD_VIEW_CACHE_SIZE = 256
+# Rooms push updates to other players, which needs Mesop's websocket mode.
+_ROOMS_ENABLED = os.getenv("MESOP_WEBSOCKETS_ENABLED", "false").lower() == "true"
+_MAX_PLAYER_NAME_LENGTH = 24
+_LEADERBOARD_SIZE = 5
+# A restarted worker may still be loading the question bank the game's board is from.
+_RESUME_BANK_WAIT_SECONDS = 10
+# Opens and sets up the Gemini Live API connection before Start is clicked.
+_PREWARM_ENABLED = os.getenv("JEOPARDY_PREWARM_ENABLED", "false").lower() == "true"
+_PREWARM_IDLE_TIMEOUT_SECONDS = float(os.getenv("JEOPARDY_PREWARM_IDLE_TIMEOUT", "60"))
+# How often players in a room re-render without room updates, which is how sessions of
+# closed tabs find out that they should leave.
+_ROOM_UPDATE_TIMEOUT_SECONDS = 30
+
+_board_view_cache: OrderedDict[tuple, "BoardView"] = OrderedDict()
+_board_view_lock = threading.Lock()
+
+
+@metrics.instrument_event(State)
+@profiling.profile(State)
 def on_load(e: me.LoadEvent):
   """Update system instructions with the randomly selected game categories."""
   state = me.state(State)
+  resume_token = me.query_params.get("resume", "")
+  if resume_token and game_snapshots.is_enabled():
+    if not resume_game(resume_token):
+      del me.query_params["resume"]
+  elif me.query_params.get("daily") == "true":
+    daily_board = daily.get(make_gemini_live_api_config)
+    state.board = daily_board.board
+    state.daily_date = daily_board.date
+  state.gemini_live_api_config = make_gemini_live_api_config(
+    state.board, text_only=state.audio_player_muted, resume_instruction=make_resume_instruction()
+  )
+
+  if session_recorder.is_enabled():
+    state.recording_id = session_recorder.start(state.board)
+
+
+def on_page_load(e: me.LoadEvent):
+  """Sets up the game, then waits for admission and joins the room in the URL, if any.
+
+  Waiting for admission and playing in a room last as long as they take, so they are not
+  part of `on_load`, which is instrumented.
+  """
+  on_load(e)
+  state = me.state(State)
+  state.session_id = uuid.uuid4().hex
+  if not state.game_id:
+    state.game_id = uuid.uuid4().hex
+  yield from wait_for_admission()
+
+  if state.admission_status != "admitted":
+    return
+  room_id = me.query_params.get("room", "")
+  if _ROOMS_ENABLED and room_id:
+    yield from play_in_room(room_id)
+  elif gemini_live_relay.is_enabled():
+    prepare_gemini_live_session()
+    # Renders the relay endpoint.
+    yield
+
+
+def make_gemini_live_api_config(
+  board: Board, multiplayer: bool = False, text_only: bool = False, resume_instruction: str = ""
+) -> str:
+  if not multiplayer and not resume_instruction:
+    # The board of the day is shared, and so are its setup messages.
+    daily_config = daily.find_config(board, text_only)
+    if daily_config is not None:
+      return daily_config
+  return trebek_bot.make_gemini_live_api_config(
+    system_instructions=trebek_bot.make_system_instruction(
+      format_clue_data(board), multiplayer, resume_instruction
+    ),
+    response_modality="text" if text_only else "audio",
+  )
+
+
+def make_resume_instruction() -> str:
+  """Tells the host where a single player game that is continued in a new session stands.
+
+  Empty if the game has not started yet.
+  """
+  state = me.state(State)
+  if state.room_id or not (state.answered_questions or state.round_index or state.score):
+    return ""
+  played_clues = []
+  for clue_key in sorted(state.answered_questions):
+    clue = get_selected_question(state.board, clue_key)
+    played_clues.append(f"{clue.category} for ${clue.normalized_value}")
+  return trebek_bot.make_resume_instruction(
+    rounds.ROUND_NAMES[state.round_index], state.score, played_clues
+  )
+
+
+def resume_game(resume_token: str) -> bool:
+  """Restores a single player game from its latest snapshot. Returns whether it did."""
+  snapshot = game_snapshots.load(resume_token)
+  if snapshot is None:
+    return False
+  question_bank_loader.wait(_RESUME_BANK_WAIT_SECONDS)
+  try:
+    board = rounds.make_round_board(
+      question_bank_loader.current(), snapshot.set_ids, snapshot.round_index
+    )
+  except IndexError:
+    return False
+  if score_store.make_board_id(board) != snapshot.board_id:
+    # The question bank changed since the snapshot.
+    return False
+
+  state = me.state(State)
+  state.board = board
+  state.round_index = snapshot.round_index
+  state.score = snapshot.score
+  state.daily_date = snapshot.daily_date
+  state.game_id = snapshot.game_id
+  state.player_name = snapshot.player_name
+  state.resume_token = resume_token
+  clues_per_category = len(board.clues[0])
+  state.answered_questions = {
+    f"clue-{index // clues_per_category}-{index % clues_per_category}"
+    for index in range(len(board.clues) * clues_per_category)
+    if snapshot.answered >> index & 1
+  }
+  return True
+
+
+def save_snapshot():
+  """Saves the single player game, if it has a resume token, so it can be resumed."""
+  state = me.state(State)
+  if not state.resume_token or state.room_id:
+    return
+  clues_per_category = len(state.board.clues[0])
+  answered = 0
+  for clue_key in state.answered_questions:
+    category_index, dollar_index = parse_clue_key(clue_key)
+    answered |= 1 << (category_index * clues_per_category + dollar_index)
+  game_snapshots.save(
+    state.resume_token,
+    game_snapshots.GameSnapshot(
+      game_id=state.game_id,
+      board_id=score_store.make_board_id(state.board),
+      set_ids=state.board.set_ids,
+      round_index=state.round_index,
+      answered=answered,
+      score=state.score,
+      daily_date=state.daily_date,
+      player_name=state.player_name,
+    ),
+  )
+
+
+def prepare_next_round(board: Board, round_index: int) -> str:
+  """Prepares the view of the next round's board and returns the message introducing it.
+
+  Runs in the background while the current round is played. See `rounds`.
+  """
+  get_board_view(board, True, frozenset(), "")
+  return trebek_bot.make_next_round_message(
+    rounds.ROUND_NAMES[round_index], format_clue_data(board, compact=True)
+  )
+
 
+def format_clue_data(board: Board, compact: bool = False) -> str:
+  """Formats the clues of the board as the dataset in the host's instructions."""
   formatted_clues = []
-  for clue_category in state.board.clues:
+  for clue_category in board.clues:
     formatted_clue_category = []
     for clue in clue_category:
       formatted_clue_category.append(
@@ -30,81 +220,71 @@ def on_load(e: me.LoadEvent):
       )
     formatted_clues.append(formatted_clue_category)
 
-  state.gemini_live_api_config = trebek_bot.make_gemini_live_api_config(
-    system_instructions=trebek_bot.make_system_instruction(
-      json.dumps(formatted_clues, indent=2, sort_keys=True)
-    )
-  )
+  if compact:
+    return json.dumps(formatted_clues, separators=(",", ":"), sort_keys=True)
+  return json.dumps(formatted_clues, indent=2, sort_keys=True)
 
 
 @me.page(
   path="/",
   title="Mesop Jeopardy Live",
   security_policy=me.SecurityPolicy(
-    allowed_connect_srcs=["wss://generativelanguage.googleapis.com"],
+    allowed_connect_srcs=[gemini_live_connect_src(), *gemini_live_relay.connect_srcs()],
     allowed_iframe_parents=["https://huggingface.co"],
     allowed_script_srcs=[
       "https://cdn.jsdelivr.net",
     ],
   ),
-  on_load=on_load,
+  on_load=on_page_load,
 )
+@profiling.profile(State)
 def app():
   state = me.state(State)
 
+  if state.admission_status == "admitted":
+    # Sessions that expired while idle have to be admitted again.
+    update_admission(admission.touch(state.session_id, get_api_key()))
+
   with me.box(style=css.MAIN_COL_GRID):
-    with me.box(style=css.board_col_grid()):
-      for col_index in range(len(state.board.clues[0])):
-        # Render Jeopardy categories
-        if col_index == 0:
-          for row_index in range(len(state.board.clues)):
-            cell = state.board.clues[row_index][col_index]
-            with me.box(style=css.category_box()):
-              if state.gemini_live_api_enabled:
-                me.text(cell.category)
-              else:
-                me.text("")
-
-        # Render Jeopardy questions
-        for row_index in range(len(state.board.clues)):
-          cell = state.board.clues[row_index][col_index]
-          key = f"clue-{row_index}-{col_index}"
-          is_selectable = not (key in state.answered_questions or state.selected_question_key)
-          with me.box(
-            style=css.clue_box(state.gemini_live_api_enabled and is_selectable),
-            key=key,
-            on_click=on_click_cell,
-          ):
-            if not state.gemini_live_api_enabled:
-              me.text("")
-            elif key in state.answered_questions:
-              me.text("")
-            elif key == state.selected_question_key:
-              me.text(cell.question, style=me.Style(text_align="left"))
-            else:
-              me.text(f"${cell.normalized_value}", style=me.Style(font_size="2.2vw"))
+    if state.admission_status in ("queued", "rejected"):
+      busy_board()
+    else:
+      game_board()
 
     # Sidebar
     with me.box(style=css.SIDEBAR):
       me.input(
         label="Google API Key",
         on_input=on_input_api_key,
-        readonly=state.gemini_live_api_enabled,
+        on_blur=on_commit_api_key,
+        on_enter=on_commit_api_key,
+        # The key cannot change while waiting in the queue, since the wait runs in the
+        # load event.
+        readonly=state.gemini_live_api_enabled or state.admission_status == "queued",
         style=css.TEXT_INPUT,
+        placeholder="Using the server's key" if get_api_key() and not state.api_key else "",
         type="password",
         value=state.api_key,
       )
 
       with me.box(style=css.TOOLBAR_SECTION):
-        gemini_live_button()
-        audio_player_button()
-        audio_recorder_button()
+        if state.room_id and not state.is_room_host:
+          # Only the host connects to the Gemini Live API.
+          me.text(f"Hosted by {get_room_host_name()}", style=css.sidebar_header())
+        else:
+          gemini_live_button()
+          audio_player_button()
+          audio_recorder_button()
 
       # Score
       with me.box(style=css.SIDEBAR_SECTION):
         me.text("Score", type="headline-5", style=css.sidebar_header())
-        with me.box(style=css.score_box()):
-          me.text(format_dollars(state.score), style=css.score_text(state.score))
+        if state.room_id:
+          room_scores()
+        else:
+          with me.box(style=css.score_box()):
+            me.text(format_dollars(state.score), style=css.score_text(state.score))
+          me.text(rounds.ROUND_NAMES[state.round_index])
 
       # Clue
       with me.box(style=css.SIDEBAR_SECTION):
@@ -116,18 +296,35 @@ def app():
           else:
             me.text("No clue selected. Please select one.", style=me.Style(font_style="italic"))
 
+      # Host responses while the audio player is muted.
+      if state.audio_player_muted and (not state.room_id or state.is_room_host):
+        with me.box(style=css.SIDEBAR_SECTION):
+          me.text("Host", type="headline-5", style=css.sidebar_header())
+          with me.box(style=css.current_clue_box()):
+            host_transcript(placeholder="The host's responses will be shown here.")
+
       # Response
       with me.box(style=css.SIDEBAR_SECTION):
         me.text("Response", type="headline-5", style=css.sidebar_header())
+        if state.room_id:
+          buzz_disabled = not state.selected_question_key or bool(state.buzz_position)
+          me.button(
+            disabled=buzz_disabled,
+            label=f"Buzzed in #{state.buzz_position}" if state.buzz_position else "Buzz in",
+            on_click=on_click_buzz,
+            style=css.response_button(buzz_disabled),
+            type="flat",
+          )
+
+        disabled = not can_respond()
         me.textarea(
-          disabled=not bool(state.selected_question_key),
+          disabled=disabled,
           label="Enter your response",
           on_blur=on_input_response,
           style=css.TEXT_INPUT,
           value=state.response_value,
         )
 
-        disabled = not bool(state.selected_question_key)
         me.button(
           disabled=disabled,
           label="Submit your response",
@@ -136,6 +333,168 @@ def app():
           type="flat",
         )
 
+      if state.admission_status == "admitted" and not state.room_id:
+        daily_panel()
+        if score_store.is_enabled():
+          leaderboard_panel()
+
+      if _ROOMS_ENABLED and state.admission_status == "admitted":
+        room_panel()
+
+
+@me.component
+def game_board():
+  state = me.state(State)
+  board_view = get_board_view(
+    state.board,
+    state.gemini_live_api_enabled,
+    frozenset(state.answered_questions),
+    state.selected_question_key,
+  )
+
+  with me.box(style=board_view.style):
+    # Render Jeopardy categories
+    for category in board_view.categories:
+      with me.box(style=category.style):
+        me.text(category.text)
+
+    # Render Jeopardy questions
+    for cell in board_view.cells:
+      with me.box(style=cell.style, key=cell.key, on_click=on_click_cell):
+        me.text(cell.text, style=cell.text_style)
+
+
+@me.component
+def busy_board():
+  """Shown instead of the game board while the session waits for admission."""
+  state = me.state(State)
+  with me.box(style=css.BUSY_BOARD):
+    if state.admission_reason == "api_key":
+      me.text(
+        "Too many games are using this API key", type="headline-4", style=css.BUSY_BOARD_HEADER
+      )
+    else:
+      me.text("Server busy", type="headline-4", style=css.BUSY_BOARD_HEADER)
+
+    if state.admission_status == "queued":
+      me.text(f"You are number {state.admission_position} in line.", type="headline-6")
+      me.text(
+        f"Estimated wait: {format_wait(state.admission_estimated_wait_seconds)}.",
+        type="headline-6",
+      )
+    else:
+      if state.admission_reason == "api_key":
+        me.text("Please use a different API key or try again later.", type="headline-6")
+      elif state.admission_reason == "timeout":
+        me.text("The wait took too long. Please try again later.", type="headline-6")
+      else:
+        me.text("Too many people are playing right now. Please try again later.", type="headline-6")
+      me.button(
+        label="Try again",
+        on_click=on_click_retry_admission,
+        style=css.BUSY_BOARD_BUTTON,
+        type="flat",
+      )
+
+
+@me.component
+def room_scores():
+  state = me.state(State)
+  with me.box(style=css.score_box()):
+    for player in state.room_players:
+      with me.box(style=css.ROOM_PLAYER_ROW):
+        name = player.name + (" (you)" if player.is_self else "")
+        if player.buzz_position:
+          name = f"#{player.buzz_position} {name}"
+        me.text(name)
+        me.text(format_dollars(player.score), style=css.score_text(player.score))
+
+
+@me.component
+def daily_panel():
+  """Starts a game with the board of the day."""
+  state = me.state(State)
+  with me.box(style=css.SIDEBAR_SECTION):
+    me.text("Board of the day", type="headline-5", style=css.sidebar_header())
+    if state.daily_date:
+      me.text(f"You are playing the board of the day for {state.daily_date}.")
+    else:
+      disabled = state.gemini_live_api_enabled
+      me.button(
+        disabled=disabled,
+        label="Play the board of the day",
+        on_click=on_click_daily_board,
+        style=css.response_button(disabled),
+        type="flat",
+      )
+
+
+@me.component
+def leaderboard_panel():
+  """Shows the highest scores of the board of the day, or of all games today."""
+  state = me.state(State)
+  store = score_store.get()
+  with me.box(style=css.SIDEBAR_SECTION):
+    me.text("Leaderboard", type="headline-5", style=css.sidebar_header())
+    if state.daily_date:
+      me.text("Board of the day")
+      entries = store.leaderboard(
+        "board", score_store.make_board_id(state.board), _LEADERBOARD_SIZE
+      )
+    else:
+      me.text("All games today")
+      entries = store.leaderboard("day", daily.today(), _LEADERBOARD_SIZE)
+    with me.box(style=css.score_box()):
+      if not entries:
+        me.text("No scores yet.", style=me.Style(font_style="italic"))
+      for rank, entry in enumerate(entries, 1):
+        with me.box(style=css.ROOM_PLAYER_ROW):
+          me.text(f"#{rank} {entry.player_name}")
+          me.text(format_dollars(entry.score), style=css.score_text(entry.score))
+    me.input(
+      label="Your name",
+      on_blur=on_blur_player_name,
+      style=css.TEXT_INPUT,
+      value=state.player_name,
+    )
+
+
+@me.component
+def room_panel():
+  """Creates, shows and leaves multiplayer rooms."""
+  state = me.state(State)
+  with me.box(style=css.SIDEBAR_SECTION):
+    me.text("Room", type="headline-5", style=css.sidebar_header())
+    if state.room_id:
+      me.text(f"Room code: {state.room_id}")
+      me.text("Share the link to this page to invite other players.")
+      me.input(
+        label="Your name",
+        on_blur=on_blur_player_name,
+        style=css.TEXT_INPUT,
+        value=state.player_name,
+      )
+      # The host's Gemini Live API session would end for everyone.
+      disabled = state.is_room_host and state.gemini_live_api_enabled
+      me.button(
+        disabled=disabled,
+        label="Leave room",
+        on_click=on_click_leave_room,
+        style=css.response_button(disabled),
+        type="flat",
+      )
+    else:
+      if state.room_error:
+        me.text(state.room_error)
+      disabled = state.gemini_live_api_enabled
+      me.button(
+        disabled=disabled,
+        label="Create a room for friends",
+        on_click=on_click_create_room,
+        style=css.response_button(disabled),
+        type="flat",
+      )
+
 
 @me.component
 def gemini_live_button():
@@ -143,16 +502,22 @@ def gemini_live_button():
   with gemini_live_connection(
     api_config=state.gemini_live_api_config,
     api_key=state.api_key,
+    clue_audio_cached=state.clue_audio_cached,
     enabled=state.gemini_live_api_enabled,
+    endpoint=gemini_live_relay.endpoint(state.gemini_live_relay_ticket),
+    prewarm=_PREWARM_ENABLED and bool(get_api_key()) and state.admission_status == "admitted",
+    prewarm_idle_timeout_seconds=_PREWARM_IDLE_TIMEOUT_SECONDS,
     on_start=on_gemini_live_api_started,
     on_stop=on_gemini_live_api_stopped,
     on_tool_call=handle_tool_calls,
+    recording_endpoint=f"/recordings/{state.recording_id}" if state.recording_id else "",
+    telemetry_endpoint=_CLIENT_TELEMETRY_ENDPOINT,
     text_input=state.text_input,
     tool_call_responses=state.tool_call_responses,
   ):
     with me.tooltip(message=get_gemini_live_tooltip()):
       with me.content_button(
-        disabled=not state.api_key,
+        disabled=not get_api_key() or state.admission_status != "admitted",
         style=css.game_button(),
         type="icon",
       ):
@@ -166,7 +531,11 @@ def gemini_live_button():
 def audio_player_button():
   state = me.state(State)
   with audio_player(
-    enabled=state.audio_player_enabled, on_play=on_audio_play, on_stop=on_audio_stop
+    audio_url=state.clue_audio_url,
+    enabled=state.audio_player_enabled,
+    muted=state.audio_player_muted,
+    on_play=on_audio_play,
+    on_stop=on_audio_stop,
   ):
     with me.tooltip(message=get_audio_player_tooltip()):
       with me.content_button(
@@ -176,6 +545,8 @@ def audio_player_button():
       ):
         if state.audio_player_enabled:
           me.icon(icon="volume_up")
+        elif state.audio_player_muted:
+          me.icon(icon="volume_off")
         else:
           me.icon(icon="volume_mute")
 
@@ -198,26 +569,34 @@ def audio_recorder_button():
           me.icon(icon="mic")
 
 
+@session_recorder.record_events(State)
+@metrics.instrument_event(State)
+@profiling.profile(State)
 def on_click_cell(e: me.ClickEvent):
   """Selects the given clue by prompting Gemini Live API."""
   state = me.state(State)
   clue = get_selected_question(state.board, e.key)
-  me.state(State).text_input = f"I'd like to select {clue.category}, for ${clue.normalized_value}."
+  send_text_input(f"I'd like to select {clue.category}, for ${clue.normalized_value}.")
 
 
+@session_recorder.record_events(State)
+@profiling.profile(State)
 def on_input_response(e: me.InputBlurEvent):
   """Stores user input into state, so we can process their response."""
   state = me.state(State)
   state.response = e.value
 
 
+@session_recorder.record_events(State)
+@metrics.instrument_event(State)
+@profiling.profile(State)
 def on_click_submit(e: me.ClickEvent):
   """Submit user response to clue to check if they are correct using Gemini Live API."""
   state = me.state(State)
-  if not state.response.strip():
+  if not state.response.strip() or not can_respond():
     return
 
-  state.text_input = state.response
+  send_text_input(state.response)
 
   # Hack to reset text input. Update the initial response value to current response
   # first, which will trigger a diff when we set the initial response back to empty
@@ -232,10 +611,258 @@ def on_click_submit(e: me.ClickEvent):
   yield
 
 
+def send_text_input(text: str):
+  """Sends text to the Gemini Live API. In a room, it is sent by the room host."""
+  state = me.state(State)
+  room = rooms.get(state.room_id)
+  if room is None:
+    state.text_input = text
+  else:
+    room.send_to_host(state.session_id, text)
+
+
+def can_respond() -> bool:
+  """Whether the player may respond to the selected clue.
+
+  In a room, the first player to buzz in responds. The host can respond if no one
+  buzzed in, since they can also respond by voice.
+  """
+  state = me.state(State)
+  if not state.selected_question_key:
+    return False
+  if not state.room_id or state.buzz_position == 1:
+    return True
+  return state.is_room_host and not any(player.buzz_position for player in state.room_players)
+
+
 def get_selected_question(board, selected_question_key) -> Clue:
   """Gets the selected question from the key."""
-  _, row, col = selected_question_key.split("-")
-  return board.clues[int(row)][int(col)]
+  row, col = parse_clue_key(selected_question_key)
+  return board.clues[row][col]
+
+
+@functools.lru_cache(maxsize=64)
+def parse_clue_key(clue_key: str) -> tuple[int, int]:
+  """Parses a clue key into the row and column indexes."""
+  _, row, col = clue_key.split("-")
+  return int(row), int(col)
+
+
+class BoardText(NamedTuple):
+  text: str
+  style: me.Style
+
+
+class BoardCell(NamedTuple):
+  key: str
+  text: str
+  text_style: me.Style | None
+  style: me.Style
+
+
+class BoardView(NamedTuple):
+  style: me.Style
+  categories: tuple[BoardText, ...]
+  # Clues in display order, which is column by column of the board data.
+  cells: tuple[BoardCell, ...]
+
+
+def get_board_view(
+  board: Board, enabled: bool, answered_questions: frozenset[str], selected_question_key: str
+) -> BoardView:
+  """Gets the text and styles of each board cell.
+
+  Most events do not change the board, so the view is cached for the last few states of
+  each board. Boards are compared by content, since the board in the state is a new
+  object on every request.
+  """
+  cache_key = (_board_content_key(board), enabled, answered_questions, selected_question_key)
+  with _board_view_lock:
+    board_view = _board_view_cache.get(cache_key)
+    if board_view is not None:
+      _board_view_cache.move_to_end(cache_key)
+      return board_view
+
+  board_view = _make_board_view(board, enabled, answered_questions, selected_question_key)
+  with _board_view_lock:
+    _board_view_cache[cache_key] = board_view
+    if len(_board_view_cache) > _BOARD_VIEW_CACHE_SIZE:
+      _board_view_cache.popitem(last=False)
+  return board_view
+
+
+def _board_content_key(board: Board) -> tuple:
+  """Everything about the board that is shown in its view."""
+  return tuple(
+    (clue.category, clue.question, clue.normalized_value)
+    for category in board.clues
+    for clue in category
+  )
+
+
+def _make_board_view(
+  board: Board, enabled: bool, answered_questions: frozenset[str], selected_question_key: str
+) -> BoardView:
+  category_style = css.category_box(enabled)
+  categories = tuple(
+    BoardText(text=category[0].category if enabled else "", style=category_style)
+    for category in board.clues
+  )
+
+  cells = []
+  for col_index in range(len(board.clues[0])):
+    for row_index, category in enumerate(board.clues):
+      clue = category[col_index]
+      key = f"clue-{row_index}-{col_index}"
+      is_selectable = not (key in answered_questions or selected_question_key)
+      text, text_style = "", None
+      if enabled and key not in answered_questions:
+        if key == selected_question_key:
+          text, text_style = clue.question, css.CLUE_TEXT
+        else:
+          text, text_style = f"${clue.normalized_value}", css.CLUE_VALUE_TEXT
+      cells.append(
+        BoardCell(
+          key=key,
+          text=text,
+          text_style=text_style,
+          style=css.clue_box(enabled, enabled and is_selectable),
+        )
+      )
+
+  return BoardView(style=css.board_col_grid(enabled), categories=categories, cells=tuple(cells))
+
+
+def wait_for_admission():
+  """Waits in the admission queue, updating the busy board with the place in line."""
+  state = me.state(State)
+  # Copied since the state may not be available when the client disconnects.
+  session_id = state.session_id
+  start_time = time.monotonic()
+  was_queued = False
+  try:
+    while True:
+      update_admission(admission.admit(session_id, get_api_key()))
+      if state.admission_status != "queued":
+        break
+      was_queued = True
+      if time.monotonic() - start_time > admission.MAX_WAIT_SECONDS:
+        admission.leave_queue(session_id)
+        update_admission(admission.Admission("rejected", "timeout"))
+        break
+      yield
+      time.sleep(admission.POLL_INTERVAL_SECONDS)
+  finally:
+    admission.leave_queue(session_id, "abandoned")
+
+  if was_queued:
+    metrics.ADMISSION_WAIT.observe(time.monotonic() - start_time)
+  # Generator handlers only render when they yield, so render the outcome even when the
+  # session was admitted right away.
+  yield
+
+
+def prepare_gemini_live_session():
+  """Has the relay set up a Gemini Live API session ahead of Start, if it is enabled.
+
+  Called whenever the API key or setup message of a session that can start a game
+  changes.
+  """
+  state = me.state(State)
+  api_key = get_api_key()
+  if gemini_live_relay.is_enabled() and api_key:
+    state.gemini_live_relay_ticket = gemini_live_relay.prepare(
+      api_key, state.gemini_live_api_config, state.gemini_live_relay_ticket
+    )
+
+
+def update_admission(result: admission.Admission):
+  state = me.state(State)
+  state.admission_status = result.status
+  state.admission_reason = result.reason
+  state.admission_position = result.position
+  state.admission_estimated_wait_seconds = int(result.estimated_wait_seconds)
+
+
+def play_in_room(room_id: str):
+  """Joins a room and keeps the session in sync with it until the player leaves."""
+  state = me.state(State)
+  # Copied since the state may not be available when the client disconnects.
+  player_id = state.session_id
+  if not rooms.is_valid_room_id(room_id):
+    state.room_error = "That room code is not valid."
+    return
+  room = rooms.join(room_id, player_id, state.player_name, state.board)
+  if room is None:
+    state.room_error = "That room is full."
+    return
+
+  state.room_id = room_id
+  state.room_error = ""
+  version = -1
+  try:
+    while True:
+      snapshot = room.wait_for_update(version, _ROOM_UPDATE_TIMEOUT_SECONDS)
+      if state.room_id != room_id:
+        break
+      if snapshot.version != version:
+        apply_room_snapshot(snapshot, player_id)
+        version = snapshot.version
+      yield
+  finally:
+    rooms.leave(room_id, player_id)
+
+
+def apply_room_snapshot(snapshot: rooms.RoomSnapshot, player_id: str):
+  state = me.state(State)
+  is_host = snapshot.host_player_id == player_id
+  if is_host and (not state.is_room_host or state.board is not snapshot.board):
+    # The host runs the Gemini Live API session for the room's board.
+    state.gemini_live_api_config = make_gemini_live_api_config(
+      snapshot.board, multiplayer=True, text_only=state.audio_player_muted
+    )
+    prepare_gemini_live_session()
+  state.is_room_host = is_host
+  if is_host:
+    state.text_input = snapshot.host_text_input
+  else:
+    state.gemini_live_api_enabled = snapshot.game_active
+  state.board = snapshot.board
+  state.round_index = 0
+  state.answered_questions = set(snapshot.answered_questions)
+  state.selected_question_key = snapshot.selected_question_key
+
+  buzz_positions = {
+    buzz_player_id: position for position, buzz_player_id in enumerate(snapshot.buzz_order, 1)
+  }
+  state.buzz_position = buzz_positions.get(player_id, 0)
+  state.room_players = []
+  for player in snapshot.players:
+    if player.player_id == player_id:
+      state.player_name = player.name
+      state.score = player.score
+    state.room_players.append(
+      RoomPlayer(
+        name=player.name,
+        score=player.score,
+        is_host=player.player_id == snapshot.host_player_id,
+        buzz_position=buzz_positions.get(player.player_id, 0),
+        is_self=player.player_id == player_id,
+      )
+    )
+
+
+def get_room_host_name() -> str:
+  state = me.state(State)
+  return next((player.name for player in state.room_players if player.is_host), "")
+
+
+def format_wait(seconds: int) -> str:
+  """Formats an estimated wait time in minutes."""
+  if seconds < 60:
+    return "less than a minute"
+  minutes = round(seconds / 60)
+  return "about 1 minute" if minutes == 1 else f"about {minutes} minutes"
 
 
 def format_dollars(value: int) -> str:
@@ -245,12 +872,19 @@ def format_dollars(value: int) -> str:
   return f"${value:,}"
 
 
+def get_api_key() -> str:
+  """API key the session connects to the Gemini Live API with."""
+  return gemini_live_relay.session_api_key(me.state(State).api_key)
+
+
 def get_gemini_live_tooltip() -> str:
   """Tooltip messages for Gemini Live API web component button."""
   state = me.state(State)
   if state.gemini_live_api_enabled:
     return "Stop game"
-  if state.api_key:
+  if state.admission_status != "admitted":
+    return "Game disabled. Server busy."
+  if get_api_key():
     return "Start game"
   return "Game disabled. Enter API Key."
 
@@ -259,7 +893,9 @@ def get_audio_player_tooltip() -> str:
   """Tooltip messages for Audio player web component button."""
   state = me.state(State)
   if state.audio_player_enabled:
-    return "Audio playing"
+    return "Audio playing. Click to switch to text."
+  if state.audio_player_muted:
+    return "Text only. Click to switch to audio."
   if state.gemini_live_api_enabled:
     return "Audio not playing"
   return "Audio disabled"
@@ -277,40 +913,200 @@ def get_audio_recorder_tooltip() -> str:
   return "Microphone disabled"
 
 
+@profiling.profile(State)
 def on_input_api_key(e: me.InputEvent):
   """Captures Google API key input"""
   state = me.state(State)
   state.api_key = e.value
 
 
+@profiling.profile(State)
+def on_commit_api_key(e: me.InputBlurEvent | me.InputEnterEvent):
+  """Uses the Google API key once the player is done typing it."""
+  state = me.state(State)
+  if state.gemini_live_api_enabled:
+    # The input is read-only while connected, so the key has not changed.
+    return
+  state.api_key = e.value
+  if state.admission_status == "admitted":
+    # Sessions count against the limit of the key they use.
+    update_admission(admission.admit(state.session_id, get_api_key()))
+  if state.admission_status == "admitted" and (not state.room_id or state.is_room_host):
+    prepare_gemini_live_session()
+
+
+@profiling.profile(State)
+def on_click_retry_admission(e: me.ClickEvent):
+  """Tries to get admitted again after the session was turned away."""
+  yield from wait_for_admission()
+
+
+@profiling.profile(State)
+def on_click_create_room(e: me.ClickEvent):
+  """Creates a room with the current board. Other players join with the page's link."""
+  room_id = secrets.token_urlsafe(6)
+  me.query_params["room"] = room_id
+  yield from play_in_room(room_id)
+
+
+@profiling.profile(State)
+def on_click_leave_room(e: me.ClickEvent):
+  """Leaves the room and starts a new single player game."""
+  state = me.state(State)
+  room_id = state.room_id
+  # Cleared first, so the room's update loop stops when it wakes up.
+  state.room_id = ""
+  rooms.leave(room_id, state.session_id)
+  del me.query_params["room"]
+  if "daily" in me.query_params:
+    del me.query_params["daily"]
+
+  state.gemini_live_api_enabled = False
+  state.is_room_host = False
+  state.room_players = []
+  state.buzz_position = 0
+  start_new_game(make_default_board(question_bank_loader.current()))
+
+
+@profiling.profile(State)
+def on_click_daily_board(e: me.ClickEvent):
+  """Starts a new game with the board of the day."""
+  me.query_params["daily"] = "true"
+  daily_board = daily.get(make_gemini_live_api_config)
+  start_new_game(daily_board.board)
+  me.state(State).daily_date = daily_board.date
+
+
+def start_new_game(board: Board):
+  """Starts a new single player game with the board before the host is started."""
+  state = me.state(State)
+  state.game_id = uuid.uuid4().hex
+  state.resume_token = ""
+  if "resume" in me.query_params:
+    del me.query_params["resume"]
+  state.board = board
+  state.daily_date = ""
+  state.round_index = 0
+  rounds.discard(state.session_id)
+  state.gemini_live_api_config = make_gemini_live_api_config(
+    state.board, text_only=state.audio_player_muted
+  )
+  prepare_gemini_live_session()
+  state.answered_questions = set()
+  state.selected_question_key = ""
+  state.score = 0
+  state.text_input = ""
+
+
+@profiling.profile(State)
+def on_blur_player_name(e: me.InputBlurEvent):
+  state = me.state(State)
+  name = e.value.strip()[:_MAX_PLAYER_NAME_LENGTH]
+  room = rooms.get(state.room_id)
+  if room is not None:
+    room.rename(state.session_id, name)
+  else:
+    state.player_name = name
+
+
+@metrics.instrument_event(State)
+@profiling.profile(State)
+def on_click_buzz(e: me.ClickEvent):
+  """Buzzes in for the selected clue. Buzzes are ordered by when the server got them."""
+  buzz_time = time.monotonic()
+  state = me.state(State)
+  room = rooms.get(state.room_id)
+  if room is not None:
+    state.buzz_position = room.buzz(state.session_id, buzz_time) or state.buzz_position
+
+
+@session_recorder.record_events(State)
+@profiling.profile(State)
 def on_audio_play(e: mel.WebEvent):
   """Event for when audio player play button was clicked."""
   me.state(State).audio_player_enabled = True
+  set_audio_player_muted(False)
 
 
+@session_recorder.record_events(State)
+@profiling.profile(State)
 def on_audio_stop(e: mel.WebEvent):
   """Event for when audio player stop button was clicked."""
   me.state(State).audio_player_enabled = False
+  if e.value.get("muted"):
+    set_audio_player_muted(True)
 
 
+def set_audio_player_muted(muted: bool):
+  """Switches the host between text responses while muted and audio responses.
+
+  A game in progress reconnects with the new setup.
+  """
+  state = me.state(State)
+  if state.audio_player_muted == muted:
+    return
+  state.audio_player_muted = muted
+  state.gemini_live_api_config = make_gemini_live_api_config(
+    state.board,
+    multiplayer=bool(state.room_id),
+    text_only=muted,
+    resume_instruction=make_resume_instruction(),
+  )
+  if not state.gemini_live_api_enabled:
+    prepare_gemini_live_session()
+
+
+@session_recorder.record_events(State)
+@profiling.profile(State)
 def on_audio_recorder_state_change(e: mel.WebEvent):
   """Event for when audio recorder state changes."""
   me.state(State).audio_recorder_state = e.value
 
 
+@session_recorder.record_events(State)
+@profiling.profile(State)
 def on_gemini_live_api_started(e: mel.WebEvent):
   """Event for when Gemin Live API start button was clicked."""
-  me.state(State).gemini_live_api_enabled = True
-
-
+  state = me.state(State)
+  state.gemini_live_api_enabled = True
+  admission.set_game_running(state.session_id, True)
+  room = rooms.get(state.room_id)
+  if room is not None:
+    room.set_game_active(True)
+  elif game_snapshots.is_enabled() and not state.resume_token:
+    state.resume_token = game_snapshots.make_token()
+    me.query_params["resume"] = state.resume_token
+  save_snapshot()
+  prefetch_next_round()
+
+
+@session_recorder.record_events(State)
+@profiling.profile(State)
 def on_gemini_live_api_stopped(e: mel.WebEvent):
   """Event for when Gemin Live API stop button was clicked."""
   state = me.state(State)
+  admission.set_game_running(state.session_id, False)
   state.gemini_live_api_enabled = False
   state.selected_question_key = ""
   state.response_value = ""
+  record_score()
+  save_snapshot()
+  room = rooms.get(state.room_id)
+  if room is not None:
+    room.set_game_active(False)
+  else:
+    # Starting again continues the game, possibly in a later round.
+    state.gemini_live_api_config = make_gemini_live_api_config(
+      state.board,
+      text_only=state.audio_player_muted,
+      resume_instruction=make_resume_instruction(),
+    )
+    prepare_gemini_live_session()
 
 
+@session_recorder.record_events(State)
+@metrics.instrument_event(State)
+@profiling.profile(State)
 def handle_tool_calls(e: mel.WebEvent):
   """Proceses tool calls from Gemini Live API.
 
@@ -322,15 +1118,27 @@ def handle_tool_calls(e: mel.WebEvent):
   state = me.state(State)
   tool_calls = json.loads(e.value["toolCalls"])
   responses = []
+  state.clue_audio_cached = False
+  state.clue_audio_capture = False
   for tool_call in tool_calls:
     result = None
+    error = False
     if tool_call["name"] == "get_clue":
       result = tool_call_get_clue(
-        tool_call["args"]["category_index"], tool_call["args"]["dollar_index"]
+        tool_call["args"]["category_index"],
+        tool_call["args"]["dollar_index"],
+        # The host's turn also responds to the other tool calls, so it is not only the
+        # reading of the clue.
+        use_clue_audio=len(tool_calls) == 1,
       )
-      result = True  # For now just return true due to buggy behavior
+      error = result.startswith(_TOOL_CALL_ERROR)
+      if not state.clue_audio_cached and not state.clue_audio_capture:
+        result = True  # For now just return true due to buggy behavior
     elif tool_call["name"] == "update_score":
       result = tool_call_update_score(tool_call["args"]["is_correct"])
+    else:
+      error = True
+    metrics.TOOL_CALLS.inc(name=tool_call["name"], error=str(error).lower())
 
     responses.append(
       {
@@ -351,6 +1159,14 @@ def tool_call_update_score(is_correct: bool) -> str:
   allow the game state to be updated appropriately.
   """
   state = me.state(State)
+  room = rooms.get(state.room_id)
+  if room is not None:
+    snapshot = room.snapshot()
+    if not snapshot.selected_question_key:
+      return "No clue is selected."
+    clue = get_selected_question(snapshot.board, snapshot.selected_question_key)
+    return room.update_score(is_correct, clue.normalized_value)
+
   selected_question = get_selected_question(state.board, state.selected_question_key)
   if is_correct:
     state.score += selected_question.normalized_value
@@ -361,25 +1177,105 @@ def tool_call_update_score(is_correct: bool) -> str:
   state.answered_questions.add(state.selected_question_key)
   state.selected_question_key = ""
 
-  return f"The user's score is {state.score}"
+  result = f"The user's score is {state.score}"
+  if len(state.answered_questions) == sum(len(category) for category in state.board.clues):
+    if state.daily_date or rounds.is_last_round(state.round_index):
+      result += ". All clues have been played, so the game is over."
+      record_score(finished=True)
+    else:
+      record_score()
+      start_next_round()
+  else:
+    record_score()
+  save_snapshot()
+  return result
 
 
-def tool_call_get_clue(category_index, dollar_index) -> str:
+def record_score(finished: bool = False):
+  """Records the score of a single player game that has started for the leaderboard."""
+  state = me.state(State)
+  clues_per_round = sum(len(category) for category in state.board.clues)
+  clues_answered = state.round_index * clues_per_round + len(state.answered_questions)
+  if state.room_id or not clues_answered:
+    return
+  score_store.record(
+    state.game_id, state.player_name, state.board, state.score, clues_answered, finished
+  )
+
+
+def prefetch_next_round():
+  """Prepares the next round in the background while the current round is played.
+
+  Rooms and the board of the day have a single round.
+  """
+  state = me.state(State)
+  if state.room_id or state.daily_date:
+    return
+  if not rounds.is_last_round(state.round_index):
+    rounds.prefetch(state.session_id, state.round_index + 1, state.board, prepare_next_round)
+
+
+def start_next_round():
+  """Switches to the next round and introduces it to the host in the current session."""
+  state = me.state(State)
+  next_round = rounds.take(state.session_id, state.round_index + 1, state.board, prepare_next_round)
+  state.round_index = next_round.index
+  state.board = next_round.board
+  state.answered_questions = set()
+  state.selected_question_key = ""
+  send_text_input(next_round.message)
+  prefetch_next_round()
+
+
+def tool_call_get_clue(category_index, dollar_index, use_clue_audio: bool = True) -> str:
   """Gets the selected clue.
 
   Gemini will parse the user request and make a tool call with the row/col indexes.
 
   Example: "Category X for $400".
+
+  If `use_clue_audio` is set, the cached audio of the clue is played, or the host's reading
+  is captured for the cache. See `update_clue_audio`.
   """
   cell_key = f"clue-{category_index}-{dollar_index}"
   response = handle_select_clue(cell_key)
 
   if isinstance(response, str):
-    return "There was an error. " + response
+    return _TOOL_CALL_ERROR + response
+
+  state = me.state(State)
+  if (
+    clue_audio_cache.is_enabled()
+    and use_clue_audio
+    and not state.audio_player_muted
+    and update_clue_audio(response)
+  ):
+    return f"The clue is {response.question}\n\n The answer to the clue is {response.answer}\n\n The clue has already been read to the user, so do not read it again. Wait for the user's response."
+
+  if state.clue_audio_capture:
+    # The audio of this turn is replayed to every player who selects the clue.
+    return f"The clue is {response.question}\n\n The answer to the clue is {response.answer}\n\n Read only the clue to the user, word for word. Do not say anything else in this response, such as the category, the value, the user's name or the score."
 
   return f"The clue is {response.question}\n\n The answer to the clue is {response.answer}\n\n Please read the clue to the user."
 
 
+def update_clue_audio(clue: Clue) -> bool:
+  """Plays the cached audio of the host reading the clue, or has the relay capture it.
+
+  Returns whether the audio was cached.
+  """
+  state = me.state(State)
+  key = clue_audio_cache.make_key(clue.question, trebek_bot.VOICE_NAME, trebek_bot.MODEL)
+  if clue_audio_cache.lookup(key):
+    state.clue_audio_url = f"/clue_audio/{key}"
+    state.clue_audio_cached = True
+  else:
+    state.clue_audio_capture = gemini_live_relay.capture_turn_audio(
+      state.gemini_live_relay_ticket, functools.partial(clue_audio_cache.store, key, clue.question)
+    )
+  return state.clue_audio_cached
+
+
 def handle_select_clue(clue_key: str) -> Clue | str:
   """Handles logic for clicking on a clue.
 
@@ -387,6 +1283,11 @@ def handle_select_clue(clue_key: str) -> Clue | str:
   If it returns a clue, that means a valid clue was selected.
   """
   state = me.state(State)
+  room = rooms.get(state.room_id)
+  if room is not None:
+    error = room.select_clue(clue_key)
+    return error or get_selected_question(state.board, clue_key)
+
   if state.selected_question_key:
     return "A clue has already been selected."
   if clue_key in state.answered_questions:
@@ -0,0 +1,362 @@
+"""Server-side metrics in the Prometheus text format.
+
+This is a small in-process implementation so we do not need another dependency. Each
+gunicorn worker keeps its own metrics, and the metrics are served at `/metrics` by
+`server.py`.
+
+Set `JEOPARDY_METRICS_STATE_SIZE_SAMPLE_EVERY` to control how often the serialized
+state size is measured. Serializing the state is the most expensive part of recording an
+event, so by default it is only measured for one in ten events.
+"""
+
+import bisect
+import functools
+import inspect
+import itertools
+import math
+import os
+import threading
+import time
+from typing import Any, Callable
+
+import mesop as me
+from mesop.dataclass_utils import serialize_dataclass
+
+
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_SIZE_BUCKETS = (1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144, 524288)
+# Must match the bucket bounds in `web_components/telemetry.js`.
+_CLIENT_DURATION_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+_CLIENT_VALUE_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+_CLIENT_COUNTERS = frozenset(
+  [
+    "ws_errors",
+    "player_underruns",
+    "recorder_frames_dropped_vad",
+    "recorder_frames_sent",
+    "prewarm_promoted",
+    "prewarm_expired",
+  ]
+)
+_CLIENT_DURATIONS = frozenset(
+  [
+    "ws_connect",
+    "setup_to_first_audio",
+    "setup_to_first_text",
+    "player_underrun_gap",
+    "recorder_frame_processing",
+    "prewarm_setup",
+  ]
+)
+_CLIENT_VALUES = frozenset(["player_queue_depth"])
+# Most a client can count or observe per metric in one batch. Batches are sent every 10
+# seconds, so this is far above what a real client records.
+_MAX_CLIENT_BATCH_AMOUNT = 100000
+# Largest plausible client duration (one hour) and value, to bound histogram sums.
+_MAX_CLIENT_DURATION_MS = 3600000
+_MAX_CLIENT_VALUE = 100000
+_STATE_SIZE_SAMPLE_EVERY = int(os.getenv("JEOPARDY_METRICS_STATE_SIZE_SAMPLE_EVERY", "10"))
+
+
+class _Metric:
+  type = ""
+
+  def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()):
+    self.name = name
+    self.documentation = documentation
+    self.label_names = label_names
+    self._lock = threading.Lock()
+    _REGISTRY.append(self)
+
+  def _labels_key(self, labels: dict[str, str]) -> tuple[str, ...]:
+    return tuple(str(labels[label_name]) for label_name in self.label_names)
+
+  def _format_labels(self, key: tuple[str, ...], extra: str = "") -> str:
+    labels = [
+      f'{name}="{_escape_label_value(value)}"' for name, value in zip(self.label_names, key)
+    ]
+    if extra:
+      labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+  def render(self) -> list[str]:
+    return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+  type = "counter"
+
+  def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()):
+    super().__init__(name, documentation, label_names)
+    self._values: dict[tuple[str, ...], float] = {}
+
+  def inc(self, amount: float = 1, **labels: str):
+    key = self._labels_key(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+  def render(self) -> list[str]:
+    lines = super().render()
+    with self._lock:
+      for key, value in self._values.items():
+        lines.append(f"{self.name}{self._format_labels(key)} {value}")
+    return lines
+
+
+class Gauge(Counter):
+  type = "gauge"
+
+  def dec(self, amount: float = 1, **labels: str):
+    self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+  type = "histogram"
+
+  def __init__(
+    self,
+    name: str,
+    documentation: str,
+    label_names: tuple[str, ...] = (),
+    buckets: tuple[float, ...] = _LATENCY_BUCKETS,
+  ):
+    super().__init__(name, documentation, label_names)
+    self._buckets = buckets
+    # Labels -> (count per bucket, sum, count). The last bucket is +Inf.
+    self._values: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+
+  def observe(self, value: float, **labels: str):
+    key = self._labels_key(labels)
+    with self._lock:
+      bucket_counts, total, count = self._values.get(key, ([0] * (len(self._buckets) + 1), 0, 0))
+      bucket_counts[bisect.bisect_left(self._buckets, value)] += 1
+      self._values[key] = (bucket_counts, total + value, count + 1)
+
+  def merge(self, bucket_counts: list[int], total: float, count: int, **labels: str):
+    """Merges observations that were already bucketed with the same bucket bounds."""
+    if len(bucket_counts) != len(self._buckets) + 1:
+      raise ValueError(f"Expected {len(self._buckets) + 1} buckets, got {len(bucket_counts)}")
+    key = self._labels_key(labels)
+    with self._lock:
+      current_bucket_counts, current_total, current_count = self._values.get(
+        key, ([0] * (len(self._buckets) + 1), 0, 0)
+      )
+      merged_bucket_counts = [a + b for a, b in zip(current_bucket_counts, bucket_counts)]
+      self._values[key] = (merged_bucket_counts, current_total + total, current_count + count)
+
+  def render(self) -> list[str]:
+    lines = super().render()
+    with self._lock:
+      for key, (bucket_counts, total, count) in self._values.items():
+        cumulative_count = 0
+        for bucket, bucket_count in zip((*self._buckets, "+Inf"), bucket_counts):
+          cumulative_count += bucket_count
+          labels = self._format_labels(key, f'le="{bucket}"')
+          lines.append(f"{self.name}_bucket{labels} {cumulative_count}")
+        lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+        lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+    return lines
+
+
+def _escape_label_value(value: str) -> str:
+  return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+_REGISTRY: list[_Metric] = []
+
+EVENT_DURATION = Histogram(
+  "jeopardy_event_duration_seconds", "Duration of Mesop event handlers.", ("handler",)
+)
+EVENT_ERRORS = Counter(
+  "jeopardy_event_errors_total", "Mesop event handlers that raised an error.", ("handler",)
+)
+STATE_SIZE = Histogram(
+  "jeopardy_state_size_bytes",
+  "Serialized state size after a Mesop event handler. Sampled.",
+  ("handler",),
+  buckets=_SIZE_BUCKETS,
+)
+TOOL_CALLS = Counter("jeopardy_tool_calls_total", "Gemini Live API tool calls.", ("name", "error"))
+ACTIVE_GAMES = Gauge("jeopardy_active_games", "Games with a running Gemini Live API session.")
+RELAY_SESSIONS = Counter(
+  "jeopardy_relay_sessions_total",
+  "Sessions bridged by the Gemini Live API relay, by whether the upstream session was "
+  "prepared, pooled or new.",
+  ("upstream",),
+)
+RELAY_ACTIVE_SESSIONS = Gauge(
+  "jeopardy_relay_active_sessions", "Sessions being bridged by the Gemini Live API relay."
+)
+RELAY_POOLED_CONNECTIONS = Gauge(
+  "jeopardy_relay_pooled_connections", "Idle upstream connections in the relay pools."
+)
+ROOMS = Gauge("jeopardy_rooms", "Multiplayer rooms with at least one player.")
+ACTIVE_SESSIONS = Gauge("jeopardy_active_sessions", "Sessions admitted by admission control.")
+ADMISSION_QUEUE_LENGTH = Gauge("jeopardy_admission_queue_length", "Sessions waiting for admission.")
+ADMISSION_QUEUED = Counter(
+  "jeopardy_admission_queued_total", "Sessions that had to wait for admission."
+)
+ADMISSION_REJECTED = Counter(
+  "jeopardy_admission_rejected_total", "Sessions that were not admitted.", ("reason",)
+)
+ADMISSION_WAIT = Histogram(
+  "jeopardy_admission_wait_seconds",
+  "Time queued sessions waited before they were admitted or gave up.",
+  buckets=(1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+CLUE_AUDIO_CACHE_LOOKUPS = Counter(
+  "jeopardy_clue_audio_cache_lookups_total", "Clue audio cache lookups.", ("result",)
+)
+CLUE_AUDIO_CAPTURES = Counter(
+  "jeopardy_clue_audio_captures_total",
+  "Captured clue readings, by whether they were stored or rejected as longer than reading "
+  "the clue.",
+  ("result",),
+)
+ROUND_PREFETCHES = Counter(
+  "jeopardy_round_prefetches_total",
+  "Rounds started, by whether the round was ready, still being prepared or not prepared.",
+  ("result",),
+)
+SCORE_STORE_WRITES = Counter(
+  "jeopardy_score_store_writes_total", "Game scores written to the score store."
+)
+SCORE_STORE_DROPPED = Counter(
+  "jeopardy_score_store_dropped_total", "Game scores dropped because the write queue was full."
+)
+SCORE_STORE_WRITE_DURATION = Histogram(
+  "jeopardy_score_store_write_duration_seconds", "Duration of score store write batches."
+)
+QUESTION_BANK_LOAD_DURATION = Histogram(
+  "jeopardy_question_bank_load_duration_seconds",
+  "Duration of question bank loads.",
+  ("loader",),
+  buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+CLIENT_EVENTS = Counter(
+  "jeopardy_client_events_total", "Events counted by the web components.", ("name",)
+)
+CLIENT_DURATION = Histogram(
+  "jeopardy_client_duration_seconds",
+  "Durations measured by the web components.",
+  ("name",),
+  buckets=tuple(bucket / 1000 for bucket in _CLIENT_DURATION_BUCKETS_MS),
+)
+CLIENT_VALUE = Histogram(
+  "jeopardy_client_value",
+  "Values sampled by the web components, such as the audio player queue depth.",
+  ("name",),
+  buckets=_CLIENT_VALUE_BUCKETS,
+)
+
+
+def render() -> str:
+  """Renders all metrics in the Prometheus text format."""
+  lines = []
+  for metric in _REGISTRY:
+    lines.extend(metric.render())
+  return "\n".join(lines) + "\n"
+
+
+def record_client_batch(batch: dict[str, Any]):
+  """Records a batch of client telemetry sent by `web_components/telemetry.js`.
+
+  Unknown metric names are ignored, so clients cannot create arbitrary labels. The batch
+  is validated before anything is recorded, and raises ValueError if any amount is
+  negative, not finite or too large, or a histogram does not match its buckets.
+  """
+  counters = [
+    (name, _parse_client_amount(amount))
+    for name, amount in batch.get("counters", {}).items()
+    if name in _CLIENT_COUNTERS
+  ]
+  durations = [
+    (name, _parse_client_histogram(histogram, CLIENT_DURATION, _MAX_CLIENT_DURATION_MS))
+    for name, histogram in batch.get("durations", {}).items()
+    if name in _CLIENT_DURATIONS
+  ]
+  values = [
+    (name, _parse_client_histogram(histogram, CLIENT_VALUE, _MAX_CLIENT_VALUE))
+    for name, histogram in batch.get("values", {}).items()
+    if name in _CLIENT_VALUES
+  ]
+
+  for name, amount in counters:
+    CLIENT_EVENTS.inc(amount, name=name)
+  for name, (bucket_counts, total, count) in durations:
+    CLIENT_DURATION.merge(bucket_counts, total / 1000, count, name=name)
+  for name, (bucket_counts, total, count) in values:
+    CLIENT_VALUE.merge(bucket_counts, total, count, name=name)
+
+
+def _parse_client_amount(amount: Any) -> float:
+  amount = float(amount)
+  if not math.isfinite(amount) or not 0 <= amount <= _MAX_CLIENT_BATCH_AMOUNT:
+    raise ValueError(f"Invalid client telemetry amount: {amount}")
+  return amount
+
+
+def _parse_client_histogram(
+  histogram: dict[str, Any], metric: Histogram, max_value: float
+) -> tuple[list[int], float, int]:
+  """Parses bucket counts, sum and count, which must add up to plausible values."""
+  bucket_counts = histogram["buckets"]
+  if not isinstance(bucket_counts, list) or len(bucket_counts) != len(metric._buckets) + 1:
+    raise ValueError("Client telemetry histogram does not match the bucket bounds")
+  bucket_counts = [int(_parse_client_amount(bucket_count)) for bucket_count in bucket_counts]
+  count = int(_parse_client_amount(histogram["count"]))
+  if count != sum(bucket_counts):
+    raise ValueError("Client telemetry histogram count does not match its buckets")
+  total = float(histogram["sum"])
+  if not math.isfinite(total) or not 0 <= total <= count * max_value:
+    raise ValueError(f"Invalid client telemetry histogram sum: {total}")
+  return bucket_counts, total, count
+
+
+def instrument_event(state_class: type) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+  """Records the duration and state size of a Mesop event handler.
+
+  Works with generator event handlers. The duration includes the time between yields.
+
+  Args:
+    state_class: Mesop state class to measure the serialized size of.
+  """
+  event_counter = itertools.count()
+
+  def record(handler_name: str, start_time: float):
+    EVENT_DURATION.observe(time.perf_counter() - start_time, handler=handler_name)
+    if next(event_counter) % _STATE_SIZE_SAMPLE_EVERY == 0:
+      state_size = len(serialize_dataclass(me.state(state_class)))
+      STATE_SIZE.observe(state_size, handler=handler_name)
+
+  def decorator(handler: Callable[..., Any]) -> Callable[..., Any]:
+    handler_name = handler.__name__
+
+    if inspect.isgeneratorfunction(handler):
+
+      @functools.wraps(handler)
+      def generator_wrapper(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+          yield from handler(*args, **kwargs)
+        except Exception:
+          EVENT_ERRORS.inc(handler=handler_name)
+          raise
+        record(handler_name, start_time)
+
+      return generator_wrapper
+
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+      start_time = time.perf_counter()
+      try:
+        result = handler(*args, **kwargs)
+      except Exception:
+        EVENT_ERRORS.inc(handler=handler_name)
+        raise
+      record(handler_name, start_time)
+      return result
+
+    return wrapper
+
+  return decorator
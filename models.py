@@ -15,3 +15,5 @@ class Clue(BaseModel):
 
 class Board(BaseModel):
   clues: list[list[Clue]]
+  # IDs of the question sets in the question bank, so the board can be rebuilt from them.
+  set_ids: list[int] = []
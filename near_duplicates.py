@@ -0,0 +1,224 @@
+"""Near-duplicate clue detection with MinHash and locality-sensitive hashing (LSH).
+
+Each clue is represented by the set of word unigrams and bigrams of its text and
+answer. Clues with a Jaccard similarity of at least `threshold` are near-duplicates.
+
+MinHash signatures are computed with one permutation hashing: the shingle hashes are
+split into bins by their remainder and the minimum of each bin is a signature value.
+Empty bins borrow the value of the next non-empty bin. This only needs one pass over the
+shingles instead of one per signature value.
+
+The signature is split into bands. Clues that share all the values of any band are
+candidates, and candidates are checked with the exact Jaccard similarity, so there are
+no false positives. The default banding finds 98% of the pairs with a
+similarity of 0.8.
+
+The band hashes of a clue can be computed ahead of time with `band_hashes` and passed to
+`add`, `query` and `remove`, so callers can cache them and keep an index up to date as
+clues change. The shingles of a queried clue are then only computed when there are
+candidates to check.
+
+Shingles are hashed with CRC-32 rather than Python's string hash, which is randomized
+per process, so every process finds the same near-duplicates in the same data set.
+"""
+
+import random
+import re
+import zlib
+from typing import Hashable, Iterable, Sequence
+
+_DEFAULT_THRESHOLD = 0.8
+_DEFAULT_NUM_BANDS = 6
+_DEFAULT_ROWS_PER_BAND = 3
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+_TAG_PATTERN = re.compile(r"<[^<]+?>")
+_ANSWER_PREFIX = "answer:"
+
+
+class NearDuplicateIndex:
+  """Index of clues that can be queried for near-duplicates."""
+
+  def __init__(
+    self,
+    threshold: float = _DEFAULT_THRESHOLD,
+    num_bands: int = _DEFAULT_NUM_BANDS,
+    rows_per_band: int = _DEFAULT_ROWS_PER_BAND,
+  ):
+    self.threshold = threshold
+    self._num_bands = num_bands
+    self._rows_per_band = rows_per_band
+    # One dict per band: band hash -> key, or list of keys once several clues share it.
+    self._bands: list[dict[int, Hashable | list[Hashable]]] = [{} for _ in range(num_bands)]
+    # The text is kept to check candidates. The strings are usually shared with the
+    # data set, so this does not use much memory.
+    self._clues: dict[Hashable, tuple[str, str]] = {}
+
+  def __len__(self) -> int:
+    return len(self._clues)
+
+  def add(
+    self, key: Hashable, clue: str, answer: str, clue_band_hashes: Sequence[int] | None = None
+  ):
+    """Adds a clue to the index. Keys must be unique.
+
+    Args:
+      clue_band_hashes: Band hashes of the clue from `band_hashes`, if already computed.
+    """
+    if clue_band_hashes is None:
+      clue_band_hashes = self._band_hashes(_shingles(clue, answer))
+    self._add(key, clue, answer, clue_band_hashes)
+
+  def remove(self, key: Hashable, clue_band_hashes: Sequence[int]):
+    """Removes a clue that was added with the given band hashes."""
+    del self._clues[key]
+    for band, band_hash in zip(self._bands, clue_band_hashes):
+      bucket = band[band_hash]
+      if not isinstance(bucket, list):
+        del band[band_hash]
+        continue
+      bucket.remove(key)
+      if len(bucket) == 1:
+        band[band_hash] = bucket[0]
+
+  def query(
+    self, clue: str, answer: str, clue_band_hashes: Sequence[int] | None = None
+  ) -> list[Hashable]:
+    """Returns the keys of the indexed clues that are near-duplicates of the clue.
+
+    Args:
+      clue_band_hashes: Band hashes of the clue from `band_hashes`, if already computed.
+    """
+    shingles = None
+    if clue_band_hashes is None:
+      shingles = _shingles(clue, answer)
+      clue_band_hashes = self._band_hashes(shingles)
+    return self._query(clue, answer, shingles, clue_band_hashes)
+
+  def add_if_unique(self, key: Hashable, clue: str, answer: str) -> Hashable | None:
+    """Adds the clue unless it is a near-duplicate.
+
+    Returns:
+      The key of a near-duplicate, or None if the clue was added.
+    """
+    shingles = _shingles(clue, answer)
+    clue_band_hashes = self._band_hashes(shingles)
+    duplicates = self._query(clue, answer, shingles, clue_band_hashes)
+    if duplicates:
+      return duplicates[0]
+    self._add(key, clue, answer, clue_band_hashes)
+    return None
+
+  def _add(self, key: Hashable, clue: str, answer: str, clue_band_hashes: Sequence[int]):
+    self._clues[key] = (clue, answer)
+    for band, band_hash in zip(self._bands, clue_band_hashes):
+      bucket = band.get(band_hash)
+      if bucket is None:
+        band[band_hash] = key
+      elif isinstance(bucket, list):
+        bucket.append(key)
+      else:
+        band[band_hash] = [bucket, key]
+
+  def _query(
+    self,
+    clue: str,
+    answer: str,
+    shingles: set[int] | None,
+    clue_band_hashes: Sequence[int],
+  ) -> list[Hashable]:
+    candidates = {}
+    for band, band_hash in zip(self._bands, clue_band_hashes):
+      bucket = band.get(band_hash)
+      if bucket is None:
+        continue
+      for key in bucket if isinstance(bucket, list) else (bucket,):
+        candidates[key] = None
+    if not candidates:
+      return []
+
+    if shingles is None:
+      shingles = _shingles(clue, answer)
+    return [
+      key
+      for key in candidates
+      if _jaccard(shingles, _shingles(*self._clues[key])) >= self.threshold
+    ]
+
+  def _band_hashes(self, shingles: set[int]) -> list[int]:
+    return _band_hashes(shingles, self._num_bands, self._rows_per_band)
+
+
+def band_hashes(
+  clue: str,
+  answer: str,
+  num_bands: int = _DEFAULT_NUM_BANDS,
+  rows_per_band: int = _DEFAULT_ROWS_PER_BAND,
+) -> list[int]:
+  """Computes the band hashes of a clue for an index with the same banding."""
+  return _band_hashes(_shingles(clue, answer), num_bands, rows_per_band)
+
+
+def find_near_duplicates(
+  clues: Iterable[tuple[Hashable, str, str]], threshold: float = _DEFAULT_THRESHOLD
+) -> dict[Hashable, Hashable]:
+  """Finds near-duplicate clues in a batch.
+
+  Args:
+    clues: (key, clue, answer) tuples.
+    threshold: Minimum Jaccard similarity of near-duplicates.
+
+  Returns:
+    Mapping of the key of each near-duplicate to the key of an earlier clue it
+    duplicates. The first occurrence of a clue is not included.
+  """
+  index = NearDuplicateIndex(threshold)
+  duplicates = {}
+  for key, clue, answer in clues:
+    duplicate_key = index.add_if_unique(key, clue, answer)
+    if duplicate_key is not None:
+      duplicates[key] = duplicate_key
+  return duplicates
+
+
+def _band_hashes(shingles: set[int], num_bands: int, rows_per_band: int) -> list[int]:
+  if not shingles:
+    # Empty clues cannot be compared, so give them a signature no other clue has. Like
+    # the other band hashes, it fits in a signed 64-bit integer.
+    return [random.getrandbits(63) for _ in range(num_bands)]
+  num_bins = num_bands * rows_per_band
+  # Iterating from the largest hash leaves the minimum of each bin.
+  bin_minimums = {value % num_bins: value for value in sorted(shingles, reverse=True)}
+  signature = list(map(bin_minimums.get, range(num_bins)))
+  if len(bin_minimums) < num_bins:
+    for index in range(num_bins):
+      distance = 1
+      while signature[index] is None:
+        value = bin_minimums.get((index + distance) % num_bins)
+        if value is not None:
+          signature[index] = (value, distance)
+        distance += 1
+  # Group the signature into bands of consecutive values.
+  return list(map(hash, zip(*[iter(signature)] * rows_per_band)))
+
+
+def _shingles(clue: str, answer: str) -> set[int]:
+  if "<" in clue:
+    clue = _TAG_PATTERN.sub(" ", clue)
+  words = _WORD_PATTERN.findall(clue.lower())
+  shingles = set(map(_hash, words))
+  shingles.update(map(_hash, map(" ".join, zip(words, words[1:]))))
+  # Prefix answer words so they do not match the same words in a clue.
+  shingles.update(map(_hash, map(_ANSWER_PREFIX.__add__, _WORD_PATTERN.findall(answer.lower()))))
+  return shingles
+
+
+def _hash(shingle: str) -> int:
+  # Shingles only contain ASCII letters, digits, spaces and the answer prefix.
+  return zlib.crc32(shingle.encode("ascii"))
+
+
+def _jaccard(a: set[int], b: set[int]) -> float:
+  if not a or not b:
+    return 0.0
+  intersection = len(a & b)
+  return intersection / (len(a) + len(b) - intersection)
@@ -0,0 +1,206 @@
+"""Opt-in profiling of the page render and Mesop event handlers.
+
+Profiling is enabled by setting `JEOPARDY_PROFILE_DIR`. When it is not set, the
+decorators return the functions unchanged, so there is no overhead.
+
+A sample of calls (`JEOPARDY_PROFILE_SAMPLE_RATE`, default 0.1) is profiled with
+cProfile and tracemalloc. Calls slower than `JEOPARDY_PROFILE_SLOW_MS` (default 50) are
+written to the profile directory:
+
+- `<timestamp>-<name>.prof`: cProfile stats that can be opened with pstats or snakeviz.
+- `<timestamp>-<name>.json`: Duration, peak allocated memory, the size of the state
+  diff for each `State` field, and the top functions by cumulative time.
+
+Only the newest `JEOPARDY_PROFILE_MAX_FILES` (default 200) files are kept.
+
+Only one call is profiled at a time in each process, since cProfile on Python 3.12 and
+tracemalloc are process-wide. Calls that would be sampled while another call is being
+profiled are not profiled. The profiles and peak memory still include the work that
+other threads do at the same time.
+"""
+
+import cProfile
+import dataclasses
+import functools
+import inspect
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable
+
+import mesop as me
+
+# Mesop does not export the encoder it uses to serialize state.
+from mesop.dataclass_utils.dataclass_utils import MesopJSONEncoder
+
+
+_PROFILE_DIR = os.getenv("JEOPARDY_PROFILE_DIR", "")
+_SAMPLE_RATE = float(os.getenv("JEOPARDY_PROFILE_SAMPLE_RATE", "0.1"))
+_SLOW_MS = float(os.getenv("JEOPARDY_PROFILE_SLOW_MS", "50"))
+_MAX_FILES = int(os.getenv("JEOPARDY_PROFILE_MAX_FILES", "200"))
+_NUM_TOP_FUNCTIONS = 30
+
+# Held while a call is profiled. Only one profiler can be active per process.
+_profile_lock = threading.Lock()
+_write_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+  return bool(_PROFILE_DIR)
+
+
+def profile(state_class: type) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+  """Profiles a sample of calls to the page function or a Mesop event handler.
+
+  Works with generator event handlers.
+
+  Args:
+    state_class: Mesop state class to attribute the state diff size to.
+  """
+
+  def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+    if not is_enabled():
+      return fn
+
+    name = fn.__name__
+
+    if inspect.isgeneratorfunction(fn):
+
+      @functools.wraps(fn)
+      def generator_wrapper(*args, **kwargs):
+        if not _should_profile():
+          yield from fn(*args, **kwargs)
+          return
+        session = _ProfileSession(name, state_class)
+        try:
+          iterator = fn(*args, **kwargs)
+          while True:
+            # Only profile the handler, not the rendering between yields.
+            with session:
+              try:
+                next(iterator)
+              except StopIteration:
+                break
+            yield
+        finally:
+          session.finish()
+
+      return generator_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+      if not _should_profile():
+        return fn(*args, **kwargs)
+      session = _ProfileSession(name, state_class)
+      try:
+        with session:
+          return fn(*args, **kwargs)
+      finally:
+        session.finish()
+
+    return wrapper
+
+  return decorator
+
+
+def _should_profile() -> bool:
+  return not _profile_lock.locked() and random.random() < _SAMPLE_RATE
+
+
+class _ProfileSession:
+  """Profiles one call, which may be split across several yields.
+
+  Each part of the call between yields is only profiled if no other call is being
+  profiled at the time.
+  """
+
+  def __init__(self, name: str, state_class: type):
+    self.name = name
+    self.state_class = state_class
+    self.profiler = cProfile.Profile()
+    self.duration = 0.0
+    self.peak_memory = 0
+    self.num_skipped_steps = 0
+    self.state_before = _serialize_fields(me.state(state_class))
+    self._profiling = False
+
+  def __enter__(self):
+    self._profiling = _profile_lock.acquire(blocking=False)
+    if not self._profiling:
+      self.num_skipped_steps += 1
+      return
+    if not tracemalloc.is_tracing():
+      tracemalloc.start()
+    tracemalloc.reset_peak()
+    self.memory_before = tracemalloc.get_traced_memory()[0]
+    self.start_time = time.perf_counter()
+    self.profiler.enable()
+
+  def __exit__(self, *exc_info):
+    if not self._profiling:
+      return
+    try:
+      self.profiler.disable()
+      self.duration += time.perf_counter() - self.start_time
+      self.peak_memory = max(
+        self.peak_memory, tracemalloc.get_traced_memory()[1] - self.memory_before
+      )
+    finally:
+      self._profiling = False
+      _profile_lock.release()
+
+  def finish(self):
+    duration_ms = self.duration * 1000
+    if duration_ms < _SLOW_MS:
+      return
+
+    state_after = _serialize_fields(me.state(self.state_class))
+    state_diff_bytes = {
+      field: len(value)
+      for field, value in state_after.items()
+      if value != self.state_before.get(field)
+    }
+
+    stats_output = io.StringIO()
+    stats = pstats.Stats(self.profiler, stream=stats_output)
+    stats.sort_stats("cumulative").print_stats(_NUM_TOP_FUNCTIONS)
+
+    file_prefix = os.path.join(_PROFILE_DIR, f"{time.time_ns()}-{self.name}")
+    with _write_lock:
+      os.makedirs(_PROFILE_DIR, exist_ok=True)
+      stats.dump_stats(file_prefix + ".prof")
+      with open(file_prefix + ".json", "w") as f:
+        json.dump(
+          {
+            "name": self.name,
+            "duration_ms": duration_ms,
+            "peak_memory_bytes": self.peak_memory,
+            # Parts of the call between yields that were not profiled.
+            "num_skipped_steps": self.num_skipped_steps,
+            "state_diff_bytes": state_diff_bytes,
+            "top_functions": stats_output.getvalue().splitlines(),
+          },
+          f,
+          indent=2,
+        )
+      _rotate_profiles()
+
+
+def _serialize_fields(state: Any) -> dict[str, str]:
+  """Serializes each state field separately, so diffs can be attributed to fields."""
+  return {
+    field.name: json.dumps(getattr(state, field.name), cls=MesopJSONEncoder)
+    for field in dataclasses.fields(state)
+  }
+
+
+def _rotate_profiles():
+  """Deletes the oldest profiles so at most `_MAX_FILES` files are kept."""
+  file_names = sorted(os.listdir(_PROFILE_DIR))
+  for file_name in file_names[: max(0, len(file_names) - _MAX_FILES)]:
+    os.remove(os.path.join(_PROFILE_DIR, file_name))
@@ -1,8 +1,12 @@
+import array
+import hashlib
 import json
 import os
+import random
 import re
 from collections import defaultdict
 
+import near_duplicates
 from models import Clue
 
 
@@ -10,22 +14,156 @@ QuestionSet = list[Clue]
 
 _DEFAULT_JEOPARDY_DATASET_PATH = "data/jeopardy.json"
 _NUM_QUESTIONS_PER_CATEGORY = 5
+# Question sets with a clue that is a near-duplicate of a clue in an earlier question set
+# are removed if this is set, such as to 0.8. Off by default, since it makes loading a few
+# times slower and `scripts/generate_clues.py` already skips near-duplicates.
+_NEAR_DUPLICATE_THRESHOLD = float(os.getenv("JEOPARDY_NEAR_DUPLICATE_THRESHOLD", "0"))
 
 
-def load() -> list[QuestionSet]:
-  """Loads a cleaned up data set to use in Mesop Jeopardy game."""
-  data = _load_raw_data()
+class QuestionBank:
+  """Question bank that keeps every question set in memory.
+
+  Question set IDs are the indexes of the question sets returned by `load`.
+  """
+
+  def __init__(self, question_sets: list[QuestionSet]):
+    self._question_sets = question_sets
+
+  def __len__(self) -> int:
+    return len(self._question_sets)
+
+  def get(self, set_id: int) -> QuestionSet:
+    return self._question_sets[set_id]
+
+  def sample(self, num_sets: int) -> list[QuestionSet]:
+    return [self.get(set_id) for set_id in self.sample_ids(num_sets)]
+
+  def sample_ids(self, num_sets: int) -> list[int]:
+    return random.sample(range(len(self)), num_sets)
+
+
+def load(file_path: str | None = None) -> list[QuestionSet]:
+  """Loads a cleaned up data set to use in Mesop Jeopardy game.
+
+  Args:
+    file_path: Dataset to load. Defaults to the `JEOPARDY_DATASET_PATH` dataset.
+  """
+  data = _load_raw_data(file_path or dataset_path())
   data = _add_raw_value(data)
   data = _clean_questions(data)
   question_sets = _group_into_question_sets(data)
   question_sets = _sort_question_sets(question_sets)
   question_sets = _normalize_values(question_sets)
-  return _filter_out_incomplete_question_sets(question_sets)
+  question_sets = _filter_out_incomplete_question_sets(question_sets)
+  return _filter_out_near_duplicate_question_sets(question_sets)
+
 
+class IncrementalLoader:
+  """Loads the data set, reprocessing only the question sets that changed.
 
-def _load_raw_data() -> QuestionSet:
+  Question sets are grouped by category and air date. Each group of raw rows is hashed,
+  and groups with the same hash as the previous load reuse the previously processed
+  question set.
+
+  The near-duplicate index is also kept between loads, with the clues of every complete
+  question set, and only the changed groups are removed from it and added again. Like
+  `load`, a question set is filtered out if it has a near-duplicate clue in an earlier
+  question set that is kept.
+  """
+
+  def __init__(self, file_path: str):
+    self._file_path = file_path
+    # (category, air_date) -> (digest of raw rows, processed question set or None,
+    # band hashes of its clues or None)
+    self._groups: dict[tuple[str, str], tuple[str, QuestionSet | None, array.array | None]] = {}
+    # Keyed by ((category, air_date), clue index).
+    self._near_duplicate_index = near_duplicates.NearDuplicateIndex(_NEAR_DUPLICATE_THRESHOLD)
+    # (category, air_date) -> the other groups with a near-duplicate clue
+    self._near_duplicate_groups: dict[tuple[str, str], set[tuple[str, str]]] = {}
+
+  def load(self) -> list[QuestionSet]:
+    rows = _read_rows(self._file_path)
+
+    raw_groups = defaultdict(lambda: [])
+    for row in rows:
+      raw_groups[(row["category"], row["air_date"])].append(row)
+
+    groups = {}
+    for key, raw_group in raw_groups.items():
+      digest = hashlib.sha1(json.dumps(raw_group, sort_keys=True).encode("utf-8")).hexdigest()
+      cached_group = self._groups.get(key)
+      if cached_group and cached_group[0] == digest:
+        groups[key] = cached_group
+      else:
+        question_set = _process_question_set([Clue(**row) for row in raw_group])
+        set_band_hashes = None
+        if question_set is not None and _NEAR_DUPLICATE_THRESHOLD:
+          set_band_hashes = _question_set_band_hashes(question_set)
+        groups[key] = (digest, question_set, set_band_hashes)
+
+    if _NEAR_DUPLICATE_THRESHOLD:
+      self._update_near_duplicates(groups)
+    # Only replace the cache once the whole data set has been processed, so a failed
+    # load does not leave the cache half updated.
+    self._groups = groups
+
+    question_sets = []
+    # Group key -> whether the question set is kept, for groups with near-duplicates.
+    # Later groups are not decided yet, so they are not in it.
+    kept_groups = {}
+    for key, (_, question_set, _) in groups.items():
+      if question_set is None:
+        continue
+      near_duplicate_groups = self._near_duplicate_groups.get(key)
+      if near_duplicate_groups:
+        kept_groups[key] = not any(map(kept_groups.get, near_duplicate_groups))
+        if not kept_groups[key]:
+          continue
+      question_sets.append(question_set)
+    return question_sets
+
+  def _update_near_duplicates(self, groups: dict):
+    """Replaces the clues of the groups that changed since the last load in the index."""
+    for key, group in self._groups.items():
+      _, question_set, set_band_hashes = group
+      if question_set is None or groups.get(key) is group:
+        continue
+      for clue_index, clue_band_hashes in enumerate(
+        _split_band_hashes(set_band_hashes, len(question_set))
+      ):
+        self._near_duplicate_index.remove((key, clue_index), clue_band_hashes)
+      for other_key in self._near_duplicate_groups.pop(key, ()):
+        other_near_duplicate_groups = self._near_duplicate_groups[other_key]
+        other_near_duplicate_groups.discard(key)
+        if not other_near_duplicate_groups:
+          del self._near_duplicate_groups[other_key]
+
+    for key, group in groups.items():
+      _, question_set, set_band_hashes = group
+      if question_set is None or self._groups.get(key) is group:
+        continue
+      clue_band_hashes = _split_band_hashes(set_band_hashes, len(question_set))
+      # Query every clue before adding any, so clues in the same question set are not
+      # near-duplicates of each other.
+      for clue, hashes in zip(question_set, clue_band_hashes):
+        for other_key, _ in self._near_duplicate_index.query(clue.question, clue.answer, hashes):
+          self._near_duplicate_groups.setdefault(key, set()).add(other_key)
+          self._near_duplicate_groups.setdefault(other_key, set()).add(key)
+      for clue_index, (clue, hashes) in enumerate(zip(question_set, clue_band_hashes)):
+        self._near_duplicate_index.add((key, clue_index), clue.question, clue.answer, hashes)
+
+
+def dataset_path() -> str:
+  """Path to the Jeopardy dataset file."""
+  return os.getenv("JEOPARDY_DATASET_PATH", _DEFAULT_JEOPARDY_DATASET_PATH)
+
+
+def _load_raw_data(file_path: str) -> QuestionSet:
   """Load the raw data set.
 
+  The data set is either a JSON array of questions or a JSONL file with one question
+  per line.
+
   Format of each question/clue looks like this:
 
   {
@@ -38,9 +176,38 @@ def _load_raw_data() -> QuestionSet:
     "show_number": "4680"
   }
   """
-  file_path = os.getenv("JEOPARDY_DATASET_PATH", _DEFAULT_JEOPARDY_DATASET_PATH)
+  return [Clue(**row) for row in _read_rows(file_path)]
+
+
+def _read_rows(file_path: str) -> list[dict]:
+  """Reads the rows of a JSON array or JSONL data set."""
   with open(file_path, "r") as f:
-    return [Clue(**row) for row in json.load(f)]
+    data = f.read()
+
+  if data.lstrip()[:1] == "[":
+    return json.loads(data)
+
+  lines = data.splitlines()
+  rows = []
+  for line_number, line in enumerate(lines, 1):
+    if not line.strip():
+      continue
+    try:
+      rows.append(json.loads(line))
+    except json.JSONDecodeError:
+      # JSONL data sets are appended to, so a crash can leave a partial last line.
+      if line_number == len(lines) and not data.endswith("\n"):
+        break
+      raise
+  return rows
+
+
+def _process_question_set(question_set: QuestionSet) -> QuestionSet | None:
+  """Processes a single question set like `load`. Returns None if it is incomplete."""
+  question_set = _clean_questions(_add_raw_value(question_set))
+  question_set = _normalize_values([_sort_question_set(question_set)])
+  filtered_question_sets = _filter_out_incomplete_question_sets(question_set)
+  return filtered_question_sets[0] if filtered_question_sets else None
 
 
 def _add_raw_value(data: QuestionSet) -> QuestionSet:
@@ -132,3 +299,41 @@ def _filter_out_incomplete_question_sets(question_sets: list[QuestionSet]) -> li
     for question_set in question_sets
     if len(question_set) == _NUM_QUESTIONS_PER_CATEGORY
   ]
+
+
+def _filter_out_near_duplicate_question_sets(
+  question_sets: list[QuestionSet],
+) -> list[QuestionSet]:
+  """Filter out question sets with a clue that duplicates a clue in an earlier set.
+
+  Whole question sets are removed so every question set stays complete.
+  """
+  if not _NEAR_DUPLICATE_THRESHOLD:
+    return question_sets
+
+  index = near_duplicates.NearDuplicateIndex(_NEAR_DUPLICATE_THRESHOLD)
+  filtered_question_sets = []
+  for set_index, question_set in enumerate(question_sets):
+    if any(index.query(clue.question, clue.answer) for clue in question_set):
+      continue
+    for clue_index, clue in enumerate(question_set):
+      index.add((set_index, clue_index), clue.question, clue.answer)
+    filtered_question_sets.append(question_set)
+  return filtered_question_sets
+
+
+def _question_set_band_hashes(question_set: QuestionSet) -> array.array:
+  """Band hashes of the clues of a question set, packed one clue after another."""
+  set_band_hashes = array.array("q")
+  for clue in question_set:
+    set_band_hashes.extend(near_duplicates.band_hashes(clue.question, clue.answer))
+  return set_band_hashes
+
+
+def _split_band_hashes(set_band_hashes: array.array, num_clues: int) -> list[array.array]:
+  """Splits the packed band hashes of a question set into the band hashes of each clue."""
+  num_bands = len(set_band_hashes) // num_clues
+  return [
+    set_band_hashes[start : start + num_bands]
+    for start in range(0, len(set_band_hashes), num_bands)
+  ]
@@ -0,0 +1,198 @@
+"""Loads the question bank in the background.
+
+Loading the full dataset can take a while, so it is loaded on a background thread
+instead of at import time. Until the full question bank is ready, boards are created
+from the small bundled sample dataset.
+
+After loading, the dataset file is watched for changes. Changed question sets are
+reprocessed and the new question bank is swapped in atomically. Boards in running
+sessions are stored in their state, so they are not affected. Sharded question banks
+are rebuilt from the changed dataset and the new build is swapped in the same way.
+
+Set `JEOPARDY_SHARED_BANK=true` to share one memory-mapped question bank between all
+gunicorn workers (see `question_shards`). The first worker to load builds the shards in
+its loader thread, while the other workers wait for the build. The shards are built in
+`JEOPARDY_SHARD_DIR`, or in a temporary directory if it is not set. If the shards cannot
+be built or opened, each worker loads the dataset into memory instead.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Callable
+
+import metrics
+import question_bank
+import question_shards
+
+
+logger = logging.getLogger(__name__)
+
+_FALLBACK_DATASET_PATH = os.path.join(
+  os.path.dirname(os.path.abspath(__file__)), "sample_data", "custom_jeopardy.json"
+)
+_DEFAULT_MAX_RESIDENT_SHARDS = "16"
+_DEFAULT_RELOAD_INTERVAL_SECONDS = "5"
+
+_lock = threading.Lock()
+_ready = threading.Event()
+_thread: threading.Thread | None = None
+_bank: question_bank.QuestionBank | question_shards.ShardedQuestionBank | None = None
+_fallback_bank: question_bank.QuestionBank | None = None
+_error = ""
+
+
+def start():
+  """Starts loading the question bank on a background thread.
+
+  Calling this more than once has no effect.
+  """
+  global _thread
+  with _lock:
+    if _thread is not None:
+      return
+    _thread = threading.Thread(target=_load, name="question-bank-loader", daemon=True)
+    _thread.start()
+
+
+def is_ready() -> bool:
+  """Whether the full question bank has been loaded."""
+  return _ready.is_set()
+
+
+def wait(timeout: float | None = None) -> bool:
+  """Waits for the full question bank to load. Returns whether it is ready."""
+  return _ready.wait(timeout)
+
+
+def status() -> dict:
+  """Status of the question bank for health checks."""
+  return {
+    "ready": is_ready(),
+    "num_question_sets": len(_bank) if _bank is not None else 0,
+    "error": _error,
+  }
+
+
+def current() -> question_bank.QuestionBank | question_shards.ShardedQuestionBank:
+  """Gets the full question bank if it is ready. Otherwise gets the fallback bank."""
+  if _bank is not None:
+    return _bank
+  return _get_fallback_bank()
+
+
+def _get_fallback_bank() -> question_bank.QuestionBank:
+  global _fallback_bank
+  with _lock:
+    if _fallback_bank is None:
+      start_time = time.perf_counter()
+      _fallback_bank = question_bank.QuestionBank(question_bank.load(_FALLBACK_DATASET_PATH))
+      metrics.QUESTION_BANK_LOAD_DURATION.observe(
+        time.perf_counter() - start_time, loader="fallback"
+      )
+    return _fallback_bank
+
+
+def _load():
+  global _bank, _error
+  dataset_path = question_bank.dataset_path()
+  shard_dir = _get_shard_dir()
+  if shard_dir:
+    try:
+      dataset_signature = _get_file_signature(dataset_path)
+      start_time = time.perf_counter()
+      _bank = _open_shards(shard_dir)
+      metrics.QUESTION_BANK_LOAD_DURATION.observe(time.perf_counter() - start_time, loader="shards")
+      _ready.set()
+    except Exception:
+      logger.exception("Failed to prepare sharded question bank, loading the dataset instead")
+    else:
+      _watch_dataset(dataset_path, dataset_signature, lambda: _open_shards(shard_dir), "shards")
+      return
+
+  try:
+    dataset_signature = _get_file_signature(dataset_path)
+    loader = question_bank.IncrementalLoader(dataset_path)
+    start_time = time.perf_counter()
+    _bank = question_bank.QuestionBank(loader.load())
+    metrics.QUESTION_BANK_LOAD_DURATION.observe(time.perf_counter() - start_time, loader="full")
+    _ready.set()
+  except Exception as e:
+    # Keep serving boards from the fallback bank. The error is reported in the status.
+    logger.exception("Failed to load question bank")
+    _error = str(e)
+    return
+
+  _watch_dataset(
+    dataset_path,
+    dataset_signature,
+    lambda: question_bank.QuestionBank(loader.load()),
+    "incremental",
+  )
+
+
+def _open_shards(shard_dir: str) -> question_shards.ShardedQuestionBank:
+  """Builds the shards if they are not up to date with the dataset, and opens them."""
+  question_shards.ensure_shards(shard_dir)
+  return question_shards.ShardedQuestionBank(
+    shard_dir,
+    max_resident_shards=int(
+      os.getenv("JEOPARDY_MAX_RESIDENT_SHARDS", _DEFAULT_MAX_RESIDENT_SHARDS)
+    ),
+  )
+
+
+def _get_shard_dir() -> str | None:
+  """Directory of the shared question bank, or None to load the dataset into memory."""
+  shard_dir = os.getenv("JEOPARDY_SHARD_DIR")
+  if shard_dir:
+    return shard_dir
+  if os.getenv("JEOPARDY_SHARED_BANK", "false").lower() == "true":
+    return os.path.join(tempfile.gettempdir(), "jeopardy-shards")
+  return None
+
+
+def _watch_dataset(
+  dataset_path: str,
+  dataset_signature: tuple[int, int] | None,
+  reload: Callable[[], question_bank.QuestionBank | question_shards.ShardedQuestionBank],
+  loader_name: str,
+):
+  """Polls the dataset file and reloads the question bank when it changes.
+
+  Set `JEOPARDY_DATASET_RELOAD_INTERVAL` to 0 to disable reloading.
+  """
+  global _bank
+  interval = float(os.getenv("JEOPARDY_DATASET_RELOAD_INTERVAL", _DEFAULT_RELOAD_INTERVAL_SECONDS))
+  if interval <= 0:
+    return
+
+  while True:
+    time.sleep(interval)
+    signature = _get_file_signature(dataset_path)
+    if signature is None or signature == dataset_signature:
+      continue
+    try:
+      start_time = time.perf_counter()
+      bank = reload()
+      metrics.QUESTION_BANK_LOAD_DURATION.observe(
+        time.perf_counter() - start_time, loader=loader_name
+      )
+    except Exception:
+      # The file may be partially written. Keep the current bank and retry on the next
+      # poll, since the signature is only updated after a successful load.
+      logger.exception("Failed to reload question bank")
+      continue
+    dataset_signature = signature
+    _bank = bank
+    logger.info("Reloaded question bank with %d question sets", len(bank))
+
+
+def _get_file_signature(file_path: str) -> tuple[int, int] | None:
+  try:
+    stat = os.stat(file_path)
+  except FileNotFoundError:
+    return None
+  return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,326 @@
+"""Sharded question bank format.
+
+A sharded question bank splits the question sets into JSONL shard files by question set
+ID range. A small manifest with the category, air date, and difficulty of each set
+stays resident, while the shards are memory-mapped on demand when a board needs them.
+
+The manifest is stored as fixed-width binary records and memory-mapped read-only. All
+gunicorn workers that use the same shard directory share the same pages through the OS
+page cache. Since no Python objects are created for the bank up front, refcount updates
+never trigger copy-on-write.
+
+Each build of the bank is written to a temporary directory, which is renamed into place
+before `CURRENT` is replaced to point to it. The files of a build are never modified
+afterwards, so rebuilding never truncates files that workers have memory-mapped. The
+last `_NUM_KEPT_BUILDS` builds are kept, so workers that still use an older build can
+map its shards until they switch to the new one. A lock file makes sure that only one
+process builds at a time.
+
+Layout of a shard directory:
+
+  CURRENT         Name of the build that is opened
+  .lock           Held while a build is made
+  build-<id>/
+    manifest.json   Version, shard size, number of question sets and source dataset
+    index.bin       One record per question set (see `_INDEX_RECORD`)
+    meta.bin        Category and air date of each question set
+    shard-00000.jsonl
+    shard-00001.jsonl
+    ...
+
+Each line of a shard file is one question set serialized as a JSON array of clues.
+
+Usage:
+
+  JEOPARDY_DATASET_PATH=data/jeopardy.json python question_shards.py --output data/shards
+"""
+
+import argparse
+import contextlib
+import fcntl
+import json
+import mmap
+import os
+import random
+import shutil
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import question_bank
+from models import Clue
+from question_bank import QuestionSet
+
+
+_CURRENT_FILE = "CURRENT"
+_LOCK_FILE = ".lock"
+_BUILD_PREFIX = "build-"
+_TEMP_PREFIX = ".tmp-"
+_NUM_KEPT_BUILDS = 3
+_MANIFEST_FILE = "manifest.json"
+_MANIFEST_VERSION = 3
+_INDEX_FILE = "index.bin"
+_META_FILE = "meta.bin"
+# Shard offset, shard line length, difficulty, meta offset, meta length
+_INDEX_RECORD = struct.Struct("<QIiII")
+_META_SEPARATOR = "\t"
+_SHARD_FILE = "shard-{index:05d}.jsonl"
+_DEFAULT_SHARD_SIZE = 1000
+_DEFAULT_MAX_RESIDENT_SHARDS = 16
+
+
+def build_shards(
+  question_sets: list[QuestionSet],
+  shard_dir: str,
+  shard_size: int = _DEFAULT_SHARD_SIZE,
+  dataset: dict | None = None,
+):
+  """Writes the question sets into a new build of the sharded question bank.
+
+  Args:
+    dataset: Signature of the dataset the question sets were loaded from, which
+      `ensure_shards` compares to decide whether the build is up to date.
+  """
+  with _build_lock(shard_dir):
+    _build(question_sets, shard_dir, shard_size, dataset)
+
+
+def ensure_shards(
+  shard_dir: str, shard_size: int = _DEFAULT_SHARD_SIZE, dataset_path: str | None = None
+):
+  """Builds the sharded question bank unless the current build is from the same dataset.
+
+  The dataset is identified by its absolute path, size and modification time. Shards
+  built by a separate prep step are used as is when the dataset is not available.
+  """
+  dataset_path = dataset_path or question_bank.dataset_path()
+  with _build_lock(shard_dir):
+    dataset = dataset_signature(dataset_path)
+    manifest = _read_current_manifest(shard_dir)
+    if manifest is not None and (dataset is None or manifest.get("dataset") == dataset):
+      return
+    _build(question_bank.load(dataset_path), shard_dir, shard_size, dataset)
+
+
+def dataset_signature(dataset_path: str) -> dict | None:
+  """Identifies the version of a dataset file, or returns None if it does not exist."""
+  try:
+    stat = os.stat(dataset_path)
+  except FileNotFoundError:
+    return None
+  return {
+    "path": os.path.abspath(dataset_path),
+    "size": stat.st_size,
+    "mtime_ns": stat.st_mtime_ns,
+  }
+
+
+@contextlib.contextmanager
+def _build_lock(shard_dir: str):
+  """Holds an exclusive lock on the shard directory, across processes."""
+  os.makedirs(shard_dir, exist_ok=True)
+  with open(os.path.join(shard_dir, _LOCK_FILE), "w") as f:
+    fcntl.flock(f, fcntl.LOCK_EX)
+    try:
+      yield
+    finally:
+      fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _build(question_sets: list[QuestionSet], shard_dir: str, shard_size: int, dataset: dict | None):
+  """Writes a new build and makes it current. Must hold the build lock."""
+  build_name = f"{_BUILD_PREFIX}{time.time_ns()}"
+  temp_dir = os.path.join(shard_dir, _TEMP_PREFIX + build_name)
+  os.makedirs(temp_dir)
+  try:
+    _write_build(question_sets, temp_dir, shard_size, dataset)
+    os.rename(temp_dir, os.path.join(shard_dir, build_name))
+  except BaseException:
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    raise
+
+  current_path = os.path.join(shard_dir, _CURRENT_FILE)
+  with open(current_path + ".tmp", "w") as f:
+    f.write(build_name)
+  os.replace(current_path + ".tmp", current_path)
+  _delete_old_builds(shard_dir)
+
+
+def _write_build(
+  question_sets: list[QuestionSet], build_dir: str, shard_size: int, dataset: dict | None
+):
+  with (
+    open(os.path.join(build_dir, _INDEX_FILE), "wb") as index_file,
+    open(os.path.join(build_dir, _META_FILE), "wb") as meta_file,
+  ):
+    for shard_start in range(0, len(question_sets), shard_size):
+      shard_path = os.path.join(build_dir, _SHARD_FILE.format(index=shard_start // shard_size))
+      with open(shard_path, "wb") as f:
+        for question_set in question_sets[shard_start : shard_start + shard_size]:
+          line = json.dumps([clue.model_dump() for clue in question_set]).encode("utf-8")
+          meta = _META_SEPARATOR.join([question_set[0].category, question_set[0].air_date])
+          meta = meta.encode("utf-8")
+          index_file.write(
+            _INDEX_RECORD.pack(
+              f.tell(), len(line), _difficulty(question_set), meta_file.tell(), len(meta)
+            )
+          )
+          meta_file.write(meta)
+          f.write(line + b"\n")
+
+  with open(os.path.join(build_dir, _MANIFEST_FILE), "w") as f:
+    json.dump(
+      {
+        "version": _MANIFEST_VERSION,
+        "shard_size": shard_size,
+        "num_sets": len(question_sets),
+        "dataset": dataset,
+      },
+      f,
+    )
+
+
+def _delete_old_builds(shard_dir: str):
+  """Deletes all but the newest builds, and builds that were never finished."""
+  builds = []
+  for name in os.listdir(shard_dir):
+    if name.startswith(_TEMP_PREFIX):
+      shutil.rmtree(os.path.join(shard_dir, name), ignore_errors=True)
+    elif name.startswith(_BUILD_PREFIX):
+      builds.append(name)
+  builds.sort(key=lambda name: int(name.removeprefix(_BUILD_PREFIX)))
+  for name in builds[:-_NUM_KEPT_BUILDS]:
+    shutil.rmtree(os.path.join(shard_dir, name), ignore_errors=True)
+
+
+def current_build_dir(shard_dir: str) -> str:
+  """Directory of the current build. Raises FileNotFoundError if there is none."""
+  with open(os.path.join(shard_dir, _CURRENT_FILE), "r") as f:
+    return os.path.join(shard_dir, f.read().strip())
+
+
+def _read_current_manifest(shard_dir: str) -> dict | None:
+  try:
+    with open(os.path.join(current_build_dir(shard_dir), _MANIFEST_FILE), "r") as f:
+      manifest = json.load(f)
+  except FileNotFoundError:
+    return None
+  return manifest if manifest["version"] == _MANIFEST_VERSION else None
+
+
+def _difficulty(question_set: QuestionSet) -> int:
+  """Average raw dollar value of the question set.
+
+  The raw values are from different rounds and years, so this is only a rough measure
+  of difficulty.
+  """
+  return sum(clue.raw_value for clue in question_set) // len(question_set)
+
+
+class ShardedQuestionBank:
+  """Question bank that loads shards lazily.
+
+  Only the manifest is loaded up front. Shards are memory-mapped when one of their
+  question sets is requested, and the least recently used shards are unmapped once more
+  than `max_resident_shards` are open.
+  """
+
+  def __init__(self, shard_dir: str, max_resident_shards: int = _DEFAULT_MAX_RESIDENT_SHARDS):
+    # The build is resolved once, so a rebuild does not change an open bank.
+    build_dir = current_build_dir(shard_dir)
+    with open(os.path.join(build_dir, _MANIFEST_FILE), "r") as f:
+      manifest = json.load(f)
+    if manifest["version"] != _MANIFEST_VERSION:
+      raise ValueError(f"Unsupported shard manifest version: {manifest['version']}")
+
+    self.build_dir = build_dir
+    self._shard_size = manifest["shard_size"]
+    self._num_sets = manifest["num_sets"]
+    self._index = _map_file(os.path.join(build_dir, _INDEX_FILE))
+    self._meta = _map_file(os.path.join(build_dir, _META_FILE))
+    self._max_resident_shards = max_resident_shards
+    self._resident_shards: OrderedDict[int, mmap.mmap] = OrderedDict()
+    # Gunicorn threaded workers can sample boards concurrently.
+    self._lock = threading.Lock()
+
+  def __len__(self) -> int:
+    return self._num_sets
+
+  def category(self, set_id: int) -> str:
+    return self._read_meta(set_id)[0]
+
+  def air_date(self, set_id: int) -> str:
+    return self._read_meta(set_id)[1]
+
+  def difficulty(self, set_id: int) -> int:
+    return self._read_index(set_id)[2]
+
+  def get(self, set_id: int) -> QuestionSet:
+    offset, length, _, _, _ = self._read_index(set_id)
+    with self._lock:
+      shard = self._get_shard(set_id // self._shard_size)
+      line = shard[offset : offset + length]
+    return [Clue(**row) for row in json.loads(line)]
+
+  def sample(self, num_sets: int) -> list[QuestionSet]:
+    return [self.get(set_id) for set_id in self.sample_ids(num_sets)]
+
+  def sample_ids(self, num_sets: int) -> list[int]:
+    return random.sample(range(len(self)), num_sets)
+
+  def _read_index(self, set_id: int) -> tuple[int, int, int, int, int]:
+    if not 0 <= set_id < self._num_sets:
+      raise IndexError(f"Question set ID out of range: {set_id}")
+    return _INDEX_RECORD.unpack_from(self._index, set_id * _INDEX_RECORD.size)
+
+  def _read_meta(self, set_id: int) -> list[str]:
+    _, _, _, meta_offset, meta_length = self._read_index(set_id)
+    meta = self._meta[meta_offset : meta_offset + meta_length].decode("utf-8")
+    return meta.split(_META_SEPARATOR)
+
+  def _get_shard(self, shard_index: int) -> mmap.mmap:
+    """Gets the memory-mapped shard, evicting the least recently used shard if needed."""
+    shard = self._resident_shards.get(shard_index)
+    if shard is not None:
+      self._resident_shards.move_to_end(shard_index)
+      return shard
+
+    shard = _map_file(os.path.join(self.build_dir, _SHARD_FILE.format(index=shard_index)))
+    self._resident_shards[shard_index] = shard
+
+    while len(self._resident_shards) > self._max_resident_shards:
+      _, evicted_shard = self._resident_shards.popitem(last=False)
+      evicted_shard.close()
+
+    return shard
+
+
+def _map_file(path: str) -> mmap.mmap:
+  """Memory-maps a file read-only so the pages are shared between processes."""
+  with open(path, "rb") as f:
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description="Build a sharded question bank from the Jeopardy dataset"
+  )
+  parser.add_argument("--output", type=str, required=True, help="Directory to write shards to")
+  parser.add_argument(
+    "--shard-size",
+    type=int,
+    default=_DEFAULT_SHARD_SIZE,
+    help=f"Number of question sets per shard (default: {_DEFAULT_SHARD_SIZE})",
+  )
+  args = parser.parse_args()
+
+  dataset_path = question_bank.dataset_path()
+  dataset = dataset_signature(dataset_path)
+  question_sets = question_bank.load(dataset_path)
+  build_shards(question_sets, args.output, args.shard_size, dataset)
+  print(f"Wrote {len(question_sets)} question sets to {args.output}")
+
+
+if __name__ == "__main__":
+  main()
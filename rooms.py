@@ -0,0 +1,266 @@
+"""Multiplayer game rooms.
+
+Players in a room share one board, one score table and one Gemini Live API session. The
+session runs in the browser of the room host, which is the first player to join. Other
+players' board selections and responses are relayed to the host, which sends them to
+the Gemini Live API as text.
+
+Room state lives on the server in this module. Each player's session waits on its room
+for changes, and re-renders when the room changes. This needs Mesop's websocket mode
+(`MESOP_WEBSOCKETS_ENABLED=true`), since the waiting event handler runs concurrently
+with the player's other events and pushes updates over the websocket.
+
+Rooms only exist in the gunicorn worker that created them, so players in a room need to
+be served by the same worker. Use a single worker, or sticky sessions on the room query
+parameter.
+
+- `JEOPARDY_MAX_PLAYERS_PER_ROOM`: Defaults to 8.
+"""
+
+import bisect
+import os
+import re
+import threading
+from typing import NamedTuple
+
+import metrics
+from models import Board
+
+_MAX_PLAYERS_PER_ROOM = int(os.getenv("JEOPARDY_MAX_PLAYERS_PER_ROOM", "8"))
+_ROOM_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{4,32}$")
+
+
+class Player(NamedTuple):
+  player_id: str
+  name: str
+  score: int
+
+
+class RoomSnapshot(NamedTuple):
+  """Immutable view of a room, shared by all of its players."""
+
+  version: int
+  board: Board
+  host_player_id: str
+  game_active: bool
+  answered_questions: frozenset[str]
+  selected_question_key: str
+  # In join order.
+  players: tuple[Player, ...]
+  # Player IDs in the order they buzzed in for the selected clue. The first player may
+  # respond.
+  buzz_order: tuple[str, ...]
+  # Latest message for the host to send to the Gemini Live API.
+  host_text_input: str
+
+
+class Room:
+  """Shared state of a room. Safe to use from multiple threads."""
+
+  def __init__(self, room_id: str, board: Board):
+    self.room_id = room_id
+    self._condition = threading.Condition()
+    self._version = 0
+    self._board = board
+    self._game_active = False
+    self._answered_questions: set[str] = set()
+    self._selected_question_key = ""
+    # Player ID -> player, in join order.
+    self._players: dict[str, Player] = {}
+    # (server time, player ID) of each buzz, sorted by time.
+    self._buzzes: list[tuple[float, str]] = []
+    self._host_text_input = ""
+    self._num_joined = 0
+    self._snapshot = self._make_snapshot()
+
+  def __len__(self) -> int:
+    with self._condition:
+      return len(self._players)
+
+  def snapshot(self) -> RoomSnapshot:
+    with self._condition:
+      return self._snapshot
+
+  def wait_for_update(self, version: int, timeout: float) -> RoomSnapshot:
+    """Waits until the room changes from the given version, or the timeout passes."""
+    with self._condition:
+      self._condition.wait_for(lambda: self._version != version, timeout)
+      return self._snapshot
+
+  def join(self, player_id: str, name: str = "") -> bool:
+    """Adds a player to the room. Returns False if the room is full.
+
+    Players without a name are numbered in the order they joined.
+    """
+    with self._condition:
+      if player_id in self._players:
+        return True
+      if len(self._players) >= _MAX_PLAYERS_PER_ROOM:
+        return False
+      self._num_joined += 1
+      self._players[player_id] = Player(player_id, name or f"Player {self._num_joined}", 0)
+      self._changed()
+      return True
+
+  def leave(self, player_id: str):
+    with self._condition:
+      if self._players.pop(player_id, None) is None:
+        return
+      self._buzzes = [buzz for buzz in self._buzzes if buzz[1] != player_id]
+      if self._snapshot.host_player_id == player_id:
+        # The Gemini Live API session ended with the host's session. The next player
+        # becomes the host and can start it again.
+        self._game_active = False
+        self._selected_question_key = ""
+        self._buzzes = []
+        self._host_text_input = ""
+      self._changed()
+
+  def rename(self, player_id: str, name: str):
+    with self._condition:
+      player = self._players.get(player_id)
+      if player is not None and name and player.name != name:
+        self._players[player_id] = player._replace(name=name)
+        self._changed()
+
+  def set_game_active(self, game_active: bool):
+    with self._condition:
+      self._game_active = game_active
+      if not game_active:
+        self._selected_question_key = ""
+        self._buzzes = []
+      self._changed()
+
+  def send_to_host(self, player_id: str, text: str):
+    """Relays a player's message to the Gemini Live API through the host."""
+    with self._condition:
+      player = self._players.get(player_id)
+      if player is not None:
+        self._host_text_input = f"{player.name}: {text}"
+        self._changed()
+
+  def select_clue(self, clue_key: str) -> str:
+    """Selects a clue for the players to buzz in on.
+
+    Returns:
+      An error message, or an empty string if the clue was selected.
+    """
+    with self._condition:
+      if self._selected_question_key:
+        return "A clue has already been selected."
+      if clue_key in self._answered_questions:
+        return "That clue has already been selected"
+      self._selected_question_key = clue_key
+      self._buzzes = []
+      self._changed()
+      return ""
+
+  def buzz(self, player_id: str, buzz_time: float) -> int:
+    """Buzzes in for the selected clue.
+
+    Buzzes are ordered by the server time they were received, not the order they
+    acquire the lock in.
+
+    Args:
+      player_id: Player that buzzed in.
+      buzz_time: `time.monotonic()` when the buzz was received.
+
+    Returns:
+      The 1-based place of the player in the buzz order, or 0 if they cannot buzz in.
+    """
+    with self._condition:
+      if (
+        not self._selected_question_key
+        or player_id not in self._players
+        or any(buzz[1] == player_id for buzz in self._buzzes)
+      ):
+        return 0
+      bisect.insort(self._buzzes, (buzz_time, player_id))
+      self._changed()
+      return next(index for index, buzz in enumerate(self._buzzes, 1) if buzz[1] == player_id)
+
+  def update_score(self, is_correct: bool, value: int) -> str:
+    """Scores the response of the first player in the buzz order.
+
+    Without buzzes, the host responded. After an incorrect response, the next player in
+    the buzz order may respond. Otherwise the clue is closed.
+
+    Returns:
+      Description of the result for the Gemini Live API.
+    """
+    with self._condition:
+      if not self._selected_question_key:
+        return "No clue is selected."
+      responder_id = self._buzzes[0][1] if self._buzzes else self._snapshot.host_player_id
+      responder = self._players[responder_id]
+      score = responder.score + (value if is_correct else -value)
+      self._players[responder_id] = responder._replace(score=score)
+      result = f"{responder.name}'s score is {score}."
+      if self._buzzes:
+        self._buzzes.pop(0)
+      if is_correct or not self._buzzes:
+        self._answered_questions.add(self._selected_question_key)
+        self._selected_question_key = ""
+        self._buzzes = []
+      else:
+        result += f" {self._players[self._buzzes[0][1]].name} buzzed in next and may respond."
+      self._changed()
+      return result
+
+  def _changed(self):
+    self._version += 1
+    self._snapshot = self._make_snapshot()
+    self._condition.notify_all()
+
+  def _make_snapshot(self) -> RoomSnapshot:
+    return RoomSnapshot(
+      version=self._version,
+      board=self._board,
+      host_player_id=next(iter(self._players), ""),
+      game_active=self._game_active,
+      answered_questions=frozenset(self._answered_questions),
+      selected_question_key=self._selected_question_key,
+      players=tuple(self._players.values()),
+      buzz_order=tuple(buzz[1] for buzz in self._buzzes),
+      host_text_input=self._host_text_input,
+    )
+
+
+_rooms: dict[str, Room] = {}
+_rooms_lock = threading.Lock()
+
+
+def is_valid_room_id(room_id: str) -> bool:
+  return bool(_ROOM_ID_PATTERN.match(room_id))
+
+
+def get(room_id: str) -> Room | None:
+  with _rooms_lock:
+    return _rooms.get(room_id)
+
+
+def join(room_id: str, player_id: str, name: str, board: Board) -> Room | None:
+  """Joins a room, creating it with the given board if it does not exist.
+
+  Returns:
+    The room, or None if it is full.
+  """
+  with _rooms_lock:
+    room = _rooms.get(room_id)
+    if room is None:
+      room = _rooms[room_id] = Room(room_id, board)
+      metrics.ROOMS.inc()
+    # Joined under the registry lock, so an empty room is not deleted in between.
+    return room if room.join(player_id, name) else None
+
+
+def leave(room_id: str, player_id: str):
+  """Leaves a room. Rooms are deleted when their last player leaves."""
+  with _rooms_lock:
+    room = _rooms.get(room_id)
+    if room is None:
+      return
+    room.leave(player_id)
+    if not len(room):
+      del _rooms[room_id]
+      metrics.ROOMS.dec()
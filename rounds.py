@@ -0,0 +1,118 @@
+"""Multi-round games.
+
+A game has a Jeopardy! round and a Double Jeopardy! round with doubled clue values.
+
+While a round is played, the board of the next round and the message that introduces it
+to the host are prepared on a background thread. When the board is cleared, the game
+switches to the prepared round right away, and the message is sent to the Gemini Live
+API session in progress, so there is no need to reconnect with a new setup.
+
+Prepared rounds are kept in memory per session. Sessions that end before their round is
+used are evicted once there are more than `_MAX_PREPARED_ROUNDS`.
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, NamedTuple
+
+import metrics
+import question_bank_loader
+from models import Board
+
+
+ROUND_NAMES = ["Jeopardy!", "Double Jeopardy!"]
+_NUM_CATEGORIES = 6
+_MAX_PREPARED_ROUNDS = 1000
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="round-prefetch")
+_prepared: OrderedDict[tuple[str, int], Future] = OrderedDict()
+_lock = threading.Lock()
+
+
+class Round(NamedTuple):
+  index: int
+  board: Board
+  # Introduces the round and its board to the host.
+  message: str
+
+
+def is_last_round(round_index: int) -> bool:
+  return round_index >= len(ROUND_NAMES) - 1
+
+
+def prefetch(
+  session_id: str,
+  round_index: int,
+  previous_board: Board,
+  make_message: Callable[[Board, int], str],
+):
+  """Prepares the given round in the background, unless it is already being prepared."""
+  key = (session_id, round_index)
+  with _lock:
+    if key in _prepared:
+      return
+    _prepared[key] = _executor.submit(_make_round, round_index, previous_board, make_message)
+    while len(_prepared) > _MAX_PREPARED_ROUNDS:
+      _prepared.popitem(last=False)
+
+
+def take(
+  session_id: str,
+  round_index: int,
+  previous_board: Board,
+  make_message: Callable[[Board, int], str],
+) -> Round:
+  """Returns the prepared round, waiting for it if needed, or prepares it now."""
+  with _lock:
+    future = _prepared.pop((session_id, round_index), None)
+  if future is None:
+    metrics.ROUND_PREFETCHES.inc(result="missed")
+    return _make_round(round_index, previous_board, make_message)
+  metrics.ROUND_PREFETCHES.inc(result="ready" if future.done() else "waited")
+  return future.result()
+
+
+def discard(session_id: str):
+  """Discards the rounds prepared for a session, such as when it starts a new game."""
+  with _lock:
+    for key in [key for key in _prepared if key[0] == session_id]:
+      del _prepared[key]
+
+
+def make_board(round_index: int, previous_board: Board | None = None) -> Board:
+  """Samples a board for the round, with categories that were not on the previous board."""
+  bank = question_bank_loader.current()
+  previous_categories = set()
+  if previous_board is not None:
+    previous_categories = {category[0].category for category in previous_board.clues}
+  set_ids = bank.sample_ids(min(len(bank), _NUM_CATEGORIES * 2))
+  new_set_ids = [
+    set_id for set_id in set_ids if bank.get(set_id)[0].category not in previous_categories
+  ]
+  if len(new_set_ids) < _NUM_CATEGORIES:
+    new_set_ids = set_ids
+  return make_round_board(bank, new_set_ids[:_NUM_CATEGORIES], round_index)
+
+
+def make_round_board(bank, set_ids: list[int], round_index: int) -> Board:
+  """Makes the board of the round with the given question sets."""
+  # Question sets are shared with the question bank, so the clues are copied.
+  multiplier = round_index + 1
+  return Board(
+    clues=[
+      [
+        clue.model_copy(update={"normalized_value": clue.normalized_value * multiplier})
+        for clue in bank.get(set_id)
+      ]
+      for set_id in set_ids
+    ],
+    set_ids=set_ids,
+  )
+
+
+def _make_round(
+  round_index: int, previous_board: Board, make_message: Callable[[Board, int], str]
+) -> Round:
+  board = make_board(round_index, previous_board)
+  return Round(index=round_index, board=board, message=make_message(board, round_index))
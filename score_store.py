@@ -0,0 +1,233 @@
+"""Stores game scores in SQLite for the leaderboard.
+
+The store is enabled by setting `JEOPARDY_SCORE_DB_PATH`. The database uses WAL mode, so
+leaderboard reads do not wait for writes, and all gunicorn workers can share it.
+
+Event handlers never wait for the database. `record` puts the latest score of a game in
+a bounded queue, and a writer thread upserts the queued scores in batches, one
+transaction per batch. Scores of the same game in a batch are coalesced. When the queue
+is full, scores are dropped and counted in `/metrics`, since the next score of the game
+replaces them anyway.
+
+Leaderboards are cached in memory. The cache is invalidated when this worker writes a
+batch, and entries expire after `_LEADERBOARD_CACHE_TTL_SECONDS` so that scores written
+by other workers show up too.
+
+- `JEOPARDY_SCORE_DB_PATH`: Enables the score store with the database at this path.
+- `JEOPARDY_SCORE_FLUSH_INTERVAL`: Seconds between batches (default 1).
+"""
+
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+import daily
+import metrics
+from models import Board
+
+
+logger = logging.getLogger(__name__)
+
+_DB_PATH = os.getenv("JEOPARDY_SCORE_DB_PATH", "")
+_FLUSH_INTERVAL_SECONDS = float(os.getenv("JEOPARDY_SCORE_FLUSH_INTERVAL", "1"))
+_MAX_QUEUED_SCORES = 10000
+_MAX_BATCH_SIZE = 1000
+_LEADERBOARD_CACHE_TTL_SECONDS = 5
+DEFAULT_PLAYER_NAME = "Anonymous"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+  game_id TEXT PRIMARY KEY,
+  player_name TEXT NOT NULL,
+  board_id TEXT NOT NULL,
+  day TEXT NOT NULL,
+  score INTEGER NOT NULL,
+  clues_answered INTEGER NOT NULL,
+  finished INTEGER NOT NULL,
+  updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_by_score ON games (score DESC);
+CREATE INDEX IF NOT EXISTS games_by_day ON games (day, score DESC);
+CREATE INDEX IF NOT EXISTS games_by_board ON games (board_id, score DESC);
+"""
+
+_UPSERT = """
+INSERT INTO games (
+  game_id, player_name, board_id, day, score, clues_answered, finished, updated_at
+)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (game_id) DO UPDATE SET
+  player_name = excluded.player_name,
+  score = excluded.score,
+  clues_answered = excluded.clues_answered,
+  finished = max(finished, excluded.finished),
+  updated_at = excluded.updated_at
+"""
+
+_LEADERBOARD_QUERIES = {
+  "all": "SELECT player_name, score, day FROM games ORDER BY score DESC LIMIT ?",
+  "day": "SELECT player_name, score, day FROM games WHERE day = ? ORDER BY score DESC LIMIT ?",
+  "board": (
+    "SELECT player_name, score, day FROM games WHERE board_id = ? ORDER BY score DESC LIMIT ?"
+  ),
+}
+
+
+class GameScore(NamedTuple):
+  game_id: str
+  player_name: str
+  board_id: str
+  day: str
+  score: int
+  clues_answered: int
+  finished: bool
+
+
+class LeaderboardEntry(NamedTuple):
+  player_name: str
+  score: int
+  day: str
+
+
+class ScoreStore:
+  def __init__(self, db_path: str, flush_interval_seconds: float = _FLUSH_INTERVAL_SECONDS):
+    self.db_path = db_path
+    self.flush_interval_seconds = flush_interval_seconds
+    self._queue: queue.Queue[GameScore] = queue.Queue(_MAX_QUEUED_SCORES)
+    self._read_lock = threading.Lock()
+    self._cache_lock = threading.Lock()
+    self._cache: dict[tuple, tuple[float, list[LeaderboardEntry]]] = {}
+    self._stopped = threading.Event()
+
+    directory = os.path.dirname(db_path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self._write_connection = self._connect()
+    self._write_connection.executescript(_SCHEMA)
+    self._read_connection = self._connect()
+    self._writer = threading.Thread(target=self._write_loop, name="score-store", daemon=True)
+    self._writer.start()
+
+  def record(self, game_score: GameScore):
+    """Queues the latest score of a game to be written. Never blocks."""
+    try:
+      self._queue.put_nowait(game_score)
+    except queue.Full:
+      metrics.SCORE_STORE_DROPPED.inc()
+
+  def leaderboard(
+    self, kind: str = "all", key: str = "", limit: int = 10
+  ) -> list[LeaderboardEntry]:
+    """Gets the highest scores of all games, the games of a day or the games of a board."""
+    cache_key = (kind, key, limit)
+    with self._cache_lock:
+      cached = self._cache.get(cache_key)
+    if cached is not None and time.monotonic() - cached[0] < _LEADERBOARD_CACHE_TTL_SECONDS:
+      return cached[1]
+
+    params = (limit,) if kind == "all" else (key, limit)
+    with self._read_lock:
+      rows = self._read_connection.execute(_LEADERBOARD_QUERIES[kind], params).fetchall()
+    entries = [LeaderboardEntry(*row) for row in rows]
+    with self._cache_lock:
+      self._cache[cache_key] = (time.monotonic(), entries)
+    return entries
+
+  def close(self):
+    """Writes the queued scores and stops the writer thread."""
+    self._stopped.set()
+    self._writer.join()
+
+  def _connect(self) -> sqlite3.Connection:
+    connection = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # WAL mode is durable across crashes with NORMAL, minus the last transactions.
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA busy_timeout=5000")
+    return connection
+
+  def _write_loop(self):
+    while not self._stopped.is_set():
+      self._stopped.wait(self.flush_interval_seconds)
+      while self._flush():
+        pass
+
+  def _flush(self) -> bool:
+    """Writes a batch of queued scores. Returns whether there may be more."""
+    batch = {}
+    while len(batch) < _MAX_BATCH_SIZE:
+      try:
+        game_score = self._queue.get_nowait()
+      except queue.Empty:
+        break
+      # Only the latest score of each game is written.
+      batch[game_score.game_id] = game_score
+    if not batch:
+      return False
+
+    now = time.time()
+    rows = [(*game_score[:6], int(game_score.finished), now) for game_score in batch.values()]
+    start_time = time.perf_counter()
+    try:
+      with self._write_connection:
+        self._write_connection.execute("BEGIN")
+        self._write_connection.executemany(_UPSERT, rows)
+    except sqlite3.Error:
+      logger.exception("Failed to write %d scores", len(rows))
+      return False
+    metrics.SCORE_STORE_WRITE_DURATION.observe(time.perf_counter() - start_time)
+    metrics.SCORE_STORE_WRITES.inc(len(rows))
+    with self._cache_lock:
+      self._cache.clear()
+    return len(batch) == _MAX_BATCH_SIZE
+
+
+def make_board_id(board: Board) -> str:
+  """Identifies a board by its question sets, so games on the same board can be compared."""
+  question_sets = "\n".join(
+    f"{category[0].category}\0{category[0].air_date}" for category in board.clues
+  )
+  return hashlib.sha256(question_sets.encode("utf-8")).hexdigest()[:16]
+
+
+_store: ScoreStore | None = None
+_store_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+  return bool(_DB_PATH)
+
+
+def get() -> ScoreStore:
+  """Gets the score store, opening it on first use."""
+  global _store
+  with _store_lock:
+    if _store is None:
+      _store = ScoreStore(_DB_PATH)
+      atexit.register(_store.close)
+    return _store
+
+
+def record(
+  game_id: str, player_name: str, board: Board, score: int, clues_answered: int, finished: bool
+):
+  """Records the latest score of a game, if the score store is enabled."""
+  if not is_enabled():
+    return
+  get().record(
+    GameScore(
+      game_id=game_id,
+      player_name=player_name or DEFAULT_PLAYER_NAME,
+      board_id=make_board_id(board),
+      day=daily.today(),
+      score=score,
+      clues_answered=clues_answered,
+      finished=finished,
+    )
+  )
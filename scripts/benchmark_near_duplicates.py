@@ -0,0 +1,110 @@
+"""Benchmarks near-duplicate detection on synthetic clues or a real dataset.
+
+Synthetic clues are random sentences with a fraction of injected near-duplicates, so
+the recall of the index can be measured too.
+
+Usage:
+
+  python scripts/benchmark_near_duplicates.py --num-clues 200000
+  python scripts/benchmark_near_duplicates.py --dataset data/jeopardy.json
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import near_duplicates
+import question_bank
+
+
+def make_synthetic_clues(
+  num_clues: int, duplicate_rate: float, seed: int
+) -> tuple[list[tuple[int, str, str]], dict[int, int]]:
+  """Makes random clues, some of which are edited copies of earlier clues.
+
+  Returns:
+    The clues, and a mapping of each injected near-duplicate to its original.
+  """
+  rng = random.Random(seed)
+  vocabulary = [f"word{index}" for index in range(50000)]
+  clues = []
+  injected = {}
+  for key in range(num_clues):
+    if clues and rng.random() < duplicate_rate:
+      original_key, clue, answer = clues[rng.randrange(len(clues))]
+      words = clue.split()
+      edit = rng.random()
+      if edit < 0.3:
+        # Formatting changes only.
+        clue = f"<i>{clue.upper()}</i>!"
+      elif edit < 0.6:
+        words.append(rng.choice(vocabulary))
+        clue = " ".join(words)
+      else:
+        words[rng.randrange(len(words))] = rng.choice(vocabulary)
+        clue = " ".join(words)
+      injected[key] = original_key
+    else:
+      clue = " ".join(rng.choices(vocabulary, k=rng.randint(15, 25)))
+      answer = " ".join(rng.choices(vocabulary, k=rng.randint(1, 3)))
+    clues.append((key, clue, answer))
+  return clues, injected
+
+
+def load_dataset_clues(file_path: str) -> list[tuple[int, str, str]]:
+  clues = [clue for question_set in question_bank.load(file_path) for clue in question_set]
+  return [(key, clue.question, clue.answer) for key, clue in enumerate(clues)]
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark near-duplicate clue detection")
+  parser.add_argument("--num-clues", type=int, default=200000, help="Number of synthetic clues")
+  parser.add_argument(
+    "--duplicate-rate", type=float, default=0.05, help="Fraction of injected near-duplicates"
+  )
+  parser.add_argument("--threshold", type=float, default=0.8, help="Jaccard threshold")
+  parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic clues")
+  parser.add_argument("--dataset", type=str, help="Benchmark a dataset instead")
+  args = parser.parse_args()
+
+  injected = None
+  if args.dataset:
+    clues = load_dataset_clues(args.dataset)
+  else:
+    clues, injected = make_synthetic_clues(args.num_clues, args.duplicate_rate, args.seed)
+
+  start_time = time.perf_counter()
+  duplicates = near_duplicates.find_near_duplicates(clues, args.threshold)
+  duration = time.perf_counter() - start_time
+
+  report = {
+    "num_clues": len(clues),
+    "duration_seconds": round(duration, 3),
+    "clues_per_second": round(len(clues) / duration),
+    "num_near_duplicates": len(duplicates),
+    "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024),
+  }
+  if injected is not None:
+    # Only injected clues that are above the threshold are expected to be found.
+    texts = {key: (clue, answer) for key, clue, answer in clues}
+    expected = [
+      key
+      for key, original_key in injected.items()
+      if near_duplicates._jaccard(
+        near_duplicates._shingles(*texts[key]), near_duplicates._shingles(*texts[original_key])
+      )
+      >= args.threshold
+    ]
+    report["num_expected"] = len(expected)
+    report["recall"] = round(sum(key in duplicates for key in expected) / len(expected), 4)
+  print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,479 @@
+"""Benchmarks loading the question bank and sampling boards on synthetic data sets.
+
+The synthetic data sets are shaped like the J! Archive data set and are the same for a
+given seed:
+
+- Each show has six Jeopardy! and six Double Jeopardy! categories and a Final Jeopardy!
+  clue. Shows air on consecutive weekdays from 1984-09-10, so larger data sets span more
+  years.
+- Clue values follow the era of the show (doubled from 2001-11-26), with Daily Doubles
+  at odd values and about 3% of clues unrevealed, which leaves incomplete categories.
+- Category names recur across shows with a Zipf-like distribution, a few very often.
+- Clues may be quoted or contain HTML tags, which the loader strips.
+
+Each stage of `question_bank.load` is timed on its own, followed by `question_bank.load`
+end to end and sampling boards from the loaded question bank. Each size runs in a new
+process, so the peak RSS is that of the size. For each stage, the report has the wall
+time, the peak RSS of the process after the stage, and the memory that the stage
+allocated at its peak and still holds at its end. Allocations are traced by tracemalloc
+in a separate run, since tracing slows down the stages several times, and can be skipped
+with `--no-trace-allocations` on the largest sizes.
+
+The stages run `--repeat` times (default 5). The report has the fastest and the median
+time of each stage, and the fastest is compared, since slower runs are mostly noise from
+the rest of the machine.
+
+Save a report with `--output` and compare against it later with `--baseline`. The
+script exits with status 1 if a stage got slower or allocates more than the thresholds
+allow. Sampling boards is compared as the time per board. A stage also has to be slower
+by more than `--min-time-change` (default 10 ms) in total, so the fastest stages, whose
+times vary by more than the threshold from run to run, do not fail the check on noise.
+
+Usage:
+
+  python scripts/benchmark_question_bank.py --num-clues 10000 100000 1000000
+  python scripts/benchmark_question_bank.py --num-clues 2000000 --no-trace-allocations
+  python scripts/benchmark_question_bank.py --output /tmp/question_bank_baseline.json
+  python scripts/benchmark_question_bank.py --baseline /tmp/question_bank_baseline.json
+"""
+
+import argparse
+import datetime
+import gc
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import question_bank
+import rounds
+from models import Board, Clue
+
+
+_FIRST_AIR_DATE = datetime.date(1984, 9, 10)
+# Clue values were doubled from this show on.
+_VALUES_DOUBLED_DATE = datetime.date(2001, 11, 26)
+_NUM_CATEGORIES_PER_ROUND = 6
+_NUM_CLUES_PER_CATEGORY = 5
+_UNREVEALED_RATE = 0.03
+_HTML_RATE = 0.1
+_QUOTED_RATE = 0.2
+_NUM_CATEGORIES = 6
+_MB = 1024 * 1024
+
+# Stage metrics compared against the baseline, with whether they are times.
+_COMPARED_METRICS = {
+  "duration_seconds": True,
+  "microseconds_per_board": True,
+  "peak_allocated_mb": False,
+}
+# Stages compared by the time per board instead of the total time.
+_PER_BOARD_STAGES = frozenset(["sample_boards", "sample_round_boards"])
+
+
+def make_synthetic_rows(num_clues: int, seed: int) -> list[dict]:
+  """Makes the rows of a data set with the given number of clues."""
+  rng = random.Random(seed)
+  vocabulary = [f"word{index}" for index in range(50000)]
+  clues_per_show = 2 * _NUM_CATEGORIES_PER_ROUND * _NUM_CLUES_PER_CATEGORY + 1
+  num_shows = -(-num_clues // clues_per_show)
+  category_names = [f"CATEGORY {index}" for index in range(num_shows * 4)]
+  cumulative_weights = list(
+    itertools.accumulate(1 / (rank + 1) for rank in range(len(category_names)))
+  )
+
+  def make_row(category, air_date, show_number, round_name, value):
+    question = " ".join(rng.choices(vocabulary, k=rng.randint(8, 25)))
+    if rng.random() < _HTML_RATE:
+      question = f'<a href="http://www.j-archive.com/media/{show_number}.jpg">{question}</a>'
+    if rng.random() < _QUOTED_RATE:
+      question = f"'{question}'"
+    return {
+      "category": category,
+      "air_date": air_date,
+      "question": question,
+      "value": f"${value:,}" if value else None,
+      "answer": " ".join(rng.choices(vocabulary, k=rng.randint(1, 3))),
+      "round": round_name,
+      "show_number": str(show_number),
+    }
+
+  rows = []
+  air_date = _FIRST_AIR_DATE
+  for show_number in range(1, num_shows + 1):
+    while air_date.weekday() >= 5:
+      air_date += datetime.timedelta(days=1)
+    base_value = 200 if air_date >= _VALUES_DOUBLED_DATE else 100
+    categories = set()
+    while len(categories) < 2 * _NUM_CATEGORIES_PER_ROUND + 1:
+      categories.add(rng.choices(category_names, cum_weights=cumulative_weights)[0])
+    categories = list(categories)
+    rng.shuffle(categories)
+
+    for round_index, round_name in enumerate(rounds.ROUND_NAMES):
+      multiplier = round_index + 1
+      num_clues_in_round = _NUM_CATEGORIES_PER_ROUND * _NUM_CLUES_PER_CATEGORY
+      daily_doubles = set(rng.sample(range(num_clues_in_round), multiplier))
+      for clue_index in range(num_clues_in_round):
+        if rng.random() < _UNREVEALED_RATE:
+          continue
+        category_index, dollar_index = divmod(clue_index, _NUM_CLUES_PER_CATEGORY)
+        value = base_value * multiplier * (dollar_index + 1)
+        if clue_index in daily_doubles:
+          value = rng.randrange(5, 50 * multiplier) * 100
+        rows.append(
+          make_row(
+            categories[round_index * _NUM_CATEGORIES_PER_ROUND + category_index],
+            air_date.isoformat(),
+            show_number,
+            round_name,
+            value,
+          )
+        )
+    rows.append(
+      make_row(categories[-1], air_date.isoformat(), show_number, "Final Jeopardy!", None)
+    )
+    air_date += datetime.timedelta(days=1)
+  return rows[:num_clues]
+
+
+def write_dataset(rows: list[dict], file_path: str, dataset_format: str):
+  with open(file_path, "w") as f:
+    if dataset_format == "jsonl":
+      f.writelines(json.dumps(row) + "\n" for row in rows)
+    else:
+      json.dump(rows, f, indent=2)
+
+
+class StageTimer:
+  """Measures stages, optionally with tracemalloc running."""
+
+  def __init__(self, trace_allocations: bool):
+    self.trace_allocations = trace_allocations
+    self.results: dict[str, dict] = {}
+
+  def run(self, name: str, fn, *args):
+    gc.collect()
+    if self.trace_allocations:
+      tracemalloc.reset_peak()
+      allocated_before = tracemalloc.get_traced_memory()[0]
+    start_time = time.perf_counter()
+    value = fn(*args)
+    duration = time.perf_counter() - start_time
+    if self.trace_allocations:
+      allocated, peak_allocated = tracemalloc.get_traced_memory()
+      self.results[name] = {
+        "allocated_mb": round((allocated - allocated_before) / _MB, 2),
+        "peak_allocated_mb": round((peak_allocated - allocated_before) / _MB, 2),
+      }
+    else:
+      self.results[name] = {
+        "duration_seconds": round(duration, 4),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024),
+      }
+    return value
+
+
+def sample_boards(bank: question_bank.QuestionBank, num_boards: int) -> list[Board]:
+  """Samples boards like `state.make_default_board`."""
+  boards = []
+  for _ in range(num_boards):
+    set_ids = bank.sample_ids(_NUM_CATEGORIES)
+    boards.append(Board(clues=[bank.get(set_id) for set_id in set_ids], set_ids=set_ids))
+  return boards
+
+
+def sample_round_boards(bank: question_bank.QuestionBank, num_boards: int) -> list[Board]:
+  """Samples Double Jeopardy! boards, which copy their clues."""
+  return [
+    rounds.make_round_board(bank, bank.sample_ids(_NUM_CATEGORIES), 1) for _ in range(num_boards)
+  ]
+
+
+def _parse(rows: list[dict]) -> list[Clue]:
+  # Same as the second half of `question_bank._load_raw_data`.
+  return [Clue(**row) for row in rows]
+
+
+def _clean(data: list[Clue]) -> list[Clue]:
+  return question_bank._clean_questions(question_bank._add_raw_value(data))
+
+
+def _sort_and_normalize(question_sets: list[list[Clue]]) -> list[list[Clue]]:
+  return question_bank._normalize_values(question_bank._sort_question_sets(question_sets))
+
+
+def run_stages(file_path: str, num_boards: int, seed: int, timer: StageTimer) -> int:
+  """Runs each stage of loading the data set, then samples boards.
+
+  Returns:
+    The number of question sets in the question bank.
+  """
+  rows = timer.run("read", question_bank._read_rows, file_path)
+  data = timer.run("parse", _parse, rows)
+  del rows
+  data = timer.run("clean", _clean, data)
+  question_sets = timer.run("group", question_bank._group_into_question_sets, data)
+  del data
+  question_sets = timer.run("sort_and_normalize", _sort_and_normalize, question_sets)
+  question_sets = timer.run(
+    "filter_incomplete", question_bank._filter_out_incomplete_question_sets, question_sets
+  )
+  question_sets = timer.run(
+    "filter_near_duplicates", question_bank._filter_out_near_duplicate_question_sets, question_sets
+  )
+  del question_sets
+
+  bank = question_bank.QuestionBank(timer.run("load", question_bank.load, file_path))
+  random.seed(seed)
+  timer.run("sample_boards", sample_boards, bank, num_boards)
+  timer.run("sample_round_boards", sample_round_boards, bank, num_boards)
+  return len(bank)
+
+
+def benchmark_dataset(
+  file_path: str,
+  num_boards: int,
+  seed: int,
+  repeat: int,
+  trace_allocations: bool,
+  near_duplicate_threshold: float | None,
+) -> dict:
+  """Benchmarks loading a data set. Runs in its own process."""
+  if near_duplicate_threshold is not None:
+    question_bank._NEAR_DUPLICATE_THRESHOLD = near_duplicate_threshold
+
+  # The fastest of the repeated runs is kept, since slower runs are noise.
+  stages = {}
+  durations = {}
+  for _ in range(repeat):
+    timer = StageTimer(trace_allocations=False)
+    num_question_sets = run_stages(file_path, num_boards, seed, timer)
+    for name, result in timer.results.items():
+      durations.setdefault(name, []).append(result["duration_seconds"])
+      if name not in stages or result["duration_seconds"] < stages[name]["duration_seconds"]:
+        stages[name] = result
+  for name, stage_durations in durations.items():
+    stages[name]["median_duration_seconds"] = round(statistics.median(stage_durations), 4)
+
+  if trace_allocations:
+    tracemalloc.start()
+    timer = StageTimer(trace_allocations=True)
+    run_stages(file_path, num_boards, seed, timer)
+    tracemalloc.stop()
+    for name, result in timer.results.items():
+      stages[name].update(result)
+
+  for name in _PER_BOARD_STAGES:
+    stages[name]["microseconds_per_board"] = round(
+      stages[name]["duration_seconds"] / num_boards * 1e6, 1
+    )
+
+  return {
+    "num_question_sets": num_question_sets,
+    "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024),
+    "stages": stages,
+  }
+
+
+def find_regressions(
+  report: dict,
+  baseline: dict,
+  max_time_regression: float,
+  max_memory_regression: float,
+  min_time_change: float,
+  min_memory_mb: float,
+) -> list[dict]:
+  """Finds stages that are slower or allocate more than in the baseline.
+
+  Stages that are slower by no more than `min_time_change` seconds in total, or that
+  allocate less than `min_memory_mb` in the baseline, are not regressions, since the
+  differences are mostly noise.
+  """
+  baseline_results = {result["num_clues"]: result for result in baseline["results"]}
+  regressions = []
+
+  def compare(num_clues, stage, metric, value, baseline_value, is_time):
+    if is_time:
+      seconds_per_unit = report["num_boards"] / 1e6 if metric == "microseconds_per_board" else 1
+      if (value - baseline_value) * seconds_per_unit <= min_time_change:
+        return
+    elif baseline_value < min_memory_mb:
+      return
+    max_regression = max_time_regression if is_time else max_memory_regression
+    if value > baseline_value * (1 + max_regression):
+      regressions.append(
+        {
+          "num_clues": num_clues,
+          "stage": stage,
+          "metric": metric,
+          "baseline": baseline_value,
+          "value": value,
+          "change": round(value / baseline_value - 1, 3) if baseline_value else None,
+        }
+      )
+
+  for result in report["results"]:
+    baseline_result = baseline_results.get(result["num_clues"])
+    if baseline_result is None:
+      continue
+    compare(
+      result["num_clues"],
+      "all",
+      "max_rss_mb",
+      result["max_rss_mb"],
+      baseline_result["max_rss_mb"],
+      False,
+    )
+    for stage, stage_result in result["stages"].items():
+      baseline_stage_result = baseline_result["stages"].get(stage)
+      if baseline_stage_result is None:
+        continue
+      for metric, is_time in _COMPARED_METRICS.items():
+        if metric not in stage_result or metric not in baseline_stage_result:
+          continue
+        if metric == "duration_seconds" and stage in _PER_BOARD_STAGES:
+          continue
+        compare(
+          result["num_clues"],
+          stage,
+          metric,
+          stage_result[metric],
+          baseline_stage_result[metric],
+          is_time,
+        )
+  return regressions
+
+
+def main_cli():
+  parser = argparse.ArgumentParser(description="Benchmark loading the question bank")
+  parser.add_argument(
+    "--num-clues",
+    type=int,
+    nargs="+",
+    default=[10000, 100000],
+    help="Sizes of the synthetic data sets",
+  )
+  parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data sets")
+  parser.add_argument(
+    "--format", choices=["json", "jsonl"], default="json", help="Format of the data sets"
+  )
+  parser.add_argument("--num-boards", type=int, default=10000, help="Boards to sample")
+  parser.add_argument(
+    "--repeat", type=int, default=5, help="Timed runs per size, of which the fastest is kept"
+  )
+  parser.add_argument(
+    "--no-trace-allocations",
+    action="store_true",
+    help="Skip the run that traces allocations, which is several times slower",
+  )
+  parser.add_argument(
+    "--near-duplicate-threshold",
+    type=float,
+    help="Overrides JEOPARDY_NEAR_DUPLICATE_THRESHOLD, 0 skips near-duplicate filtering",
+  )
+  parser.add_argument("--output", type=str, help="Also write the report to this file")
+  parser.add_argument("--baseline", type=str, help="Report to compare against")
+  parser.add_argument(
+    "--max-time-regression",
+    type=float,
+    default=0.2,
+    help="Fraction a stage may be slower than in the baseline",
+  )
+  parser.add_argument(
+    "--max-memory-regression",
+    type=float,
+    default=0.1,
+    help="Fraction a stage may allocate more, or the peak RSS may grow, than in the baseline",
+  )
+  parser.add_argument(
+    "--min-time-change",
+    type=float,
+    default=0.01,
+    help="Seconds a stage must also be slower by in total to count as a regression",
+  )
+  parser.add_argument(
+    "--min-memory-mb",
+    type=float,
+    default=1,
+    help="MB below which allocations in the baseline are not compared",
+  )
+  args = parser.parse_args()
+
+  baseline = None
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    for key in ("seed", "format", "num_boards", "near_duplicate_threshold"):
+      if baseline[key] != getattr(args, key):
+        parser.error(f"--{key.replace('_', '-')} differs from the baseline: {baseline[key]}")
+
+  # The data sets are generated here, and each is loaded in a new process, so the peak RSS
+  # of a size does not include generating it or earlier sizes.
+  context = multiprocessing.get_context("spawn")
+  results = []
+  with tempfile.TemporaryDirectory() as directory:
+    for num_clues in args.num_clues:
+      start_time = time.perf_counter()
+      file_path = os.path.join(directory, f"jeopardy_{num_clues}.{args.format}")
+      write_dataset(make_synthetic_rows(num_clues, args.seed), file_path, args.format)
+      generate_duration = time.perf_counter() - start_time
+      with context.Pool(1) as pool:
+        result = pool.apply(
+          benchmark_dataset,
+          (
+            file_path,
+            args.num_boards,
+            args.seed,
+            args.repeat,
+            not args.no_trace_allocations,
+            args.near_duplicate_threshold,
+          ),
+        )
+      results.append(
+        {
+          "num_clues": num_clues,
+          "dataset_mb": round(os.path.getsize(file_path) / _MB, 1),
+          "generate_seconds": round(generate_duration, 3),
+          **result,
+        }
+      )
+      os.remove(file_path)
+
+  report = {
+    "python_version": platform.python_version(),
+    "seed": args.seed,
+    "format": args.format,
+    "num_boards": args.num_boards,
+    "near_duplicate_threshold": args.near_duplicate_threshold,
+    "results": results,
+  }
+  if args.output:
+    with open(args.output, "w") as f:
+      json.dump(report, f, indent=2)
+  if baseline is not None:
+    report["regressions"] = find_regressions(
+      report,
+      baseline,
+      args.max_time_regression,
+      args.max_memory_regression,
+      args.min_time_change,
+      args.min_memory_mb,
+    )
+  print(json.dumps(report, indent=2))
+  if report.get("regressions"):
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main_cli()
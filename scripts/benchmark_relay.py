@@ -0,0 +1,197 @@
+"""Benchmarks time to first audio through the Gemini Live API relay.
+
+Runs a local stand-in for the Gemini Live API with simulated connection, setup and
+response latencies, and plays one session after another against it:
+
+- `direct`: The client connects straight to the stand-in server, like the browser does
+  without the relay.
+- `relay`: Through the relay without pre-warming.
+- `relay_pooled`: Through the relay with a pool of connected upstream connections.
+- `relay_prepared`: Through the relay with pooled connections and sessions that are set
+  up before the client connects.
+
+Each session waits `--think-time` seconds after the page is loaded, which is when the
+relay prepares the session, before it connects, sends the setup message and a text turn.
+Time to first audio is measured from connecting until the first audio message arrives.
+
+Usage:
+
+  python scripts/benchmark_relay.py --sessions 10 --connect-latency 0.15 --setup-latency 0.4
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+
+import gemini_live_relay
+
+
+_API_KEY = "benchmark-api-key"
+_SETUP_MESSAGE = json.dumps({"setup": {"model": "models/stand-in"}})
+_TEXT_MESSAGE = json.dumps(
+  {
+    "client_content": {
+      "turn_complete": True,
+      "turns": [{"role": "user", "parts": [{"text": "Hi"}]}],
+    }
+  }
+)
+# 100ms of 24kHz 16-bit PCM.
+_AUDIO_MESSAGE = json.dumps(
+  {
+    "serverContent": {
+      "modelTurn": {
+        "parts": [
+          {
+            "inlineData": {
+              "mimeType": "audio/pcm;rate=24000",
+              "data": base64.b64encode(bytes(4800)).decode(),
+            }
+          }
+        ]
+      }
+    }
+  }
+).encode()
+
+
+async def start_stand_in_server(
+  connect_latency: float, setup_latency: float, response_latency: float
+):
+  """Starts a stand-in Gemini Live API server. Returns the server and its URL."""
+
+  async def process_request(connection, request):
+    # Stands in for the TLS and websocket handshakes with the real API.
+    await asyncio.sleep(connect_latency)
+
+  async def handler(websocket):
+    async for message in websocket:
+      if "setup" in json.loads(message):
+        await asyncio.sleep(setup_latency)
+        await websocket.send(json.dumps({"setupComplete": {}}).encode())
+      else:
+        await asyncio.sleep(response_latency)
+        await websocket.send(_AUDIO_MESSAGE)
+
+  server = await serve(handler, "localhost", 0, process_request=process_request)
+  port = server.sockets[0].getsockname()[1]
+  return server, f"ws://localhost:{port}"
+
+
+async def play_session(url: str) -> tuple[float, float]:
+  """Plays one session. Returns the time to setup complete and to first audio."""
+  start_time = time.monotonic()
+  async with connect(url, max_size=None) as websocket:
+    await websocket.send(_SETUP_MESSAGE)
+    await websocket.recv()
+    setup_time = time.monotonic() - start_time
+    await websocket.send(_TEXT_MESSAGE)
+    while "inlineData" not in str(await websocket.recv()):
+      pass
+    return setup_time, time.monotonic() - start_time
+
+
+async def run_mode(
+  mode: str, stand_in_url: str, num_sessions: int, think_time: float
+) -> dict[str, dict]:
+  relay = None
+  if mode != "direct":
+    relay = gemini_live_relay.GeminiLiveRelay(
+      make_endpoint=lambda api_key: stand_in_url,
+      pool_size=0 if mode == "relay" else 2,
+      prepare_setup=mode == "relay_prepared",
+      default_api_key=_API_KEY,
+    )
+    server = await relay.start("localhost", 0)
+    relay_url = f"ws://localhost:{server.sockets[0].getsockname()[1]}"
+
+  setup_times = []
+  first_audio_times = []
+  try:
+    for _ in range(num_sessions):
+      url = stand_in_url
+      if relay is not None:
+        url = f"{relay_url}?ticket={relay.prepare(_API_KEY, _SETUP_MESSAGE)}"
+      await asyncio.sleep(think_time)
+      setup_time, first_audio_time = await play_session(url)
+      setup_times.append(setup_time)
+      first_audio_times.append(first_audio_time)
+  finally:
+    if relay is not None:
+      await relay.close()
+  return {"setup_complete": summarize(setup_times), "first_audio": summarize(first_audio_times)}
+
+
+def summarize(durations: list[float]) -> dict[str, float]:
+  durations_ms = sorted(duration * 1000 for duration in durations)
+  return {
+    "count": len(durations_ms),
+    "p50_ms": round(statistics.median(durations_ms), 1),
+    "p95_ms": round(durations_ms[min(len(durations_ms) - 1, int(len(durations_ms) * 0.95))], 1),
+    "max_ms": round(durations_ms[-1], 1),
+  }
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+  stand_in_server, stand_in_url = await start_stand_in_server(
+    args.connect_latency, args.setup_latency, args.response_latency
+  )
+  try:
+    results = {}
+    for mode in ("direct", "relay", "relay_pooled", "relay_prepared"):
+      results[mode] = await run_mode(mode, stand_in_url, args.sessions, args.think_time)
+  finally:
+    stand_in_server.close()
+    await stand_in_server.wait_closed()
+  return {
+    "sessions": args.sessions,
+    "connect_latency_seconds": args.connect_latency,
+    "setup_latency_seconds": args.setup_latency,
+    "response_latency_seconds": args.response_latency,
+    "results": results,
+  }
+
+
+def main_cli():
+  parser = argparse.ArgumentParser(description="Benchmark the Gemini Live API relay")
+  parser.add_argument("--sessions", type=int, default=10, help="Sessions to play per mode")
+  parser.add_argument(
+    "--connect-latency",
+    type=float,
+    default=0.15,
+    help="Seconds the stand-in server takes to accept a connection",
+  )
+  parser.add_argument(
+    "--setup-latency",
+    type=float,
+    default=0.4,
+    help="Seconds the stand-in server takes to complete setup",
+  )
+  parser.add_argument(
+    "--response-latency",
+    type=float,
+    default=0.2,
+    help="Seconds the stand-in server takes to send the first audio of a response",
+  )
+  parser.add_argument(
+    "--think-time",
+    type=float,
+    default=2,
+    help="Seconds between loading the page and clicking Start",
+  )
+  args = parser.parse_args()
+  print(json.dumps(asyncio.run(run_benchmark(args)), indent=2))
+
+
+if __name__ == "__main__":
+  main_cli()
@@ -1,23 +1,45 @@
+import asyncio
 import json
 import os
+import re
 import typing
 import time
 from datetime import datetime
 import random
 import argparse
+import sys
+import zlib
 
 from dotenv import load_dotenv
 import google.generativeai as genai
 
+from response_cache import ResponseCache
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import near_duplicates
+
 load_dotenv()
 
 # Flash 1.5 has a requestion limit of 15 RPM
-GENERATE_DELAY = 5
+DEFAULT_RPM = 15
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 5
+MAX_BACKOFF_SECONDS = 60
+NUM_QUESTIONS_PER_CATEGORY = 5
+DEFAULT_BATCH_SIZE = 1
+DEFAULT_CACHE_DIR = ".response_cache"
+DEFAULT_CACHE_MAX_MB = 100
+DEFAULT_DUPLICATE_THRESHOLD = 0.8
 DEFAULT_JEOPARDY_DATA = "../data/custom_jeopardy.json"
+# Sidecar index of the categories in a JSONL dataset.
+CATEGORY_INDEX_SUFFIX = ".categories"
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 # Global variable to store the current dataset path
 current_dataset_path = DEFAULT_JEOPARDY_DATA
+# Dataset size the category index was last known to match.
+indexed_dataset_size = None
 
 genai.configure(api_key=GOOGLE_API_KEY)
 
@@ -28,14 +50,30 @@ class JeopardyQuestion(typing.TypedDict):
   value: str
 
 
+class JeopardyCategory(typing.TypedDict):
+  category: str
+  questions: list[JeopardyQuestion]
+
+
+MODEL_NAME = "gemini-1.5-flash"
+GENERATION_CONFIG = {
+  "temperature": 1,
+  "top_p": 0.95,
+  "top_k": 64,
+  "response_mime_type": "application/json",
+}
+
 question_gen_model = genai.GenerativeModel(
-  "gemini-1.5-flash",
+  MODEL_NAME,
+  generation_config=genai.GenerationConfig(
+    **GENERATION_CONFIG, response_schema=list[JeopardyQuestion]
+  ),
+)
+
+batch_question_gen_model = genai.GenerativeModel(
+  MODEL_NAME,
   generation_config=genai.GenerationConfig(
-    temperature=1,
-    top_p=0.95,
-    top_k=64,
-    response_mime_type="application/json",
-    response_schema=list[JeopardyQuestion],
+    **GENERATION_CONFIG, response_schema=list[JeopardyCategory]
   ),
 )
 
@@ -49,9 +87,28 @@ A Jeopardy! category has 5 questions of increasing difficulty. The values are $2
 $400, $600, $800, $1000.
 """.strip()
 
+_JEOPARDY_BATCH_GENERATE_PROMPT = """
+You are a Jeopardy! expert who specializes in crafting great questions.
+
+Generate Jeopardy! questions for each of the following categories: {categories}.
+
+A Jeopardy! category has 5 questions of increasing difficulty. The values are $200,
+$400, $600, $800, $1000.
+
+Return one entry for each category, using the category name exactly as given.
+""".strip()
+
+
+def is_jsonl_dataset() -> bool:
+  """JSONL datasets are appended to. JSON datasets are rewritten on every save."""
+  return current_dataset_path.endswith(".jsonl")
+
 
 def get_existing_categories() -> set[str]:
   """Get a set of all existing categories in the dataset."""
+  if is_jsonl_dataset():
+    return {category.lower() for category in read_category_index()}
+
   try:
     with open(current_dataset_path, "r") as f:
       data = json.load(f)
@@ -66,11 +123,121 @@ def get_existing_categories() -> set[str]:
 def read_custom_jeopardy_questions_dataset():
   try:
     with open(current_dataset_path, "r") as f:
+      if is_jsonl_dataset():
+        # Ignore a partial last line left by an interrupted append.
+        return [json.loads(line) for line in f if line.endswith("\n") and line.strip()]
       return json.load(f)
   except FileNotFoundError:
     return []
 
 
+def read_category_index() -> list[str]:
+  """Reads the category names from the sidecar index of a JSONL dataset.
+
+  Each index entry records the dataset size after the category was appended. If the last
+  entry does not match the dataset size, for example because an append was interrupted
+  or the dataset was edited by hand, the index is rebuilt from the dataset. A partial
+  last line left by an interrupted append is removed first, so it is not appended to.
+  """
+  index_path = current_dataset_path + CATEGORY_INDEX_SUFFIX
+  _truncate_partial_line(current_dataset_path)
+  dataset_size = _get_dataset_size()
+  entries = []
+  try:
+    with open(index_path, "r") as f:
+      entries = [json.loads(line) for line in f if line.endswith("\n") and line.strip()]
+  except (FileNotFoundError, json.JSONDecodeError):
+    pass
+
+  global indexed_dataset_size
+  indexed_dataset_size = dataset_size
+  if (entries[-1]["dataset_size"] if entries else 0) == dataset_size:
+    return [entry["category"] for entry in entries]
+
+  print(f"Rebuilding category index for {current_dataset_path}")
+  categories = list(
+    dict.fromkeys(row["category"] for row in read_custom_jeopardy_questions_dataset())
+  )
+  _write_file_atomically(
+    index_path,
+    "".join(_format_index_entry(category, dataset_size) for category in categories),
+  )
+  return categories
+
+
+def _get_dataset_size() -> int:
+  try:
+    return os.path.getsize(current_dataset_path)
+  except FileNotFoundError:
+    return 0
+
+
+def _format_index_entry(category: str, dataset_size: int) -> str:
+  return json.dumps({"category": category, "dataset_size": dataset_size}) + "\n"
+
+
+def _append_to_file(path: str, data: str) -> int:
+  """Appends data with a single write and fsyncs it. Returns the new file size.
+
+  Appends are not interleaved with other appends, and an interrupted append can only
+  leave a partial last line.
+  """
+  encoded_data = data.encode("utf-8")
+  fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+  try:
+    if os.write(fd, encoded_data) != len(encoded_data):
+      raise OSError(f"Partial write to {path}")
+    os.fsync(fd)
+    return os.fstat(fd).st_size
+  finally:
+    os.close(fd)
+
+
+def _truncate_partial_line(path: str):
+  """Removes a partial last line left by an interrupted append."""
+  try:
+    with open(path, "rb+") as f:
+      data = f.read()
+      if data and not data.endswith(b"\n"):
+        f.truncate(data.rfind(b"\n") + 1)
+        os.fsync(f.fileno())
+  except FileNotFoundError:
+    pass
+
+
+def _write_file_atomically(path: str, data: str):
+  temp_path = path + ".tmp"
+  with open(temp_path, "w") as f:
+    f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(temp_path, path)
+
+
+def write_jsonl_dataset(data, overwrite=False):
+  """Appends questions to a JSONL dataset and records their category in the index."""
+  index_path = current_dataset_path + CATEGORY_INDEX_SUFFIX
+  if overwrite:
+    _write_file_atomically(current_dataset_path, "")
+    _write_file_atomically(index_path, "")
+
+  if not data:
+    return
+
+  # Make sure the index is up to date before appending, since it is validated by size.
+  global indexed_dataset_size
+  if _get_dataset_size() != indexed_dataset_size:
+    read_category_index()
+  dataset_size = _append_to_file(
+    current_dataset_path, "".join(json.dumps(row) + "\n" for row in data)
+  )
+  categories = dict.fromkeys(row["category"] for row in data)
+  _append_to_file(
+    index_path, "".join(_format_index_entry(category, dataset_size) for category in categories)
+  )
+  indexed_dataset_size = dataset_size
+
+
 def write_custom_jeopardy_questions_dataset(data, overwrite=False):
   """Write questions to the dataset file.
 
@@ -81,6 +248,10 @@ def write_custom_jeopardy_questions_dataset(data, overwrite=False):
   # Create directory if it doesn't exist
   os.makedirs(os.path.dirname(current_dataset_path), exist_ok=True)
 
+  if is_jsonl_dataset():
+    write_jsonl_dataset(data, overwrite=overwrite)
+    return
+
   if overwrite:
     # In overwrite mode, simply write the new data
     with open(current_dataset_path, "w") as f:
@@ -111,22 +282,170 @@ def write_custom_jeopardy_questions_dataset(data, overwrite=False):
       json.dump(data, f, indent=2)
 
 
-def generate_questions_by_category(category) -> list[dict[str, str]]:
-  """Generate Jeopardy questions for a category using Gemini.
+class TokenBucket:
+  """Rate limiter that allows `rate_per_minute` requests per minute.
 
-  Returns:
-      Generated jeopardy data set in the expected format.
+  Up to `capacity` requests can be made in a burst.
   """
-  time.sleep(5)
-  questions = json.loads(
-    question_gen_model.generate_content(
-      _JEOPARDY_QUESTION_GENERATE_PROMPT.format(category=category)
-    ).text
+
+  def __init__(self, rate_per_minute: float, capacity: int = 1):
+    self.rate_per_second = rate_per_minute / 60
+    self.capacity = capacity
+    self.tokens = float(capacity)
+    self.updated_at = time.monotonic()
+    self.lock = asyncio.Lock()
+
+  async def acquire(self):
+    # The lock makes waiting requests take tokens in order.
+    async with self.lock:
+      while True:
+        now = time.monotonic()
+        self.tokens = min(
+          self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second
+        )
+        self.updated_at = now
+        if self.tokens >= 1:
+          self.tokens -= 1
+          return
+        await asyncio.sleep((1 - self.tokens) / self.rate_per_second)
+
+
+class GeminiModel:
+  """Generates content with the Gemini API."""
+
+  name = MODEL_NAME
+
+  async def generate(self, prompt: str, is_batch: bool) -> str:
+    model = batch_question_gen_model if is_batch else question_gen_model
+    response = await model.generate_content_async(prompt)
+    return response.text
+
+
+class StubModel:
+  """Local stand-in for the Gemini API, so generation can be benchmarked offline.
+
+  Args:
+    latency: Seconds to wait before responding.
+    failure_rate: Fraction of requests that fail, to exercise the retries.
+  """
+
+  name = "stub"
+
+  def __init__(self, latency: float = 1.0, failure_rate: float = 0.0):
+    self.latency = latency
+    self.failure_rate = failure_rate
+
+  async def generate(self, prompt: str, is_batch: bool) -> str:
+    await asyncio.sleep(self.latency)
+    if random.random() < self.failure_rate:
+      raise RuntimeError("Stub model failure")
+    if not is_batch:
+      return json.dumps(self._make_questions(prompt))
+    categories = json.loads(re.search(r"categories: (\[.*\])\.", prompt).group(1))
+    return json.dumps(
+      [
+        {"category": category, "questions": self._make_questions(category)}
+        for category in categories
+      ]
+    )
+
+  def _make_questions(self, seed: str) -> list[JeopardyQuestion]:
+    return [
+      {
+        "clue": f"Stub clue {index} for {zlib.crc32(seed.encode('utf-8'))}",
+        "answer": f"Stub answer {index}",
+        "value": f"${index * 200}",
+      }
+      for index in range(1, NUM_QUESTIONS_PER_CATEGORY + 1)
+    ]
+
+
+def make_prompt(categories: list[str]) -> str:
+  if len(categories) == 1:
+    return _JEOPARDY_QUESTION_GENERATE_PROMPT.format(category=categories[0])
+  return _JEOPARDY_BATCH_GENERATE_PROMPT.format(categories=json.dumps(categories))
+
+
+def make_cache_key(model, category: str) -> str:
+  """Cache key of the single category request, which batched responses are split into."""
+  return ResponseCache.make_key(
+    model.name,
+    {**GENERATION_CONFIG, "response_schema": "list[JeopardyQuestion]"},
+    make_prompt([category]),
   )
+
+
+def validate_questions(questions: typing.Any) -> list[JeopardyQuestion]:
+  """Checks that the generated questions match the `JeopardyQuestion` schema.
+
+  Raises:
+    ValueError: If the questions are invalid.
+  """
+  if not isinstance(questions, list) or len(questions) != NUM_QUESTIONS_PER_CATEGORY:
+    raise ValueError(f"Expected a list of {NUM_QUESTIONS_PER_CATEGORY} questions")
+  for question in questions:
+    if not isinstance(question, dict):
+      raise ValueError(f"Expected a question object, got {question!r}")
+    for field in JeopardyQuestion.__annotations__:
+      if not isinstance(question.get(field), str) or not question[field].strip():
+        raise ValueError(f"Question is missing {field}: {question!r}")
+    try:
+      int(question["value"].replace("$", "").replace(",", ""))
+    except ValueError:
+      raise ValueError(f"Invalid question value: {question['value']!r}") from None
+  return questions
+
+
+def parse_response(response: str, categories: list[str]) -> dict[str, list[JeopardyQuestion]]:
+  """Parses and validates a response, splitting batched responses by category.
+
+  Raises:
+    ValueError: If the response is invalid or is missing a category.
+  """
+  data = json.loads(response)
+  if len(categories) == 1:
+    return {categories[0]: validate_questions(data)}
+
+  if not isinstance(data, list):
+    raise ValueError("Expected a list of categories")
+  questions_by_name = {
+    entry["category"].strip().lower(): entry.get("questions")
+    for entry in data
+    if isinstance(entry, dict) and isinstance(entry.get("category"), str)
+  }
+  questions_by_category = {}
+  for category in categories:
+    if category.lower() not in questions_by_name:
+      raise ValueError(f"Response is missing category {category}")
+    questions_by_category[category] = validate_questions(questions_by_name[category.lower()])
+  return questions_by_category
+
+
+async def generate_questions_by_categories(
+  categories: list[str], model, rate_limiter: TokenBucket, max_retries: int
+) -> dict[str, list[JeopardyQuestion]]:
+  """Generate Jeopardy questions for one or more categories in a single request.
+
+  Failed requests and invalid responses are retried with exponential backoff and jitter.
+  """
+  for attempt in range(max_retries + 1):
+    await rate_limiter.acquire()
+    try:
+      response = await model.generate(make_prompt(categories), len(categories) > 1)
+      return parse_response(response, categories)
+    except Exception as e:
+      if attempt == max_retries:
+        raise
+      delay = random.uniform(0, min(MAX_BACKOFF_SECONDS, 2**attempt))
+      print(f"Retrying {', '.join(categories)} in {delay:.1f}s after error: {e}")
+      await asyncio.sleep(delay)
+
+
+def format_questions(category: str, questions: list[JeopardyQuestion]) -> list[dict[str, str]]:
+  """Format the questions like the data set."""
   questions_list = []
   air_date = datetime.now().strftime("%Y-%m-%d")
   show_number = str(random.randint(1, 2000))
-  # Format the questions like the data set.
   for question in questions:
     questions_list.append(
       {
@@ -142,6 +461,107 @@ def generate_questions_by_category(category) -> list[dict[str, str]]:
   return questions_list
 
 
+async def generate_questions(
+  categories: list[str],
+  model,
+  rpm: float,
+  concurrency: int,
+  max_retries: int,
+  batch_size: int = DEFAULT_BATCH_SIZE,
+  cache: ResponseCache | None = None,
+  duplicate_index: near_duplicates.NearDuplicateIndex | None = None,
+):
+  """Generates questions for the categories concurrently and saves them as they finish.
+
+  Categories with a cached response are saved without calling the model. The remaining
+  categories are generated in batches of `batch_size` categories per request.
+
+  Categories with a clue that is a near-duplicate of a clue in `duplicate_index` are
+  skipped. Saved clues are added to the index.
+  """
+  rate_limiter = TokenBucket(rpm)
+  semaphore = asyncio.Semaphore(concurrency)
+  start_time = time.monotonic()
+  num_done = 0
+  num_saved = 0
+
+  def save(category: str, questions: list[JeopardyQuestion] | Exception):
+    nonlocal num_done, num_saved
+    num_done += 1
+    elapsed = max(time.monotonic() - start_time, 1e-3)
+    progress = (
+      f"({num_done}/{len(categories)}, {elapsed:.0f}s, {num_done / elapsed * 60:.1f} per minute)"
+    )
+    if isinstance(questions, Exception):
+      print(f"\nError generating questions for {category} {progress}: {questions}")
+      print("Skipping to next category...")
+      return
+
+    if duplicate_index is not None:
+      for question in questions:
+        if duplicate_index.query(question["clue"], question["answer"]):
+          print(f"\nSkipping {category} {progress}: {question['clue']!r} is a near-duplicate")
+          return
+      for index, question in enumerate(questions):
+        duplicate_index.add((category, index), question["clue"], question["answer"])
+
+    questions_list = format_questions(category, questions)
+    print(f"\nGenerated questions for category: {category} {progress}")
+    print_questions(questions_list, category)
+
+    # Save after each category
+    write_custom_jeopardy_questions_dataset(questions_list, overwrite=False)
+    num_saved += 1
+    print(f"✓ Saved questions for {category}")
+
+  uncached_categories = []
+  for category in categories:
+    response = cache.get(make_cache_key(model, category)) if cache else None
+    try:
+      questions = parse_response(response, [category]) if response else None
+    except ValueError:
+      cache.invalidate(make_cache_key(model, category))
+      questions = None
+    if questions:
+      save(category, questions[category])
+    else:
+      uncached_categories.append(category)
+
+  async def generate(batch: list[str]) -> tuple[list[str], dict | Exception]:
+    async with semaphore:
+      try:
+        return batch, await generate_questions_by_categories(
+          batch, model, rate_limiter, max_retries
+        )
+      except Exception as e:
+        return batch, e
+
+  tasks = [
+    asyncio.create_task(generate(uncached_categories[index : index + batch_size]))
+    for index in range(0, len(uncached_categories), batch_size)
+  ]
+  for task in asyncio.as_completed(tasks):
+    batch, questions_by_category = await task
+    for category in batch:
+      if isinstance(questions_by_category, Exception):
+        save(category, questions_by_category)
+        continue
+      questions = questions_by_category[category]
+      if cache:
+        cache.put(make_cache_key(model, category), json.dumps(questions))
+      save(category, questions)
+
+  return num_saved
+
+
+def build_duplicate_index(threshold: float) -> near_duplicates.NearDuplicateIndex:
+  """Indexes the clues in the dataset, so new near-duplicate clues can be skipped."""
+  index = near_duplicates.NearDuplicateIndex(threshold)
+  for row_index, row in enumerate(read_custom_jeopardy_questions_dataset()):
+    index.add(row_index, row["question"], row["answer"])
+  return index
+
+
 def print_questions(questions: list[dict[str, str]], category: str):
   """Print the generated questions in a readable format."""
   print(f"\nCategory: {category}\n")
@@ -225,6 +645,58 @@ def main():
   parser.add_argument(
     "--dataset", type=str, help=f"Path to the dataset file (default: {DEFAULT_JEOPARDY_DATA})"
   )
+  parser.add_argument(
+    "--rpm", type=float, default=DEFAULT_RPM, help="Maximum requests per minute to the model"
+  )
+  parser.add_argument(
+    "--concurrency",
+    type=int,
+    default=DEFAULT_CONCURRENCY,
+    help="Maximum number of concurrent requests to the model",
+  )
+  parser.add_argument(
+    "--max-retries",
+    type=int,
+    default=DEFAULT_MAX_RETRIES,
+    help="Number of times to retry a category before skipping it",
+  )
+  parser.add_argument(
+    "--stub-model",
+    type=float,
+    metavar="LATENCY",
+    help="Use a local stub model that responds after LATENCY seconds, for benchmarking",
+  )
+  parser.add_argument(
+    "--batch-size",
+    type=int,
+    default=DEFAULT_BATCH_SIZE,
+    help="Number of categories to generate in a single request",
+  )
+  parser.add_argument(
+    "--cache-dir",
+    type=str,
+    default=DEFAULT_CACHE_DIR,
+    help=f"Directory to cache model responses in (default: {DEFAULT_CACHE_DIR})",
+  )
+  parser.add_argument(
+    "--cache-max-mb",
+    type=float,
+    default=DEFAULT_CACHE_MAX_MB,
+    help="Maximum size of the response cache before old responses are evicted",
+  )
+  parser.add_argument("--no-cache", action="store_true", help="Do not use the response cache")
+  parser.add_argument(
+    "--clear-cache", action="store_true", help="Delete all cached responses before generating"
+  )
+  parser.add_argument(
+    "--duplicate-threshold",
+    type=float,
+    default=DEFAULT_DUPLICATE_THRESHOLD,
+    help="Skip categories with a clue at least this similar to an existing clue. 0 disables.",
+  )
+  parser.add_argument(
+    "--yes", action="store_true", help="Do not ask for confirmation before overwriting"
+  )
   args = parser.parse_args()
 
   # Set the dataset path
@@ -260,7 +732,7 @@ def main():
     print(f"{i}. {category}")
   print()
 
-  if args.overwrite:
+  if args.overwrite and not args.yes:
     print("Warning: This will overwrite all existing questions!")
     confirm = input("Do you want to continue? (y/N): ")
     if confirm.lower() != "y":
@@ -272,22 +744,36 @@ def main():
     write_custom_jeopardy_questions_dataset([], overwrite=True)
     print("Initialized empty dataset for overwrite mode")
 
-  for i, category in enumerate(categories, 1):
-    print(f"\nGenerating questions for category: {category} ({i}/{len(categories)})")
-    try:
-      questions = generate_questions_by_category(category)
-      print_questions(questions, category)
-
-      # Save after each category
-      write_custom_jeopardy_questions_dataset(questions, overwrite=False)
-      print(f"✓ Saved questions for {category}")
-
-    except Exception as e:
-      print(f"Error generating questions for {category}: {str(e)}")
-      print("Skipping to next category...")
-      continue
+  cache = None
+  if not args.no_cache:
+    cache = ResponseCache(args.cache_dir, int(args.cache_max_mb * 1024 * 1024))
+    if args.clear_cache:
+      cache.clear()
+
+  duplicate_index = None
+  if args.duplicate_threshold:
+    duplicate_index = build_duplicate_index(args.duplicate_threshold)
+
+  model = StubModel(args.stub_model) if args.stub_model is not None else GeminiModel()
+  start_time = time.monotonic()
+  num_saved = asyncio.run(
+    generate_questions(
+      categories,
+      model,
+      args.rpm,
+      args.concurrency,
+      args.max_retries,
+      batch_size=args.batch_size,
+      cache=cache,
+      duplicate_index=duplicate_index,
+    )
+  )
+  elapsed = time.monotonic() - start_time
 
-  print(f"\nCompleted processing {len(categories)} categories.")
+  print(f"\nCompleted processing {len(categories)} categories in {elapsed:.1f}s.")
+  print(f"Saved {num_saved} categories. Skipped {len(categories) - num_saved}.")
+  if cache:
+    print(f"Response cache: {cache.hits} hits, {cache.misses} misses.")
   print(f"All generated questions have been saved to {current_dataset_path}")
 
 
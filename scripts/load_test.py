@@ -0,0 +1,116 @@
+"""Load tests how many concurrent websocket sessions a node can hold.
+
+Run the app with `MESOP_WEBSOCKETS_ENABLED=true`, then open sessions against it. Each
+simulated session opens a Mesop websocket, loads the page and then reloads it every
+`--interval` seconds while it is held open. The sessions are opened gradually at
+`--ramp` sessions per second.
+
+Usage:
+
+  MESOP_WEBSOCKETS_ENABLED=true gunicorn server:app
+  python scripts/load_test.py --url ws://localhost:7860/__ui__ --sessions 200 --duration 60
+
+The report includes how many sessions connected, failed or were dropped, and the page
+load latency percentiles.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import statistics
+import time
+from collections import Counter
+
+from mesop.protos import ui_pb2 as pb
+from websockets.asyncio.client import connect
+
+
+def make_init_request() -> str:
+  ui_request = pb.UiRequest(path="/", init=pb.InitRequest())
+  return base64.urlsafe_b64encode(ui_request.SerializeToString()).decode("ascii")
+
+
+async def run_session(
+  url: str, duration: float, interval: float, latencies: list[float], results: Counter
+):
+  init_request = make_init_request()
+  try:
+    async with connect(url, open_timeout=30, max_size=None) as websocket:
+      results["connected"] += 1
+      end_time = time.monotonic() + duration
+      while True:
+        start_time = time.monotonic()
+        await websocket.send(init_request)
+        await asyncio.wait_for(websocket.recv(), timeout=30)
+        latencies.append(time.monotonic() - start_time)
+        # Drain the rest of the render before the next request.
+        await _drain(websocket)
+        if time.monotonic() + interval > end_time:
+          break
+        await asyncio.sleep(interval)
+      results["completed"] += 1
+  except (OSError, asyncio.TimeoutError) as e:
+    results[f"failed: {type(e).__name__}"] += 1
+  except Exception as e:
+    key = "dropped" if results["connected"] else "failed"
+    results[f"{key}: {type(e).__name__}"] += 1
+
+
+async def _drain(websocket):
+  while True:
+    try:
+      await asyncio.wait_for(websocket.recv(), timeout=0.1)
+    except asyncio.TimeoutError:
+      return
+
+
+async def run_load_test(
+  url: str, sessions: int, ramp: float, duration: float, interval: float
+) -> dict:
+  latencies = []
+  results = Counter()
+  start_time = time.monotonic()
+  tasks = []
+  for _ in range(sessions):
+    tasks.append(asyncio.create_task(run_session(url, duration, interval, latencies, results)))
+    await asyncio.sleep(1 / ramp)
+  await asyncio.gather(*tasks)
+
+  latencies_ms = sorted(latency * 1000 for latency in latencies)
+  report = {
+    "sessions": sessions,
+    "duration_seconds": round(time.monotonic() - start_time, 1),
+    "results": dict(results),
+    "page_loads": len(latencies_ms),
+  }
+  if latencies_ms:
+    report["page_load_ms"] = {
+      "p50": round(statistics.median(latencies_ms), 1),
+      "p95": round(latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.95))], 1),
+      "max": round(latencies_ms[-1], 1),
+    }
+  return report
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Load test concurrent websocket sessions")
+  parser.add_argument(
+    "--url", type=str, default="ws://localhost:7860/__ui__", help="Mesop websocket URL"
+  )
+  parser.add_argument("--sessions", type=int, default=100, help="Number of sessions to open")
+  parser.add_argument("--ramp", type=float, default=20, help="Sessions to open per second")
+  parser.add_argument(
+    "--duration", type=float, default=30, help="Seconds to hold each session open"
+  )
+  parser.add_argument("--interval", type=float, default=5, help="Seconds between page loads")
+  args = parser.parse_args()
+
+  report = asyncio.run(
+    run_load_test(args.url, args.sessions, args.ramp, args.duration, args.interval)
+  )
+  print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+  main()
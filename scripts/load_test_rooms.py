@@ -0,0 +1,242 @@
+"""Load tests multiplayer rooms with many simulated players per room.
+
+Run the app with `MESOP_WEBSOCKETS_ENABLED=true`, then run this script from the same
+checkout, since the Mesop event handler IDs are computed from the source of `main.py`.
+
+Each room has one host and several players. The host stands in for the Gemini Live API
+by sending the tool calls that select a clue and score the response, and all players buzz
+in for each clue. The report includes how long it took for each room update to reach
+every player in the room.
+
+Usage:
+
+  MESOP_WEBSOCKETS_ENABLED=true gunicorn server:app
+  python scripts/load_test_rooms.py --rooms 10 --players-per-room 8 --clues 5
+"""
+
+import argparse
+import asyncio
+import base64
+import bisect
+import json
+import os
+import secrets
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mesop.component_helpers.helper import compute_fn_id
+from mesop.protos import ui_pb2 as pb
+from websockets.asyncio.client import connect
+
+import main
+
+# Time without messages after which a room is considered settled between steps.
+_SETTLE_SECONDS = 0.2
+_UPDATE_TIMEOUT_SECONDS = 30
+
+
+class SimulatedPlayer:
+  def __init__(self, websocket, room_id: str, errors: Counter):
+    self.websocket = websocket
+    self.room_id = room_id
+    self.errors = errors
+    self.arrival_times: list[float] = []
+    self.reader = asyncio.create_task(self._read())
+
+  async def send_init(self):
+    await self._send(
+      pb.UiRequest(path="/", init=pb.InitRequest(query_params=[self._room_query_param()]))
+    )
+
+  async def send_click(self, handler_id: str):
+    await self._send_event(pb.UserEvent(handler_id=handler_id, click=pb.ClickEvent()))
+
+  async def send_web_event(self, handler_id: str, value: dict):
+    await self._send_event(pb.UserEvent(handler_id=handler_id, string_value=json.dumps(value)))
+
+  async def wait_for_update(self, after: float) -> float:
+    """Returns the time of the first message received after the given time."""
+    deadline = time.monotonic() + _UPDATE_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+      index = bisect.bisect_right(self.arrival_times, after)
+      if index < len(self.arrival_times):
+        return self.arrival_times[index]
+      await asyncio.sleep(0.005)
+    raise asyncio.TimeoutError()
+
+  async def _send_event(self, user_event: pb.UserEvent):
+    user_event.query_params.append(self._room_query_param())
+    await self._send(pb.UiRequest(path="/", user_event=user_event))
+
+  async def _send(self, ui_request: pb.UiRequest):
+    await self.websocket.send(base64.urlsafe_b64encode(ui_request.SerializeToString()).decode())
+
+  def _room_query_param(self) -> pb.QueryParam:
+    return pb.QueryParam(key="room", values=[self.room_id])
+
+  async def _read(self):
+    async for message in self.websocket:
+      self.arrival_times.append(time.monotonic())
+      data = message.removeprefix("data: ").strip()
+      if data == "<stream_end>":
+        continue
+      response = pb.UiResponse.FromString(base64.b64decode(data))
+      if response.HasField("error"):
+        self.errors[response.error.exception[:80]] += 1
+
+
+async def settle(players: list[SimulatedPlayer]):
+  """Waits until no player has received a message for a short while."""
+  while True:
+    last_arrival = max(
+      (player.arrival_times[-1] for player in players if player.arrival_times), default=0
+    )
+    remaining = last_arrival + _SETTLE_SECONDS - time.monotonic()
+    if remaining <= 0:
+      return
+    await asyncio.sleep(remaining)
+
+
+async def measure_broadcast(
+  players: list[SimulatedPlayer], start_time: float, latencies: list[float]
+):
+  arrival_times = await asyncio.gather(*(player.wait_for_update(start_time) for player in players))
+  latencies.extend(arrival_time - start_time for arrival_time in arrival_times)
+
+
+async def run_room(
+  url: str,
+  num_players: int,
+  num_clues: int,
+  handler_ids: dict[str, str],
+  latencies: dict[str, list[float]],
+  errors: Counter,
+):
+  room_id = secrets.token_urlsafe(6)
+  websockets = await asyncio.gather(
+    *(connect(url, open_timeout=30, max_size=None) for _ in range(num_players))
+  )
+  players = [SimulatedPlayer(websocket, room_id, errors) for websocket in websockets]
+  host = players[0]
+  try:
+    # The first player to join is the host.
+    start_time = time.monotonic()
+    await host.send_init()
+    await host.wait_for_update(start_time)
+    start_time = time.monotonic()
+    await asyncio.gather(*(player.send_init() for player in players[1:]))
+    await measure_broadcast(players, start_time, latencies["join"])
+    await settle(players)
+
+    await host.send_web_event(handler_ids["start"], {})
+    await settle(players)
+
+    for clue_index in range(num_clues):
+      category_index, dollar_index = clue_index % 6, clue_index // 6 % 5
+      start_time = time.monotonic()
+      await host.send_web_event(
+        handler_ids["tool_calls"],
+        {
+          "toolCalls": json.dumps(
+            [
+              {
+                "id": str(clue_index),
+                "name": "get_clue",
+                "args": {"category_index": category_index, "dollar_index": dollar_index},
+              }
+            ]
+          )
+        },
+      )
+      await measure_broadcast(players, start_time, latencies["select_clue"])
+      await settle(players)
+
+      start_time = time.monotonic()
+      await asyncio.gather(*(player.send_click(handler_ids["buzz"]) for player in players))
+      await measure_broadcast(players, start_time, latencies["buzz"])
+      await settle(players)
+
+      start_time = time.monotonic()
+      await host.send_web_event(
+        handler_ids["tool_calls"],
+        {
+          "toolCalls": json.dumps(
+            [{"id": f"score-{clue_index}", "name": "update_score", "args": {"is_correct": True}}]
+          )
+        },
+      )
+      await measure_broadcast(players, start_time, latencies["update_score"])
+      await settle(players)
+  finally:
+    for player in players:
+      await player.websocket.close()
+      player.reader.cancel()
+
+
+def summarize(values: list[float]) -> dict:
+  values_ms = sorted(value * 1000 for value in values)
+  if not values_ms:
+    return {}
+  return {
+    "count": len(values_ms),
+    "p50_ms": round(statistics.median(values_ms), 1),
+    "p95_ms": round(values_ms[min(len(values_ms) - 1, int(len(values_ms) * 0.95))], 1),
+    "max_ms": round(values_ms[-1], 1),
+  }
+
+
+async def run_load_test(
+  url: str, num_rooms: int, num_players: int, num_clues: int, handler_ids: dict[str, str]
+) -> dict:
+  latencies = defaultdict(list)
+  errors = Counter()
+  start_time = time.monotonic()
+  results = await asyncio.gather(
+    *(
+      run_room(url, num_players, num_clues, handler_ids, latencies, errors)
+      for _ in range(num_rooms)
+    ),
+    return_exceptions=True,
+  )
+  failed_rooms = Counter(
+    f"{type(result).__name__}: {result}" for result in results if result is not None
+  )
+  return {
+    "rooms": num_rooms,
+    "players_per_room": num_players,
+    # One Gemini Live API session per room instead of one per player.
+    "host_sessions": num_rooms,
+    "failed_rooms": dict(failed_rooms),
+    "server_errors": dict(errors),
+    "duration_seconds": round(time.monotonic() - start_time, 1),
+    "update_latency": {name: summarize(values) for name, values in latencies.items()},
+  }
+
+
+def main_cli():
+  parser = argparse.ArgumentParser(description="Load test multiplayer rooms")
+  parser.add_argument(
+    "--url", type=str, default="ws://localhost:7860/__ui__", help="Mesop websocket URL"
+  )
+  parser.add_argument("--rooms", type=int, default=10, help="Number of rooms")
+  parser.add_argument("--players-per-room", type=int, default=8, help="Players in each room")
+  parser.add_argument("--clues", type=int, default=5, help="Clues to play in each room")
+  args = parser.parse_args()
+
+  handler_ids = {
+    "start": compute_fn_id(main.on_gemini_live_api_started),
+    "tool_calls": compute_fn_id(main.handle_tool_calls),
+    "buzz": compute_fn_id(main.on_click_buzz),
+  }
+  report = asyncio.run(
+    run_load_test(args.url, args.rooms, args.players_per_room, args.clues, handler_ids)
+  )
+  print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+  main_cli()
@@ -0,0 +1,184 @@
+"""Replays a session recorded with `JEOPARDY_RECORDINGS_DIR`.
+
+The Mesop events are replayed against the app in-process, without a browser or network
+access. The board is restored from the recording, so every replay sees the same clues.
+For each event we measure the event handler duration, the page render duration and the
+serialized state size, and we record the tool call results.
+
+The recorded websocket traffic can also be served by a stand-in Gemini Live API server.
+Run the app with `GEMINI_LIVE_API_ENDPOINT=ws://localhost:<port>` to drive the web
+components from the recording. Audio sent by the browser is ignored, since it will not
+match the recording.
+
+Usage:
+
+  python scripts/replay_session.py recordings/<id>.jsonl.gz --speed 0 --output report.json
+  python scripts/replay_session.py recordings/<id>.jsonl.gz --serve-websocket 8765
+
+A speed of 1 replays in real time, 10 replays ten times faster, and 0 replays as fast as
+possible. Handler durations include any sleeps in the handlers themselves.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import flask
+import mesop as me
+import mesop.labs as mel
+from mesop.dataclass_utils import serialize_dataclass
+from mesop.runtime import runtime
+from websockets.asyncio.server import serve
+
+import main
+import session_recorder
+from models import Board
+from state import State
+
+
+_EVENT_TYPES = {
+  "ClickEvent": lambda record: me.ClickEvent(key=record["key"], is_target=True),
+  "InputBlurEvent": lambda record: me.InputBlurEvent(key=record["key"], value=record["value"]),
+  "WebEvent": lambda record: mel.WebEvent(key=record["key"], value=record["value"]),
+}
+
+
+def replay_events(records: list[dict], speed: float) -> dict:
+  """Replays the recorded Mesop events and returns a report."""
+  start_record = next(record for record in records if record["type"] == "start")
+  durations = defaultdict(lambda: [])
+  render_durations = []
+  state_sizes = []
+  tool_calls = Counter()
+
+  flask_app = flask.Flask(__name__)
+  with flask_app.test_request_context():
+    state = me.state(State)
+    state.board = Board(**start_record["board"])
+
+    # The on_load event is not recorded since recording starts in on_load.
+    events = [{"type": "event", "time": start_record["time"], "handler": "on_load"}]
+    events.extend(record for record in records if record["type"] == "event")
+    previous_time = start_record["time"]
+    for record in events:
+      _sleep((record["time"] - previous_time) / 1000, speed)
+      previous_time = record["time"]
+      handler = getattr(main, record["handler"])
+      if record["handler"] == "on_load":
+        event = me.LoadEvent(path="/")
+      else:
+        event = _EVENT_TYPES[record["event_type"]](record)
+
+      state.tool_call_responses = ""
+      start_time = time.perf_counter()
+      result = handler(event)
+      if result is not None:
+        for _ in result:
+          pass
+      durations[handler.__name__].append(time.perf_counter() - start_time)
+
+      runtime().context().reset_current_node()
+      start_time = time.perf_counter()
+      main.app()
+      render_durations.append(time.perf_counter() - start_time)
+      state_sizes.append(len(serialize_dataclass(state)))
+
+      if state.tool_call_responses:
+        for response in json.loads(state.tool_call_responses):
+          tool_calls[f"{response['name']}: {response['response']['result']}"] += 1
+
+    final_score = state.score
+
+  return {
+    "events": len(events),
+    "handlers": {name: _summarize(values) for name, values in durations.items()},
+    "render": _summarize(render_durations),
+    "state_size_bytes": {"max": max(state_sizes), "final": state_sizes[-1]},
+    "tool_calls": dict(tool_calls),
+    "final_score": final_score,
+  }
+
+
+async def serve_websocket_traffic(records: list[dict], port: int, speed: float):
+  """Serves the recorded websocket traffic to each client that connects."""
+
+  async def handler(websocket):
+    frames = [record for record in records if record["type"] in ("ws_send", "ws_recv")]
+    previous_time = frames[0]["time"] if frames else 0
+    for frame in frames:
+      if frame["type"] == "ws_send":
+        if not _is_audio_message(frame["data"]):
+          await _receive_non_audio_message(websocket)
+      else:
+        await asyncio.sleep((frame["time"] - previous_time) / 1000 / speed if speed else 0)
+        await websocket.send(frame["data"])
+      previous_time = frame["time"]
+
+  async with serve(handler, "localhost", port):
+    print(f"Serving recorded websocket traffic at ws://localhost:{port}")
+    await asyncio.get_running_loop().create_future()
+
+
+async def _receive_non_audio_message(websocket):
+  while True:
+    message = await websocket.recv()
+    if not _is_audio_message(message):
+      return message
+
+
+def _is_audio_message(data: str | bytes) -> bool:
+  return "realtime_input" in json.loads(data)
+
+
+def _sleep(seconds: float, speed: float):
+  if speed > 0 and seconds > 0:
+    time.sleep(seconds / speed)
+
+
+def _summarize(durations: list[float]) -> dict[str, float]:
+  durations_ms = sorted(duration * 1000 for duration in durations)
+  return {
+    "count": len(durations_ms),
+    "p50_ms": statistics.median(durations_ms),
+    "p95_ms": durations_ms[min(len(durations_ms) - 1, int(len(durations_ms) * 0.95))],
+    "max_ms": durations_ms[-1],
+  }
+
+
+def main_cli():
+  parser = argparse.ArgumentParser(description="Replay a recorded Jeopardy session")
+  parser.add_argument("recording", type=str, help="Path to the recording")
+  parser.add_argument(
+    "--speed", type=float, default=1, help="Replay speed. 0 replays as fast as possible."
+  )
+  parser.add_argument("--output", type=str, help="Path to write the JSON report to")
+  parser.add_argument(
+    "--serve-websocket",
+    type=int,
+    metavar="PORT",
+    help="Serve the recorded websocket traffic on this port instead of replaying events",
+  )
+  args = parser.parse_args()
+
+  records = list(session_recorder.read(args.recording))
+
+  if args.serve_websocket:
+    asyncio.run(serve_websocket_traffic(records, args.serve_websocket, args.speed))
+    return
+
+  report = json.dumps(replay_events(records, args.speed), indent=2)
+  if args.output:
+    with open(args.output, "w") as f:
+      f.write(report)
+  print(report)
+
+
+if __name__ == "__main__":
+  main_cli()
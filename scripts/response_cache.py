@@ -0,0 +1,92 @@
+"""Content-addressed on-disk cache of model responses for `generate_clues.py`.
+
+Responses are keyed by a hash of the model name, the generation config and the prompt,
+so changing any of them misses the cache. Each response is stored in its own file. When
+the cache grows past `max_bytes`, the least recently used responses are deleted.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from typing import Any
+
+
+class ResponseCache:
+  def __init__(self, cache_dir: str, max_bytes: int):
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    os.makedirs(cache_dir, exist_ok=True)
+    self.total_bytes = sum(os.path.getsize(path) for path in self._entry_paths())
+
+  @staticmethod
+  def make_key(model: str, generation_config: dict[str, Any], prompt: str) -> str:
+    data = json.dumps(
+      {"model": model, "generation_config": generation_config, "prompt": prompt},
+      sort_keys=True,
+    )
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+  def get(self, key: str) -> str | None:
+    path = self._path(key)
+    try:
+      with open(path, "r") as f:
+        response = f.read()
+    except FileNotFoundError:
+      self.misses += 1
+      return None
+    # The modification time is used to find the least recently used responses.
+    os.utime(path)
+    self.hits += 1
+    return response
+
+  def put(self, key: str, response: str):
+    path = self._path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    self.invalidate(key)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+      f.write(response)
+    os.replace(temp_path, path)
+    self.total_bytes += os.path.getsize(path)
+    if self.total_bytes > self.max_bytes:
+      self._evict()
+
+  def invalidate(self, key: str):
+    """Deletes a cached response, for example one that turned out to be invalid."""
+    path = self._path(key)
+    try:
+      size = os.path.getsize(path)
+      os.remove(path)
+      self.total_bytes -= size
+    except FileNotFoundError:
+      pass
+
+  def clear(self):
+    shutil.rmtree(self.cache_dir, ignore_errors=True)
+    os.makedirs(self.cache_dir, exist_ok=True)
+    self.total_bytes = 0
+
+  def _evict(self):
+    """Deletes the least recently used responses until the cache is 90% full."""
+    entries = sorted(
+      (os.path.getmtime(path), os.path.getsize(path), path) for path in self._entry_paths()
+    )
+    for _, size, path in entries:
+      if self.total_bytes <= self.max_bytes * 0.9:
+        break
+      os.remove(path)
+      self.total_bytes -= size
+
+  def _path(self, key: str) -> str:
+    return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+  def _entry_paths(self) -> list[str]:
+    return [
+      os.path.join(directory, file_name)
+      for directory, _, file_names in os.walk(self.cache_dir)
+      for file_name in file_names
+      if file_name.endswith(".json")
+    ]
@@ -0,0 +1,139 @@
+"""WSGI entry point for running the app with gunicorn.
+
+Mesop creates its Flask app internally, so operational routes such as health checks are
+served by a small Flask app in front of it. All other requests are passed to Mesop.
+
+Run with:
+
+  gunicorn server:app
+"""
+
+import threading
+from typing import Any, Callable
+
+import flask
+import mesop as me
+
+import clue_audio_cache
+import main  # Registers the Mesop pages.
+import metrics
+import question_bank_loader
+import score_store
+import session_recorder
+
+
+_MAX_TELEMETRY_BATCH_BYTES = 64 * 1024
+_MAX_LEADERBOARD_LIMIT = 100
+_WEBSOCKET_RECORD_TYPES = frozenset(["ws_send", "ws_recv"])
+
+ops_app = flask.Flask(__name__)
+
+# Set when the worker is shutting down, so no new sessions are routed to it.
+_draining = threading.Event()
+
+
+def start_draining():
+  _draining.set()
+
+
+@ops_app.get("/healthz")
+def healthz():
+  """Liveness check. Healthy as soon as the app can serve boards, even fallback ones."""
+  return question_bank_loader.status()
+
+
+@ops_app.get("/readyz")
+def readyz():
+  """Readiness check. Only ready once the full question bank has loaded.
+
+  Not ready while the worker is draining for shutdown.
+  """
+  status = {**question_bank_loader.status(), "draining": _draining.is_set()}
+  return status, 200 if status["ready"] and not status["draining"] else 503
+
+
+@ops_app.get("/metrics")
+def prometheus_metrics():
+  """Metrics in the Prometheus text format. Each gunicorn worker reports its own."""
+  return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+@ops_app.get("/leaderboard")
+def leaderboard():
+  """Highest scores of all games, or of the games of a `day` or `board`."""
+  if not score_store.is_enabled():
+    return "", 404
+  limit = min(flask.request.args.get("limit", 10, type=int), _MAX_LEADERBOARD_LIMIT)
+  kind, key = "all", ""
+  for name in ("day", "board"):
+    if name in flask.request.args:
+      kind, key = name, flask.request.args[name]
+  entries = score_store.get().leaderboard(kind, key, limit)
+  return {"leaderboard": [entry._asdict() for entry in entries]}
+
+
+@ops_app.post("/telemetry")
+def client_telemetry():
+  """Receives batches of client telemetry from the web components."""
+  if (flask.request.content_length or 0) > _MAX_TELEMETRY_BATCH_BYTES:
+    return "", 413
+  batch = flask.request.get_json(force=True, silent=True)
+  if not isinstance(batch, dict):
+    return "", 400
+  try:
+    metrics.record_client_batch(batch)
+  except (KeyError, TypeError, ValueError, AttributeError):
+    return "", 400
+  return "", 204
+
+
+@ops_app.post("/recordings/<recording_id>")
+def session_recording(recording_id: str):
+  """Receives batches of websocket traffic for a recorded session."""
+  if not session_recorder.is_enabled() or not session_recorder.exists(recording_id):
+    return "", 404
+  if (flask.request.content_length or 0) > session_recorder.MAX_BATCH_BYTES:
+    return "", 413
+  records = flask.request.get_json(force=True, silent=True)
+  if not isinstance(records, list):
+    return "", 400
+  appended = session_recorder.append(
+    recording_id,
+    [
+      record
+      for record in records
+      if isinstance(record, dict) and record.get("type") in _WEBSOCKET_RECORD_TYPES
+    ],
+  )
+  return "", 204 if appended else 413
+
+
+@ops_app.get("/clue_audio/<key>")
+def clue_audio(key: str):
+  """Serves cached clue audio as zlib-compressed 24kHz PCM."""
+  if not clue_audio_cache.is_enabled() or not clue_audio_cache.is_valid_key(key):
+    return "", 404
+  data = clue_audio_cache.read(key)
+  if data is None:
+    return "", 404
+  return (
+    data,
+    200,
+    {
+      "Content-Type": "application/octet-stream",
+      "Content-Encoding": "deflate",
+      # Entries are keyed by their content, so they never change.
+      "Cache-Control": "public, max-age=86400, immutable",
+    },
+  )
+
+
+_OPS_PATHS = frozenset(["/healthz", "/readyz", "/metrics", "/telemetry", "/leaderboard"])
+_OPS_PATH_PREFIXES = ("/recordings/", "/clue_audio/")
+
+
+def app(environ: dict[str, Any], start_response: Callable[..., Any]):
+  path = environ.get("PATH_INFO", "")
+  if path in _OPS_PATHS or path.startswith(_OPS_PATH_PREFIXES):
+    return ops_app(environ, start_response)
+  return me(environ, start_response)
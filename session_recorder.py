@@ -0,0 +1,136 @@
+"""Records live game sessions so they can be replayed with `scripts/replay_session.py`.
+
+Recording is enabled by setting `JEOPARDY_RECORDINGS_DIR`. Each session is written to
+its own gzipped JSONL file in that directory. A recording contains:
+
+- A start record with the board, so the replay uses the same clues.
+- The Mesop events handled by `main.py`.
+- The websocket traffic between the browser and the Gemini Live API, which the
+  `gemini_live_connection` web component sends to `server.py` in batches.
+
+Each record has a `type` and a `time` in milliseconds since the epoch. Records are
+appended as separate gzip members, which together are still a valid gzip file.
+
+The Google API key is never recorded.
+
+Websocket traffic is uploaded by the browser, so it is only accepted for recordings that
+were started by the server, in batches of at most `MAX_BATCH_BYTES`. Records that would
+grow a recording past `JEOPARDY_RECORDING_MAX_MB` (default 200) are dropped.
+"""
+
+import functools
+import gzip
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any, Callable, Iterator
+
+import mesop as me
+
+from models import Board
+
+
+_RECORDINGS_DIR = os.getenv("JEOPARDY_RECORDINGS_DIR", "")
+_RECORDING_FILE = "{recording_id}.jsonl.gz"
+_RECORDING_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+_MAX_RECORDING_BYTES = int(float(os.getenv("JEOPARDY_RECORDING_MAX_MB", "200")) * 1024 * 1024)
+# Batches are sent every 5 seconds, which is about 1MB of audio.
+MAX_BATCH_BYTES = 4 * 1024 * 1024
+
+_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+  return bool(_RECORDINGS_DIR)
+
+
+def is_valid_recording_id(recording_id: str) -> bool:
+  return bool(_RECORDING_ID_PATTERN.match(recording_id))
+
+
+def exists(recording_id: str) -> bool:
+  """Whether the recording was started."""
+  return is_valid_recording_id(recording_id) and os.path.exists(_path(recording_id))
+
+
+def start(board: Board) -> str:
+  """Starts a new recording. Returns the recording ID."""
+  recording_id = uuid.uuid4().hex
+  os.makedirs(_RECORDINGS_DIR, exist_ok=True)
+  append(recording_id, [{"type": "start", "time": _now(), "board": board.model_dump()}])
+  return recording_id
+
+
+def append(recording_id: str, records: list[dict[str, Any]]) -> bool:
+  """Appends records to a recording. Returns False if the recording is full."""
+  if not is_valid_recording_id(recording_id):
+    raise ValueError(f"Invalid recording ID: {recording_id}")
+  data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+  compressed = gzip.compress(data.encode("utf-8"))
+  path = _path(recording_id)
+  with _lock:
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    if size + len(compressed) > _MAX_RECORDING_BYTES:
+      return False
+    with open(path, "ab") as f:
+      f.write(compressed)
+  return True
+
+
+def read(path: str) -> Iterator[dict[str, Any]]:
+  """Reads the records of a recording in time order."""
+  with gzip.open(path, "rt") as f:
+    records = [json.loads(line) for line in f if line.strip()]
+  # Python's sort is stable, so records with the same time keep their order.
+  return iter(sorted(records, key=lambda record: record["time"]))
+
+
+def record_events(state_class: type) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+  """Records the events handled by a Mesop event handler.
+
+  Events are only recorded once the session has a recording ID. Do not use this on
+  handlers whose events contain secrets, such as the API key input.
+
+  When combined with other decorators, this must be the outermost decorator since it
+  does not preserve generator functions.
+
+  Args:
+    state_class: Mesop state class with a `recording_id` field.
+  """
+
+  def decorator(handler: Callable[..., Any]) -> Callable[..., Any]:
+    handler_name = handler.__name__
+
+    @functools.wraps(handler)
+    def wrapper(event):
+      recording_id = me.state(state_class).recording_id
+      if recording_id:
+        append(
+          recording_id,
+          [
+            {
+              "type": "event",
+              "time": _now(),
+              "handler": handler_name,
+              "event_type": type(event).__name__,
+              "key": getattr(event, "key", ""),
+              "value": getattr(event, "value", None),
+            }
+          ],
+        )
+      return handler(event)
+
+    return wrapper
+
+  return decorator
+
+
+def _path(recording_id: str) -> str:
+  return os.path.join(_RECORDINGS_DIR, _RECORDING_FILE.format(recording_id=recording_id))
+
+
+def _now() -> int:
+  return int(time.time() * 1000)
@@ -1,21 +1,35 @@
 from typing import Literal
-from dataclasses import field
-import random
-import os
+from dataclasses import dataclass, field
 
-import question_bank
+import gemini_live_relay
+import question_bank_loader
 import mesop as me
 from models import Board
 
 
 _NUM_CATEGORIES = 6
-_QUESTION_SETS = question_bank.load()
+
+# Load the question bank without blocking startup.
+question_bank_loader.start()
+# Before `State` is defined, since its default API key depends on whether the relay runs
+# in this worker.
+gemini_live_relay.start()
+
+
+@dataclass
+class RoomPlayer:
+  name: str = ""
+  score: int = 0
+  is_host: bool = False
+  # Place in the buzz order of the selected clue. 0 if the player has not buzzed in.
+  buzz_position: int = 0
+  is_self: bool = False
 
 
 @me.stateclass
 class State:
   selected_clue: str
-  board: Board = field(default_factory=lambda: make_default_board(_QUESTION_SETS))
+  board: Board = field(default_factory=lambda: make_default_board(question_bank_loader.current()))
   # Used for clearing the text input.
   response_value: str
   response: str
@@ -25,17 +39,51 @@ class State:
   # Set is not JSON serializable
   # Key format: click-{row_index}-{col_index}
   answered_questions: set[str] = field(default_factory=set)
+  # Index into `rounds.ROUND_NAMES`.
+  round_index: int = 0
+  # Identifies the game in the score store. See `score_store`.
+  game_id: str = ""
+  # Resumes the game from its latest snapshot. See `game_snapshots`.
+  resume_token: str = ""
+  # Date of the board of the day being played, if any. See `daily`.
+  daily_date: str = ""
   # Gemini Live API
-  api_key: str = os.getenv("GOOGLE_API_KEY", "")
+  # Key entered in the page. Use `gemini_live_relay.session_api_key` for the key the
+  # session connects with, which can be the server's key.
+  api_key: str = gemini_live_relay.default_api_key()
   gemini_live_api_enabled: bool = False
   gemini_live_api_config: str
   audio_player_enabled: bool = False
+  # The host responds with text instead of audio while the audio player is muted.
+  audio_player_muted: bool = False
   audio_recorder_state: Literal["disabled", "initializing", "recording"] = "disabled"
   tool_call_responses: str = ""
   text_input: str = ""
+  # Cached audio of the host reading the selected clue. See `clue_audio_cache`.
+  clue_audio_url: str = ""
+  clue_audio_cached: bool = False
+  # Whether the relay captures the host reading the selected clue for the cache.
+  clue_audio_capture: bool = False
+  # Ticket for connecting through the relay. See `gemini_live_relay`.
+  gemini_live_relay_ticket: str = ""
+  # Set when the session is being recorded. See `session_recorder`.
+  recording_id: str = ""
+  # Admission control. See `admission`.
+  session_id: str = ""
+  admission_status: Literal["", "admitted", "queued", "rejected"] = ""
+  admission_reason: str = ""
+  admission_position: int = 0
+  admission_estimated_wait_seconds: int = 0
+  # Multiplayer rooms. See `rooms`.
+  room_id: str = ""
+  player_name: str = ""
+  is_room_host: bool = False
+  buzz_position: int = 0
+  room_players: list[RoomPlayer] = field(default_factory=list)
+  room_error: str = ""
 
 
-def make_default_board(jeopardy_questions) -> Board:
+def make_default_board(bank) -> Board:
   """Creates a board with some random jeopardy questions."""
-  random.shuffle(jeopardy_questions)
-  return Board(clues=jeopardy_questions[:_NUM_CATEGORIES])
+  set_ids = bank.sample_ids(_NUM_CATEGORIES)
+  return Board(clues=[bank.get(set_id) for set_id in set_ids], set_ids=set_ids)
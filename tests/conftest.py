@@ -0,0 +1,12 @@
+import os
+import sys
+
+import pytest
+
+_ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, _ROOT_DIR)
+
+
+@pytest.fixture(scope="session")
+def sample_dataset_path() -> str:
+  return os.path.join(_ROOT_DIR, "sample_data", "custom_jeopardy.json")
@@ -0,0 +1,95 @@
+import pytest
+
+import admission
+
+
+class FakeClock:
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self) -> float:
+    return self.now
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+  return FakeClock()
+
+
+def make_controller(clock, max_sessions=2, max_sessions_per_key=0, queue_size=1):
+  return admission.AdmissionController(
+    max_sessions, max_sessions_per_key, queue_size, idle_timeout_seconds=60, clock=clock
+  )
+
+
+def test_admits_until_full_then_queues_then_rejects(clock):
+  controller = make_controller(clock)
+  assert controller.admit("a", "").status == "admitted"
+  assert controller.admit("b", "").status == "admitted"
+  assert controller.admit("c", "") == admission.Admission("queued", "server", 1, 30)
+  assert controller.admit("d", "") == admission.Admission("rejected", "server")
+
+
+def test_queued_session_is_admitted_when_a_session_expires(clock):
+  controller = make_controller(clock)
+  controller.admit("a", "")
+  clock.now = 30
+  controller.admit("b", "")
+  assert controller.admit("c", "").status == "queued"
+
+  clock.now = 61
+  assert controller.admit("c", "").status == "admitted"
+
+
+def test_leave_queue_frees_the_queue(clock):
+  controller = make_controller(clock, max_sessions=1)
+  controller.admit("a", "")
+  controller.admit("b", "")
+  controller.leave_queue("b")
+  assert controller.admit("c", "").status == "queued"
+
+
+def test_per_key_limit(clock):
+  controller = make_controller(clock, max_sessions=0, max_sessions_per_key=1)
+  assert controller.admit("a", "key-1").status == "admitted"
+  assert controller.admit("b", "key-1") == admission.Admission("queued", "api_key", 1, 60)
+  assert controller.admit("c", "key-2").status == "admitted"
+  # Sessions using the server's key are not limited per key.
+  assert controller.admit("d", "").status == "admitted"
+
+
+def test_key_change_keeps_session_and_mean_duration(clock):
+  controller = make_controller(clock, max_sessions_per_key=1)
+  controller.admit("a", "key-1")
+  clock.now = 5
+  assert controller.admit("a", "key-2").status == "admitted"
+  assert controller._mean_session_seconds == 60
+  # The session no longer counts against its old key.
+  assert controller.admit("b", "key-1").status == "admitted"
+
+
+def test_key_change_over_key_limit_is_rejected(clock):
+  controller = make_controller(clock, max_sessions_per_key=1)
+  controller.admit("a", "key-1")
+  controller.admit("b", "key-2")
+  assert controller.admit("a", "key-2") == admission.Admission("rejected", "api_key")
+
+
+def test_touch_keeps_session_active(clock):
+  controller = make_controller(clock, max_sessions=1)
+  controller.admit("a", "")
+  clock.now = 50
+  assert controller.touch("a", "").status == "admitted"
+  clock.now = 100
+  assert controller.admit("b", "").status == "queued"
+
+
+def test_touch_resumes_expired_session_only_if_there_is_room(clock):
+  controller = make_controller(clock, max_sessions=1)
+  controller.admit("a", "")
+  clock.now = 61
+  assert controller.admit("b", "").status == "admitted"
+  assert controller.touch("a", "") == admission.Admission("rejected", "server")
+
+  clock.now = 200
+  assert controller.touch("a", "").status == "admitted"
@@ -0,0 +1,56 @@
+import pytest
+
+import daily
+import question_bank
+import question_bank_loader
+
+
+@pytest.fixture(scope="module")
+def bank(sample_dataset_path) -> question_bank.QuestionBank:
+  return question_bank.QuestionBank(question_bank.load(sample_dataset_path))
+
+
+@pytest.fixture(autouse=True)
+def loaded_bank(monkeypatch, bank):
+  monkeypatch.setattr(daily, "_daily_board", None)
+  monkeypatch.setattr(daily, "today", lambda: "2026-01-01")
+  monkeypatch.setattr(question_bank_loader, "current", lambda: bank)
+  monkeypatch.setattr(question_bank_loader, "is_ready", lambda: True)
+
+
+def make_config(board, *, text_only):
+  return f"{len(board.clues)} categories, text only: {text_only}"
+
+
+def test_get_makes_board_and_configs_once_per_day(monkeypatch):
+  daily_board = daily.get(make_config)
+  assert daily_board.date == "2026-01-01"
+  assert len(daily_board.board.clues) == 6
+  assert daily_board.gemini_live_api_configs == {
+    False: "6 categories, text only: False",
+    True: "6 categories, text only: True",
+  }
+  assert daily.get(make_config) is daily_board
+
+  monkeypatch.setattr(daily, "today", lambda: "2026-01-02")
+  next_daily_board = daily.get(make_config)
+  assert next_daily_board.date == "2026-01-02"
+  assert next_daily_board.board.set_ids != daily_board.board.set_ids
+
+
+def test_board_depends_only_on_date(bank):
+  assert daily.make_board(bank, "2026-01-01") == daily.make_board(bank, "2026-01-01")
+
+
+def test_get_does_not_cache_fallback_board(monkeypatch):
+  monkeypatch.setattr(question_bank_loader, "is_ready", lambda: False)
+  daily_board = daily.get(make_config)
+  assert daily.get(make_config) is not daily_board
+  assert daily.find_config(daily_board.board, text_only=False) is None
+
+
+def test_find_config_only_for_todays_board(bank):
+  daily_board = daily.get(make_config)
+  assert daily.find_config(daily_board.board, text_only=True) == "6 categories, text only: True"
+  other_board = daily.make_board(bank, daily_board.date)
+  assert daily.find_config(other_board, text_only=True) is None
@@ -0,0 +1,63 @@
+import math
+
+import pytest
+
+import metrics
+
+
+def make_histogram(metric: metrics.Histogram, count: int, total: float) -> dict:
+  buckets = [0] * (len(metric._buckets) + 1)
+  buckets[0] = count
+  return {"buckets": buckets, "sum": total, "count": count}
+
+
+def test_records_known_metrics():
+  counters_before = dict(metrics.CLIENT_EVENTS._values)
+  metrics.record_client_batch(
+    {
+      "counters": {"ws_errors": 2, "unknown_counter": 1},
+      "durations": {"ws_connect": make_histogram(metrics.CLIENT_DURATION, 3, 1.5)},
+      "values": {"player_queue_depth": make_histogram(metrics.CLIENT_VALUE, 1, 0)},
+    }
+  )
+  assert metrics.CLIENT_EVENTS._values[("ws_errors",)] == (
+    counters_before.get(("ws_errors",), 0) + 2
+  )
+  assert ("unknown_counter",) not in metrics.CLIENT_EVENTS._values
+  bucket_counts, _, count = metrics.CLIENT_DURATION._values[("ws_connect",)]
+  assert count >= 3 and bucket_counts[0] >= 3
+  assert ("player_queue_depth",) in metrics.CLIENT_VALUE._values
+
+
+@pytest.mark.parametrize(
+  "batch",
+  [
+    {"counters": {"ws_errors": -1}},
+    {"counters": {"ws_errors": math.inf}},
+    {"counters": {"ws_errors": 10**9}},
+    {"counters": {"ws_errors": "many"}},
+    {"durations": {"ws_connect": {"buckets": [1], "sum": 1, "count": 1}}},
+    {
+      "durations": {
+        "ws_connect": {**make_histogram(metrics.CLIENT_DURATION, 2, 1), "count": 3},
+      }
+    },
+    {"durations": {"ws_connect": make_histogram(metrics.CLIENT_DURATION, 1, 10**8)}},
+    {"durations": {"ws_connect": make_histogram(metrics.CLIENT_DURATION, 1, math.nan)}},
+  ],
+)
+def test_rejects_invalid_batch(batch):
+  with pytest.raises(ValueError):
+    metrics.record_client_batch(batch)
+
+
+def test_invalid_batch_records_nothing():
+  counters_before = dict(metrics.CLIENT_EVENTS._values)
+  with pytest.raises(ValueError):
+    metrics.record_client_batch(
+      {
+        "counters": {"prewarm_promoted": 1},
+        "durations": {"ws_connect": make_histogram(metrics.CLIENT_DURATION, 1, -1)},
+      }
+    )
+  assert metrics.CLIENT_EVENTS._values == counters_before
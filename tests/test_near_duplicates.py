@@ -0,0 +1,53 @@
+import near_duplicates
+
+CLUE = "This ancient city, rediscovered in 1911, was a thriving center of Mayan civilization"
+ANSWER = "What is Tikal?"
+
+
+def test_finds_reworded_clue():
+  duplicates = near_duplicates.find_near_duplicates(
+    [
+      (0, CLUE, ANSWER),
+      (
+        1,
+        "This ancient city, rediscovered in 1911, was a thriving center of Mayan culture",
+        ANSWER,
+      ),
+      (2, "This planet is known as the Red Planet", "What is Mars?"),
+    ]
+  )
+  assert duplicates == {1: 0}
+
+
+def test_ignores_markup_and_case():
+  duplicates = near_duplicates.find_near_duplicates(
+    [(0, CLUE, ANSWER), (1, f"<i>{CLUE.upper()}</i>", ANSWER.lower())]
+  )
+  assert duplicates == {1: 0}
+
+
+def test_same_clue_with_different_answer_is_not_duplicate():
+  duplicates = near_duplicates.find_near_duplicates(
+    [(0, "Its capital is Paris", "What is France?"), (1, "Its capital is Rome", "What is Italy?")]
+  )
+  assert duplicates == {}
+
+
+def test_empty_clues_are_not_duplicates():
+  assert near_duplicates.find_near_duplicates([(0, "", ""), (1, "", "")]) == {}
+
+
+def test_band_hashes_are_deterministic():
+  assert near_duplicates.band_hashes(CLUE, ANSWER) == near_duplicates.band_hashes(CLUE, ANSWER)
+
+
+def test_index_query_and_remove_with_precomputed_band_hashes():
+  index = near_duplicates.NearDuplicateIndex()
+  band_hashes = near_duplicates.band_hashes(CLUE, ANSWER)
+  index.add("a", CLUE, ANSWER, band_hashes)
+  index.add("b", CLUE, ANSWER)
+  assert sorted(index.query(CLUE, ANSWER, band_hashes)) == ["a", "b"]
+
+  index.remove("a", band_hashes)
+  assert len(index) == 1
+  assert index.query(CLUE, ANSWER) == ["b"]
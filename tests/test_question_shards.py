@@ -0,0 +1,58 @@
+import os
+import shutil
+
+import pytest
+
+import question_bank
+import question_shards
+
+
+@pytest.fixture(scope="module")
+def question_sets(sample_dataset_path) -> list[question_bank.QuestionSet]:
+  return question_bank.load(sample_dataset_path)
+
+
+def test_round_trip(tmp_path, question_sets):
+  question_shards.build_shards(question_sets, str(tmp_path), shard_size=7)
+  bank = question_shards.ShardedQuestionBank(str(tmp_path), max_resident_shards=2)
+
+  assert len(bank) == len(question_sets)
+  for set_id, question_set in enumerate(question_sets):
+    assert bank.get(set_id) == question_set
+    assert bank.category(set_id) == question_set[0].category
+    assert bank.air_date(set_id) == question_set[0].air_date
+    assert bank.difficulty(set_id) == question_shards._difficulty(question_set)
+  assert len(bank._resident_shards) == 2
+
+
+def test_get_out_of_range(tmp_path, question_sets):
+  question_shards.build_shards(question_sets, str(tmp_path))
+  bank = question_shards.ShardedQuestionBank(str(tmp_path))
+  with pytest.raises(IndexError):
+    bank.get(len(question_sets))
+
+
+def test_rebuild_does_not_change_open_bank(tmp_path, question_sets):
+  question_shards.build_shards(question_sets, str(tmp_path))
+  bank = question_shards.ShardedQuestionBank(str(tmp_path))
+  question_shards.build_shards(question_sets[:3], str(tmp_path))
+
+  assert len(bank) == len(question_sets)
+  assert bank.get(len(question_sets) - 1) == question_sets[-1]
+  assert len(question_shards.ShardedQuestionBank(str(tmp_path))) == 3
+
+
+def test_ensure_shards_rebuilds_only_when_dataset_changes(tmp_path, sample_dataset_path):
+  dataset_path = str(tmp_path / "dataset.json")
+  shard_dir = str(tmp_path / "shards")
+  shutil.copy(sample_dataset_path, dataset_path)
+
+  question_shards.ensure_shards(shard_dir, dataset_path=dataset_path)
+  build_dir = question_shards.current_build_dir(shard_dir)
+  question_shards.ensure_shards(shard_dir, dataset_path=dataset_path)
+  assert question_shards.current_build_dir(shard_dir) == build_dir
+
+  stat = os.stat(dataset_path)
+  os.utime(dataset_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+  question_shards.ensure_shards(shard_dir, dataset_path=dataset_path)
+  assert question_shards.current_build_dir(shard_dir) != build_dir
@@ -0,0 +1,72 @@
+import pytest
+
+import rooms
+from models import Board
+
+
+@pytest.fixture
+def room() -> rooms.Room:
+  room = rooms.Room("test-room", Board(clues=[]))
+  room.join("host", "Host")
+  room.join("alice", "Alice")
+  room.join("bob", "Bob")
+  return room
+
+
+def test_buzz_requires_selected_clue(room):
+  assert room.buzz("alice", 1.0) == 0
+
+
+def test_buzz_orders_by_server_time(room):
+  room.select_clue("clue-0-0")
+  assert room.buzz("bob", 2.0) == 1
+  # Alice's buzz was received first, even though it acquired the lock later.
+  assert room.buzz("alice", 1.0) == 1
+  assert room.snapshot().buzz_order == ("alice", "bob")
+
+
+def test_buzz_ignores_repeated_and_unknown_players(room):
+  room.select_clue("clue-0-0")
+  assert room.buzz("alice", 1.0) == 1
+  assert room.buzz("alice", 0.5) == 0
+  assert room.buzz("mallory", 0.1) == 0
+  assert room.snapshot().buzz_order == ("alice",)
+
+
+def test_update_score_without_selected_clue(room):
+  assert room.update_score(True, 200) == "No clue is selected."
+
+
+def test_update_score_without_buzzes_scores_host(room):
+  room.select_clue("clue-0-0")
+  assert room.update_score(True, 200) == "Host's score is 200."
+  snapshot = room.snapshot()
+  assert snapshot.players[0].score == 200
+  assert snapshot.selected_question_key == ""
+  assert snapshot.answered_questions == frozenset(["clue-0-0"])
+
+
+def test_update_score_passes_to_next_buzz_after_incorrect_response(room):
+  room.select_clue("clue-0-0")
+  room.buzz("alice", 1.0)
+  room.buzz("bob", 2.0)
+
+  result = room.update_score(False, 400)
+  assert result == "Alice's score is -400. Bob buzzed in next and may respond."
+  snapshot = room.snapshot()
+  assert snapshot.selected_question_key == "clue-0-0"
+  assert snapshot.buzz_order == ("bob",)
+
+  assert room.update_score(True, 400) == "Bob's score is 400."
+  snapshot = room.snapshot()
+  assert [player.score for player in snapshot.players] == [0, -400, 400]
+  assert snapshot.selected_question_key == ""
+  assert snapshot.buzz_order == ()
+  assert room.select_clue("clue-0-0") == "That clue has already been selected"
+
+
+def test_update_score_closes_clue_after_last_incorrect_response(room):
+  room.select_clue("clue-1-2")
+  room.buzz("alice", 1.0)
+  assert room.update_score(False, 200) == "Alice's score is -200."
+  assert room.snapshot().answered_questions == frozenset(["clue-1-2"])
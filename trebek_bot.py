@@ -4,6 +4,10 @@ import json
 
 type VoiceName = Literal["Aoede", "Charon", "Fenrir", "Kore", "Puck"]
 type GeminiModel = Literal["gemini-2.0-flash-exp"]
+type ResponseModality = Literal["audio", "text"]
+
+MODEL: GeminiModel = "gemini-2.0-flash-exp"
+VOICE_NAME: VoiceName = "Puck"
 
 
 _TOOL_DEFINITIONS = {
@@ -167,26 +171,75 @@ Remember to maintain the engaging, professional tone of a game show host while k
 """.strip()
 
 
-def make_system_instruction(clue_data: str):
-  return _SYSTEM_INSTRUCTIONS.replace("[[clue_data]]", clue_data)
+_MULTIPLAYER_INSTRUCTIONS = """
+# Multiplayer
+
+Several players share this game. Their messages start with their name, such as "Alex: I'd like to select History for $200". Players buzz in on their own devices, and only the first player to buzz in may respond. Address players by name. Call update_score after each response. It returns the score of the player that responded, and who may respond next after an incorrect response.
+""".strip()
+
+
+_NEXT_ROUND_MESSAGE = """
+All clues on the board have been played. It is time for the [[round_name]] round. The board is replaced with the dataset below, and get_clue now selects clues from it. Announce the round and ask the contestant to select a clue.
+
+[[clue_data]]
+""".strip()
+
+
+def make_next_round_message(round_name: str, clue_data: str) -> str:
+  return _NEXT_ROUND_MESSAGE.replace("[[round_name]]", round_name).replace(
+    "[[clue_data]]", clue_data
+  )
+
+
+_RESUME_INSTRUCTIONS = """
+# Resumed Game
+
+This game was interrupted and is being resumed in the [[round_name]] round. Do not start a new game. Welcome the contestant back, tell them their score is $[[score]] and ask them to select a clue. These clues were already played and cannot be selected again:
+
+[[played_clues]]
+""".strip()
+
+
+def make_resume_instruction(round_name: str, score: int, played_clues: list[str]) -> str:
+  return (
+    _RESUME_INSTRUCTIONS.replace("[[round_name]]", round_name)
+    .replace("[[score]]", str(score))
+    .replace("[[played_clues]]", "\n".join(f"- {clue}" for clue in played_clues) or "None")
+  )
+
+
+def make_system_instruction(
+  clue_data: str, multiplayer: bool = False, resume_instruction: str = ""
+):
+  system_instruction = _SYSTEM_INSTRUCTIONS.replace("[[clue_data]]", clue_data)
+  if multiplayer:
+    system_instruction += "\n\n" + _MULTIPLAYER_INSTRUCTIONS
+  if resume_instruction:
+    system_instruction += "\n\n" + resume_instruction
+  return system_instruction
 
 
 def make_gemini_live_api_config(
-  model: GeminiModel = "gemini-2.0-flash-exp",
+  model: GeminiModel = MODEL,
   system_instructions: str = "",
-  voice_name: VoiceName = "Puck",
+  voice_name: VoiceName = VOICE_NAME,
+  response_modality: ResponseModality = "audio",
 ):
+  generation_config = {
+    "temperature": 0.0,
+    "response_modalities": [response_modality],
+  }
+  if response_modality == "audio":
+    generation_config["speech_config"] = {
+      "voice_config": {"prebuilt_voice_config": {"voice_name": voice_name}}
+    }
   return json.dumps(
     {
       "setup": {
         "model": f"models/{model}",
         "system_instruction": {"role": "user", "parts": [{"text": system_instructions}]},
         "tools": _TOOL_DEFINITIONS,
-        "generation_config": {
-          "temperature": 0.0,
-          "response_modalities": ["audio"],
-          "speech_config": {"voice_config": {"prebuilt_voice_config": {"voice_name": voice_name}}},
-        },
+        "generation_config": generation_config,
       }
     }
   )
@@ -2,26 +2,35 @@ import {
   LitElement,
   html,
 } from "https://cdn.jsdelivr.net/gh/lit/dist@3/core/lit-core.min.js";
+import { telemetry } from "./telemetry.js";
+
+// If new audio arrives within this window after the queue ran dry, the gap is counted
+// as an underrun rather than the end of the host's turn.
+const UNDERRUN_WINDOW_MS = 1000;
 
 class AudioPlayer extends LitElement {
   static properties = {
     playEvent: { type: String },
     stopEvent: { type: String },
     enabled: { type: Boolean },
+    muted: { type: Boolean },
     data: { type: String },
+    audio_url: { type: String },
   };
 
   constructor() {
     super();
     this.enabled = false;
+    this.muted = false;
     this.audioContext = null; // Initialize audio context
     this.sampleRate = 24000; // Gemini Live API sends data in 24000hz
     this.channels = 1;
     this.queue = [];
     this.isPlaying = false;
+    this.queueDrainedTime = null;
 
     this.onGeminiLiveStarted = (e) => {
-      if (!this.enabled) {
+      if (!this.enabled && !this.muted) {
         this.playAudio();
       }
     };
@@ -82,18 +91,47 @@ class AudioPlayer extends LitElement {
       this.addToQueue(this.data);
     }
 
+    // Fetch and play audio, such as cached audio of the host reading a clue.
+    if (changedProperties.has("audio_url") && this.audio_url) {
+      this.fetchAudio(this.audio_url);
+    }
+
     // Clear the queue if the audio player is disabled.
     if (changedProperties.has("enabled") && !this.enabled) {
       this.queue = [];
     }
   }
 
-  addToQueue(base64Data) {
+  async fetchAudio(url) {
+    try {
+      const response = await fetch(url);
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      this.addToQueue(await response.arrayBuffer());
+    } catch (error) {
+      console.error("Error fetching audio:", error);
+    }
+  }
+
+  /**
+   * Queues PCM audio, either base64 encoded or as an ArrayBuffer.
+   */
+  addToQueue(data) {
     if (!this.enabled) {
       return;
     }
-    this.queue.push(base64Data);
+    this.queue.push(data);
+    telemetry.value("player_queue_depth", this.queue.length);
     if (!this.isPlaying) {
+      if (this.queueDrainedTime !== null) {
+        const gap = performance.now() - this.queueDrainedTime;
+        if (gap < UNDERRUN_WINDOW_MS) {
+          telemetry.count("player_underruns");
+          telemetry.duration("player_underrun_gap", gap);
+        }
+        this.queueDrainedTime = null;
+      }
       this.playNext();
     }
   }
@@ -108,8 +146,15 @@ class AudioPlayer extends LitElement {
     this.playNext();
   }
 
+  muteAudio() {
+    this.dispatchEvent(new MesopEvent(this.stopEvent, { muted: true }));
+  }
+
   playNext() {
     if (!this.enabled || !this.audioContext || this.queue.length === 0) {
+      if (this.isPlaying) {
+        this.queueDrainedTime = performance.now();
+      }
       this.isPlaying = false;
       return;
     }
@@ -124,14 +169,17 @@ class AudioPlayer extends LitElement {
   }
 
   playPCM(data) {
-    // Convert base64 to binary.
-    const binaryAudio = atob(data);
-
-    // Convert binary string to ArrayBuffer.
-    const audioBuffer = new ArrayBuffer(binaryAudio.length);
-    const bufferView = new Uint8Array(audioBuffer);
-    for (let i = 0; i < binaryAudio.length; i++) {
-      bufferView[i] = binaryAudio.charCodeAt(i);
+    let audioBuffer = data;
+    if (typeof data === "string") {
+      // Convert base64 to binary.
+      const binaryAudio = atob(data);
+
+      // Convert binary string to ArrayBuffer.
+      audioBuffer = new ArrayBuffer(binaryAudio.length);
+      const bufferView = new Uint8Array(audioBuffer);
+      for (let i = 0; i < binaryAudio.length; i++) {
+        bufferView[i] = binaryAudio.charCodeAt(i);
+      }
     }
 
     // Convert to 16-bit PCM data.
@@ -163,7 +211,7 @@ class AudioPlayer extends LitElement {
 
   render() {
     if (this.enabled) {
-      return html`<span><slot></slot></span>`;
+      return html`<span @click="${this.muteAudio}"><slot></slot></span>`;
     }
     return html`<span @click="${this.playAudio}"><slot></slot></span>`;
   }
@@ -8,7 +8,9 @@ import mesop.labs as mel
 def audio_player(
   *,
   enabled: bool = False,
+  muted: bool = False,
   data: bytes = b"",
+  audio_url: str = "",
   on_play: Callable[[mel.WebEvent], Any] | None = None,
   on_stop: Callable[[mel.WebEvent], Any] | None = None,
 ):
@@ -20,6 +22,13 @@ def audio_player(
 
   This is a barebones configuration that sets the sample rate to 24000hz since that is
   what Gemini returns. In addition we expect the data to be in PCM format.
+
+  The player starts playing when the Gemini Live API is started, unless `muted` is set.
+  Clicking the player while it is playing mutes it, which sends `on_stop` with
+  `{"muted": true}`.
+
+  When `audio_url` changes, the PCM audio at that URL is fetched and queued, such as
+  cached audio of the host reading a clue.
   """
   return mel.insert_web_component(
     name="audio-player",
@@ -31,7 +40,9 @@ def audio_player(
     ),
     properties={
       "enabled": enabled,
+      "muted": muted,
       "data": base64.b64encode(data).decode("utf-8"),
+      "audio_url": audio_url,
     },
   )
 
@@ -2,6 +2,7 @@ import {
   LitElement,
   html,
 } from "https://cdn.jsdelivr.net/gh/lit/dist@3/core/lit-core.min.js";
+import { telemetry } from "./telemetry.js";
 
 class AudioRecorder extends LitElement {
   static properties = {
@@ -278,6 +279,7 @@ class AudioRecorder extends LitElement {
     this.processor.onaudioprocess = (event) => {
       if (!this.isStreaming) return;
 
+      const frameStartTime = performance.now();
       const inputData = event.inputBuffer.getChannelData(0);
       const originalSampleRate = event.inputBuffer.sampleRate;
 
@@ -298,6 +300,7 @@ class AudioRecorder extends LitElement {
       if (this.voiceDetectionEnabled && !this.isVoiceFrame(inputData)) {
         // Skip this frame if no voice is detected
         this.sequenceNumber++; // Still increment to maintain sequence
+        telemetry.count("recorder_frames_dropped_vad");
         return;
       }
 
@@ -394,6 +397,12 @@ class AudioRecorder extends LitElement {
           composed: true,
         })
       );
+
+      telemetry.count("recorder_frames_sent");
+      telemetry.duration(
+        "recorder_frame_processing",
+        performance.now() - frameStartTime
+      );
     };
 
     return true;
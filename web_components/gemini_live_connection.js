@@ -2,14 +2,25 @@ import {
   LitElement,
   html,
 } from "https://cdn.jsdelivr.net/gh/lit/dist@3/core/lit-core.min.js";
+import { telemetry } from "./telemetry.js";
+
+const RECORDING_FLUSH_INTERVAL_MS = 5000;
+// Wait for the endpoint and setup message to stop changing, such as while the API key is
+// typed, before prewarming a connection.
+const PREWARM_DELAY_MS = 1000;
 
 class GeminiLiveConnection extends LitElement {
   static properties = {
     api_config: { type: String },
+    clue_audio_cached: { type: Boolean },
     enabled: { type: Boolean },
     endpoint: { type: String },
+    prewarm: { type: Boolean },
+    prewarm_idle_timeout_ms: { type: Number },
+    recording_endpoint: { type: String },
     startEvent: { type: String },
     stopEvent: { type: String },
+    telemetry_endpoint: { type: String },
     text_input: { type: String },
     toolCallEvent: { type: String },
     tool_call_responses: { type: String },
@@ -19,8 +30,19 @@ class GeminiLiveConnection extends LitElement {
     super();
     this.onSetupComplete = () => {
       console.log("Setup complete...");
+      this.setupCompleteTime = performance.now();
     };
     this.onAudioData = (base64Data) => {
+      if (this.setupCompleteTime !== null) {
+        telemetry.duration(
+          "setup_to_first_audio",
+          performance.now() - this.setupCompleteTime
+        );
+        this.setupCompleteTime = null;
+      }
+      if (this.dropClueAudio) {
+        return;
+      }
       this.dispatchEvent(
         new CustomEvent("audio-output-received", {
           detail: { data: base64Data },
@@ -30,8 +52,34 @@ class GeminiLiveConnection extends LitElement {
         })
       );
     };
+    this.onTextData = (text) => {
+      if (this.setupCompleteTime !== null) {
+        telemetry.duration(
+          "setup_to_first_text",
+          performance.now() - this.setupCompleteTime
+        );
+        this.setupCompleteTime = null;
+      }
+      this.dispatchEvent(
+        new CustomEvent("text-output-received", {
+          detail: { text },
+          // Allow event to cross shadow DOM boundaries (both need to be true)
+          bubbles: true,
+          composed: true,
+        })
+      );
+    };
     this.onInterrupted = () => {};
-    this.onTurnComplete = () => {};
+    this.onTurnComplete = () => {
+      this.dropClueAudio = false;
+      this.dispatchEvent(
+        new CustomEvent("text-output-turn-complete", {
+          detail: {},
+          bubbles: true,
+          composed: true,
+        })
+      );
+    };
     this.onError = () => {};
     this.onClose = () => {
       console.log("Web socket closed...");
@@ -44,6 +92,20 @@ class GeminiLiveConnection extends LitElement {
       );
     };
     this.pendingSetupMessage = null;
+    this.connectStartTime = null;
+    this.setupCompleteTime = null;
+    this.recordedFrames = [];
+    this.recordingFlushInterval = null;
+    // Whether the host's audio is not played, since cached audio is. See `startClueAudio`.
+    this.dropClueAudio = false;
+    // Connection that is opened and set up before Start is clicked. See `updatePrewarm`.
+    this.prewarmWs = null;
+    this.prewarmConfig = null;
+    this.prewarmEndpoint = null;
+    this.prewarmSetupResponse = null;
+    this.prewarmStartTime = null;
+    this.prewarmDelayTimeout = null;
+    this.prewarmIdleTimeout = null;
 
     this.onAudioInputReceived = (e) => {
       this.sendAudioChunk(e.detail.data);
@@ -65,6 +127,8 @@ class GeminiLiveConnection extends LitElement {
     if (this.ws) {
       this.ws.close();
     }
+    this.closePrewarm();
+    this.stopRecording();
   }
 
   firstUpdated() {
@@ -74,15 +138,48 @@ class GeminiLiveConnection extends LitElement {
   }
 
   updated(changedProperties) {
+    if (changedProperties.has("recording_endpoint")) {
+      if (this.recording_endpoint) {
+        this.startRecording();
+      } else {
+        this.stopRecording();
+      }
+    }
+    if (changedProperties.has("telemetry_endpoint")) {
+      if (this.telemetry_endpoint) {
+        telemetry.start(this.telemetry_endpoint);
+      } else {
+        telemetry.stop();
+      }
+    }
     if (
       changedProperties.has("tool_call_responses") &&
       this.tool_call_responses.length > 0
     ) {
+      this.startClueAudio();
       this.sendToolResponse(JSON.parse(this.tool_call_responses));
     }
+    if (
+      changedProperties.has("api_config") &&
+      changedProperties.get("api_config") &&
+      this.enabled &&
+      this.ws
+    ) {
+      // The setup of a session cannot be changed, such as when switching between audio
+      // and text responses, so start a new session with the new setup.
+      this.reconnect();
+    }
     if (changedProperties.has("text_input") && this.text_input.length > 0) {
       this.sendTextMessage(this.text_input);
     }
+    if (
+      changedProperties.has("prewarm") ||
+      changedProperties.has("enabled") ||
+      changedProperties.has("endpoint") ||
+      changedProperties.has("api_config")
+    ) {
+      this.updatePrewarm();
+    }
   }
 
   start() {
@@ -97,7 +194,9 @@ class GeminiLiveConnection extends LitElement {
         })
       );
     }
-    this.setupWebSocket();
+    if (!this.promotePrewarm()) {
+      this.setupWebSocket();
+    }
   }
 
   stop() {
@@ -116,21 +215,44 @@ class GeminiLiveConnection extends LitElement {
   }
 
   setupWebSocket() {
+    this.connectStartTime = performance.now();
+    this.setupCompleteTime = null;
     this.ws = new WebSocket(this.endpoint);
     this.ws.onopen = () => {
       console.log("WebSocket connection is opening...");
+      telemetry.duration(
+        "ws_connect",
+        performance.now() - this.connectStartTime
+      );
       this.sendSetupMessage();
     };
+    this.addWebSocketHandlers(this.ws);
+  }
+
+  /**
+   * Handles the host's turn in response to the tool calls that are about to be sent.
+   *
+   * If the clue audio is cached, the audio player is already playing it, so the host's
+   * audio is not played until the turn completes.
+   */
+  startClueAudio() {
+    this.dropClueAudio = this.clue_audio_cached;
+  }
+
+  reconnect() {
+    console.log("Reconnecting with new setup...");
+    this.ws.onclose = null;
+    this.ws.close();
+    this.setupWebSocket();
+  }
 
-    this.ws.onmessage = async (event) => {
+  addWebSocketHandlers(ws) {
+    ws.onmessage = async (event) => {
       try {
-        let wsResponse;
-        if (event.data instanceof Blob) {
-          const responseText = await event.data.text();
-          wsResponse = JSON.parse(responseText);
-        } else {
-          wsResponse = JSON.parse(event.data);
-        }
+        const responseText =
+          event.data instanceof Blob ? await event.data.text() : event.data;
+        this.recordFrame("ws_recv", responseText);
+        const wsResponse = JSON.parse(responseText);
 
         if (wsResponse.setupComplete) {
           this.onSetupComplete();
@@ -152,6 +274,14 @@ class GeminiLiveConnection extends LitElement {
             }
           }
 
+          // Text responses, when the host does not respond with audio.
+          const text = (wsResponse.serverContent.modelTurn?.parts ?? [])
+            .map((part) => part.text ?? "")
+            .join("");
+          if (text) {
+            this.onTextData(text);
+          }
+
           if (wsResponse.serverContent.turnComplete) {
             this.onTurnComplete();
           }
@@ -162,20 +292,136 @@ class GeminiLiveConnection extends LitElement {
       }
     };
 
-    this.ws.onerror = (error) => {
+    ws.onerror = (error) => {
       console.error("WebSocket Error:", error);
+      telemetry.count("ws_errors");
       this.onError("WebSocket Error: " + error.message);
     };
 
-    this.ws.onclose = (event) => {
+    ws.onclose = (event) => {
       console.log("Connection closed:", event);
       this.onClose(event);
     };
   }
 
+  /**
+   * Opens a connection and sends the setup message in the background, so the game can
+   * start without waiting for the connection and setup handshakes.
+   *
+   * The connection is closed if the endpoint or setup message changes, or if the game is
+   * not started within the idle timeout.
+   */
+  updatePrewarm() {
+    const shouldPrewarm =
+      this.prewarm && !this.enabled && this.endpoint && this.api_config;
+    if (
+      this.prewarmWs &&
+      (!shouldPrewarm ||
+        this.prewarmEndpoint !== this.endpoint ||
+        this.prewarmConfig !== this.api_config)
+    ) {
+      this.closePrewarm();
+    }
+    clearTimeout(this.prewarmDelayTimeout);
+    if (shouldPrewarm && !this.prewarmWs) {
+      this.prewarmDelayTimeout = setTimeout(
+        () => this.openPrewarm(),
+        PREWARM_DELAY_MS
+      );
+    }
+  }
+
+  openPrewarm() {
+    const ws = new WebSocket(this.endpoint);
+    this.prewarmWs = ws;
+    this.prewarmEndpoint = this.endpoint;
+    this.prewarmConfig = this.api_config;
+    this.prewarmSetupResponse = null;
+    this.prewarmStartTime = performance.now();
+    ws.onopen = () => {
+      telemetry.duration(
+        "ws_connect",
+        performance.now() - this.prewarmStartTime
+      );
+      if (this.ws === ws) {
+        // Promoted while connecting.
+        this.sendSetupMessage();
+      } else {
+        ws.send(this.prewarmConfig);
+      }
+    };
+    ws.onmessage = async (event) => {
+      const responseText =
+        event.data instanceof Blob ? await event.data.text() : event.data;
+      if (this.prewarmWs === ws && JSON.parse(responseText).setupComplete) {
+        telemetry.duration(
+          "prewarm_setup",
+          performance.now() - this.prewarmStartTime
+        );
+        this.prewarmSetupResponse = responseText;
+      }
+    };
+    ws.onerror = () => {
+      telemetry.count("ws_errors");
+    };
+    ws.onclose = () => {
+      if (this.prewarmWs === ws) {
+        this.closePrewarm();
+      }
+    };
+    this.prewarmIdleTimeout = setTimeout(() => {
+      telemetry.count("prewarm_expired");
+      this.closePrewarm();
+    }, this.prewarm_idle_timeout_ms);
+  }
+
+  /**
+   * Uses the prewarmed connection for the game if it is still usable.
+   *
+   * @returns Whether the prewarmed connection was promoted.
+   */
+  promotePrewarm() {
+    const ws = this.prewarmWs;
+    if (
+      !ws ||
+      ws.readyState > WebSocket.OPEN ||
+      this.prewarmEndpoint !== this.endpoint ||
+      this.prewarmConfig !== this.api_config
+    ) {
+      return false;
+    }
+    clearTimeout(this.prewarmIdleTimeout);
+    this.prewarmWs = null;
+    this.ws = ws;
+    this.setupCompleteTime = null;
+    this.addWebSocketHandlers(ws);
+    telemetry.count("prewarm_promoted");
+    if (ws.readyState === WebSocket.OPEN) {
+      this.recordFrame("ws_send", this.prewarmConfig);
+    }
+    if (this.prewarmSetupResponse !== null) {
+      this.recordFrame("ws_recv", this.prewarmSetupResponse);
+      // Time to first audio is measured from when the game started.
+      this.onSetupComplete();
+    }
+    return true;
+  }
+
+  closePrewarm() {
+    clearTimeout(this.prewarmDelayTimeout);
+    clearTimeout(this.prewarmIdleTimeout);
+    if (this.prewarmWs) {
+      const ws = this.prewarmWs;
+      this.prewarmWs = null;
+      ws.close();
+    }
+  }
+
   sendMessage(message) {
     if (this.ws.readyState === WebSocket.OPEN) {
-      this.ws.send(JSON.stringify(message));
+      const data = JSON.stringify(message);
+      this.recordFrame("ws_send", data);
+      this.ws.send(data);
     } else {
       console.error(
         "WebSocket is not open. Current state:",
@@ -187,6 +433,7 @@ class GeminiLiveConnection extends LitElement {
 
   sendSetupMessage() {
     if (this.ws.readyState === WebSocket.OPEN) {
+      this.recordFrame("ws_send", this.api_config);
       this.ws.send(this.api_config);
     } else {
       console.error("Connection not ready.");
@@ -255,6 +502,45 @@ class GeminiLiveConnection extends LitElement {
     this.sendMessage(toolResponse);
   }
 
+  startRecording() {
+    if (this.recordingFlushInterval) {
+      return;
+    }
+    this.recordingFlushInterval = setInterval(
+      () => this.flushRecording(),
+      RECORDING_FLUSH_INTERVAL_MS
+    );
+  }
+
+  stopRecording() {
+    if (this.recordingFlushInterval) {
+      clearInterval(this.recordingFlushInterval);
+      this.recordingFlushInterval = null;
+    }
+    this.flushRecording();
+  }
+
+  recordFrame(type, data) {
+    if (this.recordingFlushInterval) {
+      this.recordedFrames.push({ type, time: Date.now(), data });
+    }
+  }
+
+  flushRecording() {
+    if (!this.recording_endpoint || this.recordedFrames.length === 0) {
+      return;
+    }
+    const frames = this.recordedFrames;
+    this.recordedFrames = [];
+    fetch(this.recording_endpoint, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(frames),
+    }).catch((error) => {
+      console.error("Error sending recording:", error);
+    });
+  }
+
   async ensureConnected() {
     if (this.ws.readyState === WebSocket.OPEN) {
       return;
@@ -1,4 +1,6 @@
 from typing import Any, Callable
+import os
+import urllib.parse
 
 import mesop.labs as mel
 
@@ -7,6 +9,10 @@ _HOST = "generativelanguage.googleapis.com"
 
 _GEMINI_BIDI_WEBSOCKET_URI = "wss://{host}/ws/google.ai.generativelanguage.v1alpha.GenerativeService.BidiGenerateContent?key={api_key}"
 
+# Overrides the websocket endpoint, such as to use the stand-in server from
+# `scripts/replay_session.py`.
+_ENDPOINT_OVERRIDE = os.getenv("GEMINI_LIVE_API_ENDPOINT", "")
+
 
 @mel.web_component(path="./gemini_live_connection.js")
 def gemini_live_connection(
@@ -14,12 +20,42 @@ def gemini_live_connection(
   enabled: bool = False,
   api_key: str = "",
   api_config: str = "",
+  endpoint: str = "",
+  clue_audio_cached: bool = False,
+  prewarm: bool = False,
+  prewarm_idle_timeout_seconds: float = 60,
   on_start: Callable[[mel.WebEvent], Any] | None = None,
   on_stop: Callable[[mel.WebEvent], Any] | None = None,
   on_tool_call: Callable[[mel.WebEvent], Any] | None = None,
   tool_call_responses: str = "",
   text_input: str = "",
+  telemetry_endpoint: str = "",
+  recording_endpoint: str = "",
 ):
+  """Connects to the Gemini Live API.
+
+  If `endpoint` is set, the component connects to it instead of the Gemini Live API, such
+  as to connect through `gemini_live_relay`. The API key is not needed then.
+
+  If `prewarm` is set, the connection is opened and set up in the background before the
+  game is started, and closed if the game is not started within
+  `prewarm_idle_timeout_seconds`. Each prewarmed connection holds a Gemini Live API
+  session open.
+
+  When `api_config` changes while connected, such as when switching the host between
+  audio and text responses, the component reconnects with the new setup. Text responses
+  are streamed to the `host_transcript` web component.
+
+  `clue_audio_cached` applies to the host's turn after `tool_call_responses` is sent. If
+  the clue audio was cached, the host's audio is not played, since the cached audio
+  already was. See `clue_audio_cache`.
+
+  If `telemetry_endpoint` is set, client performance telemetry from the web components is
+  sent to that endpoint in batches.
+
+  If `recording_endpoint` is set, the websocket traffic is sent to that endpoint in
+  batches so the session can be replayed. See `session_recorder`.
+  """
   return mel.insert_web_component(
     name="gemini-live-connection",
     events=_filter_events(
@@ -31,13 +67,31 @@ def gemini_live_connection(
     ),
     properties={
       "api_config": api_config,
+      "clue_audio_cached": clue_audio_cached,
       "enabled": enabled,
-      "endpoint": _GEMINI_BIDI_WEBSOCKET_URI.format(host=_HOST, api_key=api_key),
+      "endpoint": endpoint or gemini_live_endpoint(api_key),
+      "prewarm": prewarm,
+      "prewarm_idle_timeout_ms": int(prewarm_idle_timeout_seconds * 1000),
+      "recording_endpoint": recording_endpoint,
+      "telemetry_endpoint": telemetry_endpoint,
       "tool_call_responses": tool_call_responses,
       "text_input": text_input,
     },
   )
 
 
+def gemini_live_endpoint(api_key: str) -> str:
+  """Websocket URL of the Gemini Live API, or of the stand-in server if overridden."""
+  return _ENDPOINT_OVERRIDE or _GEMINI_BIDI_WEBSOCKET_URI.format(host=_HOST, api_key=api_key)
+
+
+def gemini_live_connect_src() -> str:
+  """Origin of the websocket endpoint for the page security policy."""
+  if _ENDPOINT_OVERRIDE:
+    url = urllib.parse.urlsplit(_ENDPOINT_OVERRIDE)
+    return f"{url.scheme}://{url.netloc}"
+  return f"wss://{_HOST}"
+
+
 def _filter_events(events: dict[str, Callable[[mel.WebEvent], Any] | None]):
   return {event: callback for event, callback in events.items() if callback}
@@ -0,0 +1,67 @@
+import {
+  LitElement,
+  html,
+  css,
+} from "https://cdn.jsdelivr.net/gh/lit/dist@3/core/lit-core.min.js";
+
+class HostTranscript extends LitElement {
+  static properties = {
+    placeholder: { type: String },
+    text: { state: true },
+  };
+
+  static styles = css`
+    .placeholder {
+      font-style: italic;
+    }
+  `;
+
+  constructor() {
+    super();
+    this.placeholder = "";
+    this.text = "";
+    this.turnComplete = false;
+
+    this.onTextOutputReceived = (e) => {
+      if (this.turnComplete) {
+        this.text = "";
+        this.turnComplete = false;
+      }
+      this.text += e.detail.text;
+    };
+
+    this.onTextOutputTurnComplete = () => {
+      this.turnComplete = true;
+    };
+  }
+
+  connectedCallback() {
+    super.connectedCallback();
+    window.addEventListener("text-output-received", this.onTextOutputReceived);
+    window.addEventListener(
+      "text-output-turn-complete",
+      this.onTextOutputTurnComplete
+    );
+  }
+
+  disconnectedCallback() {
+    super.disconnectedCallback();
+    window.removeEventListener(
+      "text-output-received",
+      this.onTextOutputReceived
+    );
+    window.removeEventListener(
+      "text-output-turn-complete",
+      this.onTextOutputTurnComplete
+    );
+  }
+
+  render() {
+    if (!this.text) {
+      return html`<span class="placeholder">${this.placeholder}</span>`;
+    }
+    return html`<span>${this.text}</span>`;
+  }
+}
+
+customElements.define("host-transcript", HostTranscript);
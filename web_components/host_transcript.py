@@ -0,0 +1,17 @@
+import mesop.labs as mel
+
+
+@mel.web_component(path="./host_transcript.js")
+def host_transcript(*, placeholder: str = ""):
+  """Shows the text of the host's current turn when the host responds with text.
+
+  The text is streamed from the `gemini_live_connection` web component in the browser,
+  so it does not go through the Mesop server. The text of a turn is replaced when the
+  host's next turn starts.
+  """
+  return mel.insert_web_component(
+    name="host-transcript",
+    properties={
+      "placeholder": placeholder,
+    },
+  )
@@ -0,0 +1,117 @@
+// Client performance telemetry shared by the web components.
+//
+// Components record counters and observations into the shared collector, which only
+// updates in-memory aggregates. Timings and values are bucketed on the client, so a
+// batch is small no matter how many frames were processed. Batches are sent to the
+// server with `navigator.sendBeacon` once reporting has been started.
+//
+// The bucket bounds must match `_CLIENT_DURATION_BUCKETS_MS` and
+// `_CLIENT_VALUE_BUCKETS` in `metrics.py`.
+
+const DURATION_BUCKETS_MS = [
+  1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000,
+];
+const VALUE_BUCKETS = [0, 1, 2, 4, 8, 16, 32, 64, 128, 256];
+const DEFAULT_FLUSH_INTERVAL_MS = 10000;
+
+class Histogram {
+  constructor(buckets) {
+    this.buckets = buckets;
+    this.bucketCounts = new Array(buckets.length + 1).fill(0);
+    this.sum = 0;
+    this.count = 0;
+  }
+
+  observe(value) {
+    let index = 0;
+    while (index < this.buckets.length && value > this.buckets[index]) {
+      index++;
+    }
+    this.bucketCounts[index]++;
+    this.sum += value;
+    this.count++;
+  }
+
+  toJSON() {
+    return { buckets: this.bucketCounts, sum: this.sum, count: this.count };
+  }
+}
+
+class Telemetry {
+  constructor() {
+    this.endpoint = "";
+    this.flushInterval = null;
+    this.reset();
+
+    this.onPageHide = () => {
+      this.flush();
+    };
+  }
+
+  reset() {
+    this.counters = {};
+    this.durations = {};
+    this.values = {};
+    this.isEmpty = true;
+  }
+
+  start(endpoint, flushIntervalMs = DEFAULT_FLUSH_INTERVAL_MS) {
+    if (this.endpoint === endpoint) {
+      return;
+    }
+    this.stop();
+    this.endpoint = endpoint;
+    this.flushInterval = setInterval(() => this.flush(), flushIntervalMs);
+    window.addEventListener("pagehide", this.onPageHide);
+  }
+
+  stop() {
+    if (this.flushInterval) {
+      clearInterval(this.flushInterval);
+      this.flushInterval = null;
+    }
+    window.removeEventListener("pagehide", this.onPageHide);
+    this.endpoint = "";
+  }
+
+  count(name, amount = 1) {
+    this.counters[name] = (this.counters[name] || 0) + amount;
+    this.isEmpty = false;
+  }
+
+  // Records a duration in milliseconds.
+  duration(name, milliseconds) {
+    if (!this.durations[name]) {
+      this.durations[name] = new Histogram(DURATION_BUCKETS_MS);
+    }
+    this.durations[name].observe(milliseconds);
+    this.isEmpty = false;
+  }
+
+  // Records a sampled value, such as a queue depth.
+  value(name, value) {
+    if (!this.values[name]) {
+      this.values[name] = new Histogram(VALUE_BUCKETS);
+    }
+    this.values[name].observe(value);
+    this.isEmpty = false;
+  }
+
+  flush() {
+    if (!this.endpoint || this.isEmpty) {
+      return;
+    }
+    const batch = JSON.stringify({
+      counters: this.counters,
+      durations: this.durations,
+      values: this.values,
+    });
+    this.reset();
+    navigator.sendBeacon(
+      this.endpoint,
+      new Blob([batch], { type: "application/json" })
+    );
+  }
+}
+
+export const telemetry = new Telemetry();